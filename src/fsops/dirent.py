@@ -12,7 +12,6 @@ from src.libwolfs.util import Col
 from src.libwolfs.fileInfo import FileInfo, DirInfo
 from typing import Final, Union, cast
 from src.remote import RemoteNode  # type: ignore
-from pathlib import Path
 
 class DirentOps(LinkOps):
 	# used to temporarily store directory entries while a readdir call is performed
@@ -38,10 +37,10 @@ class DirentOps(LinkOps):
 		#	4. update DirInfo of inode_p & new inode, track...
 		#	5. log to journal and sync later (assumption): no one modifies the directory on the backend
 		#	6. done
-		def validity_check() -> None:
+		async def validity_check() -> None:
 			# abort if directory already exists (we have to check this virtually
 			# as Path.exists() might say no although it already exists in the src )
-			if self.disk.path_to_ino(cpath) == inode_p:
+			if cast(DirInfo, self.vfs.inode_path_map[inode_p]).children.get(fsdecode(name)) is not None:
 				log.warning(f"Tried to make a directory that already exists:"
 							f"  mkdir({parent_path},{name},{hex(mode)})")
 				raise FUSEError(errno.EEXIST)
@@ -57,7 +56,7 @@ class DirentOps(LinkOps):
 				return
 			elif not cache_ok and src_ok:
 				self.remote.makeAvailable()
-				self.journal.flushCompleteJournal()
+				await self.writeback.flush()
 			else:
 				raise FUSEError(errno.ENOSPC)
 
@@ -68,7 +67,7 @@ class DirentOps(LinkOps):
 		cpath = os.path.join(parent_path, fsdecode(name))
 
 		# 2. check if enough disk space
-		validity_check()
+		await validity_check()
 
 		try:
 			# 3. try to mkdir
@@ -127,13 +126,14 @@ class DirentOps(LinkOps):
 			pass
 			#if self.disk.isInBackend(inode):
 
+		cast(DirInfo, self.vfs.inode_path_map[inode_p]).children.pop(fsdecode(name))
 		self.journal.log_rmdir(inode_p, inode, cpath)
 		if self.vfs.inLookupCnt(inode):
 			self._forget_path(inode, cpath)
 
 	async def opendir(self, inode: int, ctx: pyfuse3.RequestContext) -> int:
 		dirent: DirInfo = cast(DirInfo, self.vfs.inode_path_map[inode])
-		log.info(f"{Col.path(self.disk.ino_toTmp(inode))} contains: {Col(dirent.children)}")
+		log.info(f"{Col.path(self.disk.ino_toTmp(inode))} contains: {Col(list(dirent.children))}")
 		# ctx contains gid, uid, pid and umask
 		return inode
 
@@ -144,12 +144,12 @@ class DirentOps(LinkOps):
 			dirent = self.vfs.inode_path_map[inode]
 			if isinstance(dirent, DirInfo):
 				childs = dirent.children
-				log.debug(f'searching through {Col(childs)}')
-				for child_inode in childs:
+				log.debug(f'searching through {Col(list(childs))}')
+				# names come straight from the directory index (in insertion order)
+				for name, child_inode in childs.items():
 					try:
 						info: Union[FileInfo, DirInfo] = self.vfs.inode_path_map[child_inode]
-						cache_path: Path = self.disk.ino_toTmp(child_inode)
-						entries.append((child_inode, cache_path.name, info.entry))  # type: ignore
+						entries.append((child_inode, name, info.entry))  # type: ignore
 					except KeyError:
 						# TODO: ignore missing symlinks for now
 						log.error(f'{Col.BR}Ignored FileInfo of {Col.BG}{child_inode}')
@@ -158,7 +158,7 @@ class DirentOps(LinkOps):
 				log.debug(f"{dirent} is of type FileInfo -> readdir_reply call")
 				entries = ()
 
-			return sorted(entries) if len(entries) > 0 else None
+			return entries if len(entries) > 0 else None
 
 		if off == 0:
 			path = self.disk.ino_toTmp(inode)
@@ -10,6 +10,7 @@ from IPython import embed
 
 embed = embed
 
+import math
 import os
 from src.remote import RemoteNode # type: ignore
 import faulthandler
@@ -23,11 +24,19 @@ log = getLogger(__name__)
 
 from src.libwolfs.util import Col, MaxPrioQueue
 from src.fsops.vfsops import VFSOps
-from src.libwolfs.fileInfo import FileInfo, DirInfo
+from src.libwolfs.fileInfo import FileInfo
 from src.libwolfs.errors import NotEnoughSpaceError
 from src.libwolfs.translator import MountFSDirectoryInfo
+from src.libwolfs.policy import DEFAULT_ADMISSION, DEFAULT_POLICY
+from src.libwolfs.fetcher import FetchEngine
+from src.libwolfs.streamer import Streamer
+from src.libwolfs.warmup import TokenBucket, WarmupProgress
+from src.libwolfs.wal import WriteAheadLog
+from src.libwolfs.writeback import Writeback
 import pickle
-from typing import Any, Final, cast
+import trio
+from pyfuse3 import FUSEError
+from typing import Any, Final, Optional, cast
 from src.fsops.dirent import DirentOps
 
 def save_obj(obj: Any, name: Path) -> None:
@@ -44,12 +53,24 @@ class Wolfs(DirentOps):
 	enable_writeback_cache: Final[bool] = True
 	enable_acl: Final[bool] = True
 	__metadb: Path
+	__WARMUP_BACKOFF: Final[float] = 0.1  # seconds
 
 	def __init__(self, node: RemoteNode,
 				 mount_info: MountFSDirectoryInfo, metadb: str = '', logFile: Path = Path(VFSOps._STDOUT),
-				 noatime: bool = True, maxCacheSizeMB: int = VFSOps._DEFAULT_CACHE_SIZE):
-		super().__init__(node, mount_info, Path(logFile), maxCacheSizeMB, noatime)
+				 noatime: bool = True, maxCacheSizeMB: int = VFSOps._DEFAULT_CACHE_SIZE, policy: str = DEFAULT_POLICY,
+				 highWatermark: float = VFSOps._DEFAULT_HIGH_WATERMARK,
+				 lowWatermark: float = VFSOps._DEFAULT_LOW_WATERMARK, chunkSizeKB: int = 0,
+				 fetchWorkers: int = FetchEngine.DEFAULT_WORKERS, warmupRateMB: float = 0,
+				 admission: str = DEFAULT_ADMISSION, maxFileSizeMB: int = 0,
+				 memorySizeMB: int = VFSOps._DEFAULT_MEMORY_SIZE, tier2Dir: str = '', tier2SizeMB: int = 0,
+				 ttl: float = math.inf, journalSyncInterval: float = WriteAheadLog.DEFAULT_SYNC_INTERVAL,
+				 writebackAge: float = Writeback.MAX_AGE, writebackDirtyMB: int = Writeback.MAX_DIRTY_MB):
+		""":param warmupRateMB: bandwidth cap of the warmup in MB/s, 0 means unlimited"""
+		super().__init__(node, mount_info, Path(logFile), maxCacheSizeMB, noatime, policy, highWatermark, lowWatermark,
+						 chunkSizeKB, fetchWorkers, admission, maxFileSizeMB, memorySizeMB, tier2Dir, tier2SizeMB, ttl,
+						 journalSyncInterval, writebackAge, writebackDirtyMB)
 		self.__metadb = Path(metadb)
+		self.warmupRate: float = warmupRateMB * 1024 * 1024
 		# todo / idea:
 		#  - we could use the XDG / freedesktop spec for a the file location of the meta file (~/.config/wolfs/metaFile.db)
 		#  - maybe use same location for config options later on idk (~/.config/wolfs/config.ini)
@@ -69,8 +90,12 @@ class Wolfs(DirentOps):
 		#	print(f'File not found {metadb}')
 		# except EOFError:
 		#	# file was corrupted in last run
-		transfer_q = self.populate_inode_maps(self.disk.sourceDir)
-		self.copyRecentFilesIntoCache(transfer_q)
+		# whatever an unclean shutdown didn't write back goes to the source before it is indexed
+		self.journal.recover()
+		# the cache is warmed up in the background once mounted (see start_background_tasks)
+		self.__transfer_q: MaxPrioQueue = self.populate_inode_maps(self.disk.sourceDir)
+		# whatever the last run left in the cache doesn't have to be warmed up again
+		self.adoptCache()
 
 	def populate_inode_maps(self, root: Path) -> MaxPrioQueue:
 		"""
@@ -88,7 +113,7 @@ class Wolfs(DirentOps):
 
 		transfer_q = MaxPrioQueue()
 
-		def push_to_queue(ino: int, dir_attrs: pyfuse3.EntryAttributes) -> None:
+		def push_to_queue(ino: int, dir_attrs: pyfuse3.EntryAttributes | FileInfo) -> None:
 			last_used = getattr(dir_attrs, self.disk.time_attr) // self.disk.__NANOSEC_PER_SEC__
 			transfer_q.push_nowait((last_used, (ino, dir_attrs.st_size)))
 
@@ -110,14 +135,14 @@ class Wolfs(DirentOps):
 			# filter out softlinks and prepare to absolute paths
 			abs_dirnames = list(filter(lambda x: not islink(x), map(lambda p: os.path.join(dirpath, p), dirnames)))
 			abs_filenames = list(filter(lambda x: not islink(x), map(lambda p: os.path.join(dirpath, p), filenames)))
-			subdir_inos = list(map(lambda p: self.disk.path_to_ino(p), abs_dirnames))
+			subdirs = [(os.path.basename(p), self.disk.path_to_ino(p)) for p in abs_dirnames]
 
 			# TODO:
 			#   uhhh ich denk wir haben immernoch das problem das die einträge doppelt sind bei Ordnern bei Dateien ist es nicht so
 			#   gut is das wir n indirekten zugang zu der add_Directory haben könnte man eigentlich auch für Filepath und add_path verwenden
 			#   um die eigentliche funktion kurz zu halten aber die konstistenz checks vollständig zu haben
 			self.add_Directory(dirpath)
-			self.add_subDirectories(subdir_inos, inode_p=dir_inode)
+			self.add_subDirectories(subdirs, inode_p=dir_inode)
 			push_to_queue(dir_inode, dir_attrs)
 
 			return dir_inode, abs_filenames
@@ -129,38 +154,47 @@ class Wolfs(DirentOps):
 			dir_inode, filenames = add_subdirectories(dirpath, dirnames, filenames)
 
 			for f in filenames:
-				file_attrs = FileInfo.getattr(path=f)
+				# plain record, EntryAttributes are only built once the kernel asks for them
 				st_ino = self.disk.path_to_ino(f)
-				file_attrs.st_ino = st_ino
+				file_attrs = FileInfo.from_path(f, st_ino)
 				push_to_queue(st_ino, file_attrs)
 
 				self.vfs.add_Child(dir_inode, st_ino, f, file_attrs)
 				i = print_progress(i, 'add_path', st_ino, f)
 			i = print_progress(i, 'add_Directory', dir_inode, dirpath)
 
-		# remove doubly added root inode, do it here as the internal add function would need another if then
-		self.vfs.inode_path_map[self.disk.ROOT_INODE].children.remove(self.disk.ROOT_INODE)
-
 		for k, v in self.vfs.inode_path_map.items():
-			assert k == v.entry.st_ino
-			if isinstance(v, DirInfo):
-				self.vfs.inode_path_map[k] = DirInfo(v.entry, sorted(v.children))
+			assert k == v.st_ino
 
 		return transfer_q
 
-	def copyRecentFilesIntoCache(self, transfer_q: MaxPrioQueue) -> None:
-		print(f'{Col.B}Transfering files...{Col.END}')
-		while not transfer_q.empty() and not self.disk.isFull(use_threshold=True):
+	def start_background_tasks(self, nursery: trio.Nursery) -> None:
+		nursery.start_soon(self.warmupCache, self.__transfer_q)
+
+	async def warmupCache(self, transfer_q: MaxPrioQueue) -> None:
+		"""
+		Copies the most recently used files into the cache after mounting, one file at a time and at most
+		`warmupRate` bytes per second. Fetches of open() go first
+		"""
+		bucket = TokenBucket(self.warmupRate)
+		target = int(self.disk.lowWatermark * self.disk.capacity) - self.disk._current_CacheSize
+		progress = WarmupProgress(max(0, min(target, sum(size for _, (_, size) in transfer_q.queue))))
+		log.info(f'{Col.B}Warming up the cache...{Col.END}')
+		# stop at the low watermark so the evictor doesn't start right away
+		while not transfer_q.empty() and self.disk.usage() < self.disk.lowWatermark:
 			timestamp, (inode, file_size) = transfer_q.pop_nowait()
-			ino: FileInfo = self.vfs.inode_path_map[inode].entry.st_ino
-			info_rpath = self.disk.ino_to_rpath(ino)
-			info_src = self.disk.toSrc(info_rpath)
+			info: Optional[FileInfo] = self.vfs.inode_path_map.get(inode)
+			if info is None:
+				continue  # deleted since the mount
+			ino: int = info.st_ino
+			info_src = self.disk.toSrc(self.disk.ino_to_rpath(ino))
 			# skip symbolic links for now
 			if os.path.islink(info_src):
 				continue
 
+			await self.__yieldToForeground()
 			try:
-				self.disk.cp2Cache(info_src)
+				progress.add(await self.__warmupFile(ino, info_src, file_size, bucket))
 			except NotEnoughSpaceError:
 				# filter the Queue
 				purged_list = MaxPrioQueue()
@@ -169,11 +203,48 @@ class Wolfs(DirentOps):
 					if size_i < file_size:
 						purged_list.push_nowait((timestamp_i, (inode_i, size_i)))
 				transfer_q = purged_list
-
-		print(f'{Col.BW}Finished transfering. {self.disk.getSummary()}')
+			except (OSError, FUSEError) as exc:
+				log.warning(f'Warmup skips {Col(info_src)}: {exc}')
+
+		log.info(progress)
+		log.info(f'{Col.BW}Finished warmup. {self.disk.getSummary()}')
+
+	async def __yieldToForeground(self) -> None:
+		while self.fetcher.queue_depth:
+			await trio.sleep(Wolfs.__WARMUP_BACKOFF)
+
+	async def __warmupFile(self, ino: int, src: Path, file_size: int, bucket: TokenBucket) -> int:
+		""":returns: bytes copied into the cache"""
+		cpath: Path = self.disk.ino_toTmp(ino)
+		if cpath.exists() or ino in self.fetcher or self.streamer.is_streaming(ino) or self.evictor.is_evicting(ino):
+			return 0  # cached (or being cached) by now
+		if ino in self.uncached or self.vfs._inode_fd_map.get(ino) in self.passthrough:
+			return 0  # served from the source
+		if src.is_dir():
+			self.disk.cp2Cache(src)
+			return 0
+
+		if not self.disk.chunkSize:
+			dest = self.disk.prepare_stream(src, force=False)
+			stream = self.streamer.start(ino, src, dest, throttle=bucket.consume)
+			await self.streamer.settle(ino)
+			if stream.error is not None:
+				raise stream.error
+			return stream.watermark
+
+		if not self.disk.canStore(file_size):
+			raise NotEnoughSpaceError('Not enough space')
+		self.disk.prepare_sparse(ino, file_size)
+		for offset in range(0, file_size, Streamer.PIECE_SIZE):
+			await bucket.consume(min(Streamer.PIECE_SIZE, file_size - offset))
+			await self.__yieldToForeground()
+			await self.fetchRange(ino, offset, Streamer.PIECE_SIZE)
+		self.disk.flush_block_map(ino)
+		return file_size
 
 	def save_internal_state(self) -> None:
 		save_obj(self.vfs.inode_path_map, self.__metadb)
+		self.saveCacheManifest()
 
 	def load_internal_state(self, metadb: Path) -> None:
 		# load inodes_path_map from meta-data file
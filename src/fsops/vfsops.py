@@ -10,18 +10,35 @@ import pyfuse3
 from pyfuse3 import ROOT_INODE as FUSE_ROOT_INODE
 
 import errno
+import fcntl
+import math
+import trio
 from pyfuse3 import FUSEError
 from os import fsdecode
 from src.libwolfs.disk import Disk
 from src.libwolfs.translator import DiskBase, MountFSDirectoryInfo
 from src.libwolfs.util import Col
 from src.libwolfs.vfs import VFS
-from src.libwolfs.fileInfo import FileInfo, DirInfo
+from src.libwolfs.fileInfo import FileInfo, DirInfo, DirEntries
 from pathlib import Path
 from typing import Final, cast, Optional
 import re
 from src.remote import RemoteNode  # type: ignore
 from src.libwolfs.journal import Journal
+from src.libwolfs.policy import DEFAULT_ADMISSION, DEFAULT_POLICY, make_admission
+from src.libwolfs.evictor import Evictor
+from src.libwolfs.streamer import Streamer
+from src.libwolfs.fetcher import FetchEngine
+from src.libwolfs.cache import BusyKeys
+from src.libwolfs.pins import Pins
+from src.libwolfs.passthrough import SourceFds, pread, pwrite
+from src.libwolfs.memtier import MemoryTier
+from src.libwolfs.tier2 import SecondTier
+from src.libwolfs.freshness import Freshness, StatBatcher
+from src.libwolfs.wal import WriteAheadLog
+from src.libwolfs.writeback import Writeback
+from src.libwolfs.blockmap import BlockMap
+from src.libwolfs.copyengine import copy_range
 from src.libwolfs.util import CallStackAware
 
 import logging
@@ -35,22 +52,113 @@ log = logging.getLogger(__name__)
 
 class VFSOps(pyfuse3.Operations, CallStackAware):
 	_DEFAULT_CACHE_SIZE: Final[int] = 512
+	_DEFAULT_HIGH_WATERMARK: Final[float] = 0.9
+	_DEFAULT_LOW_WATERMARK: Final[float] = 0.8
+	_DEFAULT_MEMORY_SIZE: Final[int] = 32
 	_STDOUT: Final[str] = "/dev/stdout"
 
 	def __init__(self, node: RemoteNode, mount_info: MountFSDirectoryInfo,
-				 logFile: Path = "", maxCacheSizeMB: int = _DEFAULT_CACHE_SIZE, noatime: bool = True):
+				 logFile: Path = "", maxCacheSizeMB: int = _DEFAULT_CACHE_SIZE, noatime: bool = True,
+				 policy: str = DEFAULT_POLICY,
+				 highWatermark: float = _DEFAULT_HIGH_WATERMARK, lowWatermark: float = _DEFAULT_LOW_WATERMARK,
+				 chunkSizeKB: int = 0, fetchWorkers: int = FetchEngine.DEFAULT_WORKERS,
+				 admission: str = DEFAULT_ADMISSION, maxFileSizeMB: int = 0,
+				 memorySizeMB: int = _DEFAULT_MEMORY_SIZE, tier2Dir: str = '', tier2SizeMB: int = 0,
+				 ttl: float = math.inf, journalSyncInterval: float = WriteAheadLog.DEFAULT_SYNC_INTERVAL,
+				 writebackAge: float = Writeback.MAX_AGE, writebackDirtyMB: int = Writeback.MAX_DIRTY_MB):
+		"""
+		:param chunkSizeKB: cache files in chunks of this size as they are read, 0 caches whole files on open
+		:param fetchWorkers: number of copies from the source running at the same time
+		:param admission: filter deciding which files opened for reading are worth displacing cached ones
+		:param maxFileSizeMB: bigger files are never cached but read and written on the source directly,
+		  0 only bypasses the files which don't fit into the cache at all
+		:param memorySizeMB: RAM for hot small files and blocks above the cache directory, 0 disables it
+		:param tier2Dir: second cache directory evicted files are demoted to (none if empty)
+		:param tier2SizeMB: its budget, 0 takes what is free on its filesystem
+		:param ttl: seconds a cached file is trusted before an open compares it with its source again (inf: never)
+		:param journalSyncInterval: seconds the journal entries of concurrent ops wait for one fdatasync of `logFile`
+		:param writebackAge: seconds changes may wait in the cache before they are written back to the source
+		:param writebackDirtyMB: unwritten Megabytes which start a writeback regardless of their age
+		"""
 		super().__init__()
-		self.disk = Disk(mount_info, maxCacheSizeMB, noatime)
+		self.disk = Disk(mount_info, maxCacheSizeMB, noatime, cacheThreshold=highWatermark, policy=policy,
+						 lowWatermark=lowWatermark, chunkSize=chunkSizeKB * 1024)
 		self.vfs = VFS(mount_info)
-		self.journal = Journal(self.disk, self.vfs, logFile)
+		self.journal = Journal(self.disk, self.vfs, logFile, journalSyncInterval)
 		self.remote = node
+		self.evictor = Evictor(self.disk, self.busy_inodes,
+							   lambda ino: isinstance(self.vfs.inode_path_map.get(ino), DirInfo))
+		self.fetcher = FetchEngine(fetchWorkers)
+		self.writeback = Writeback(self.journal, self.sourceAvailable, lambda: self.fetcher.queue_depth,
+								   self.fetcher.limiter, writebackAge, writebackDirtyMB)
+		self.streamer = Streamer(self.disk, self.fetcher.limiter)
+		self.pins = Pins(self.disk)
+		self.admission = make_admission(admission, self.disk.maxCacheSize)
+		self.maxFileSize: int = maxFileSizeMB * 1024 * 1024
+		# files/directories the user marked uncached (user.wolfs.uncached), looked up along the path like pins
+		self.uncached = Pins(self.disk)
+		# fds of files which are read and written on the source directly (see usePassthrough)
+		self.passthrough: set[int] = set()
+		self.sourceFds = SourceFds()
+		self.memory = MemoryTier(memorySizeMB * 1024 * 1024)
+		if tier2Dir:
+			self.disk.tier2 = SecondTier(tier2Dir, tier2SizeMB, policy)
+		self.freshness = Freshness(self.disk, ttl)
+		self.stats = StatBatcher()
+		self.refetched: int = 0
+
+	async def main(self) -> None:
+		"""pyfuse3 main loop next to the background tasks of wolfs"""
+		async with trio.open_nursery() as nursery:
+			await nursery.start(self.evictor.run)
+			await nursery.start(self.streamer.run)
+			await nursery.start(self.stats.run)
+			if self.journal.wal is not None:
+				await nursery.start(self.journal.wal.run)
+			await nursery.start(self.writeback.run)
+			self.start_background_tasks(nursery)
+			await pyfuse3.main()
+			nursery.cancel_scope.cancel()
+		self.sourceFds.close_all()
+		if self.journal.wal is not None:
+			self.journal.wal.sync()
+
+	def start_background_tasks(self, nursery: trio.Nursery) -> None:
+		"""hook for more tasks next to the filesystem, evictor and streamer are running already"""
+
+	def adoptCache(self) -> None:
+		"""Reuses what an earlier run left in the cache, call once the source is indexed"""
+		def source_attrs(ino: int) -> Optional[tuple[int, int]]:
+			info: Optional[FileInfo] = self.vfs.inode_path_map.get(ino)
+			return None if info is None else (info.st_size, info.st_mtime_ns)
+		self.disk.adopt_manifest(source_attrs)
+
+	def saveCacheManifest(self) -> None:
+		"""Syncs the journal so every cached file matches its source, then remembers what is cached"""
+		self.journal.flushCompleteJournal()
+		self.disk.save_manifest()
+
+	def sourceAvailable(self) -> bool:
+		return self.remote.isMounted() and self.disk.sourceDir.is_dir()
+
+	def busy_inodes(self) -> BusyKeys:
+		"""
+		open, dirty or still streamed files can't be evicted, chunks only if they are dirty (clean ones can be re-fetched).
+		Whatever is being fetched right now or was pinned by the user can't go either
+		"""
+		dirty: set[int] = self.journal.dirtyInodes()
+		busy = BusyKeys(dirty.union(self.vfs._inode_fd_map, self.streamer.streaming), dirty, self.pins)
+		for key in self.fetcher.keys:
+			busy.add(key)
+		return busy
 
 	# path methods
 	# ============
-	def add_subDirectories(self, child_inodes: list[int],
+	def add_subDirectories(self, children: list[tuple[str, int]],
 		inode_p: int = 0, wolfs_inode_path: str = "") -> DirInfo:
+		""":param children: (name, ino) pairs of the subdirectories"""
 		assert inode_p >= 0\
-			or (wolfs_inode_path != "" and self.disk.toRoot(wolfs_inode_path) in self.disk._InodeTranslator__path_ino_map)
+			or (wolfs_inode_path != "" and self.disk.lookup_ino(wolfs_inode_path) is not None)
 
 		if inode_p > 0:
 			# TODO: path_to_ino -> inode_to_cpath should be in the same class as they are interchangeable
@@ -60,22 +168,20 @@ class VFSOps(pyfuse3.Operations, CallStackAware):
 			inode_p = self.disk.path_to_ino(wolfs_inode_path)
 			assert inode_p == self.disk.ino_toTmp(inode_p)
 
-		assert inode_p not in child_inodes
+		assert inode_p not in (ino for _, ino in children)
 		assert inode_p in self.vfs.inode_path_map
 
 		# both should be consitent from here on
 		directory: DirInfo = self.vfs.inode_path_map[inode_p]
-		assert child_inodes not in directory.children
-		directory.children += child_inodes
+		for name, ino in children:
+			directory.children.add(name, ino)
 		return directory
 
 	def add_Directory(self, path: str) -> DirInfo:
 		wolfs_inode: int = self.disk.path_to_ino(path)
 
-		# get inode info about parent
-
-		inode_p_path = self.disk.getParent(path)
-		inode_p = self.disk.path_to_ino(inode_p_path)
+		# get inode info about parent (pointer hop in the translators path index)
+		inode_p = self.disk.ino_parent(wolfs_inode)
 
 		entry = FileInfo.getattr(path=path)
 		entry.st_ino = wolfs_inode
@@ -85,35 +191,276 @@ class VFSOps(pyfuse3.Operations, CallStackAware):
 			or wolfs_inode == DiskBase.ROOT_INODE  # exception so that '/' redirects to itself
 		assert entry.st_ino == wolfs_inode
 		assert Path(path).is_dir()
-		assert self.disk.path_to_ino(inode_p_path) == inode_p
+		assert self.disk.lookup_ino(self.disk.getParent(path)) == inode_p
 
 		return self.vfs._add_Directory(inode_p, wolfs_inode, path, entry)
 
-	def __fetchFile(self, f: Path, size: int) -> None:
+	async def __fetchFile(self, inode: int, f: Path, size: int) -> None:
 		"""
-		Discards one or multiple files to make space for `f`
-		Strategry used is to discard the Least recently used files
+		Discards one or multiple files to make space for `f` and copies it in a worker
+		Which files are discarded is up to the eviction policy of the disk
 		:raise pyfuse3.FUSEError  with errno set to according error
 		"""
-		assert not os.path.islink(f), SOFTLINK_DISABLED_ERROR
+		self.__admit(inode, f, size)
+		# usually the evictor already made room, evicting inline is the fallback
+		dest = self.disk.prepare_stream(f, busy_inos=self.busy_inodes())
+		self.evictor.wakeup()
+		try:
+			await self.fetcher.run_sync(Disk.fill, f, dest)
+		except OSError as exc:
+			log.error(f'Could not copy {Col(f)}: {exc}')
+			self.disk.drop_partial(dest)
+			raise FUSEError(exc.errno)
+		self.disk.recharge(inode)
+
+	def __streamFile(self, inode: int, f: Path, size: int) -> None:
+		"""Reserves the space for `f` and copies it in the background"""
+		self.__admit(inode, f, size)
+		dest = self.disk.prepare_stream(f, busy_inos=self.busy_inodes())
+		self.streamer.start(inode, f, dest)
+		self.evictor.wakeup()
 
-		# in case the file is bigger than the whole cache size (likely on small cache sizes)
+	def usePassthrough(self, inode: int, info: FileInfo, flags: int) -> bool:
+		"""
+		Files which can't or shouldn't be cached are read and written on the source directly: files too big for
+		the cache, the ones marked uncached and (read only opens) the ones the admission filter rejected
+		"""
+		if isinstance(info, DirInfo) or inode in self.pins or self.journal.isDirty(inode):
+			return False
+		if self.disk.ino_toTmp(inode).exists() or inode in self.fetcher or self.streamer.is_streaming(inode):
+			return False  # serve what is cached already
+		if self.disk.tier2 is not None and self.disk.ino_to_rpath(inode) in self.disk.tier2:
+			return False  # coming back from the second tier is cheap
+		if inode in self.uncached or self.tooBig(inode, info.st_size):
+			return True
+		return flags & os.O_ACCMODE == os.O_RDONLY and not self.worthCaching(inode, info)
+
+	def tooBig(self, inode: int, size: int) -> bool:
+		if self.maxFileSize and size > self.maxFileSize:
+			return True
+		# chunked mode caches the parts which are read, the file size doesn't matter there
+		return not self.disk.chunkSize and not self.disk.policy.admit(inode, self.disk.allocated(size))
+
+	def worthCaching(self, inode: int, info: FileInfo) -> bool:
+		"""Admission filter of open(), a one-shot read of a cold file mustn't flush the hot ones"""
+		# chunked mode only caches what is read, the first chunk is what displaces cached ones
+		size: int = self.disk.allocated(self.disk.chunkSize or info.st_size)
+		fits: bool = self.disk.hasRoom(size)
+		victim = None if fits else self.disk.victim(self.busy_inodes())
+		if isinstance(victim, tuple):
+			victim = victim[0]  # popularity is counted per file
+		if self.admission.admit(inode, size, fits, victim):
+			return True
+		log.debug(f'Admission filter rejected {Col(inode)}, reading it from the source')
+		return False
+
+	async def leavePassthrough(self, inode: int, fd: int) -> None:
+		"""Swaps the source file behind `fd` for a cache file (e.g. once `inode` is opened for writing)"""
+		f: Path = await self.fetchFile(inode)
+		self.sourceFds.detach(fd)
+		self.__swapFd(fd, f)
+		self.passthrough.discard(fd)
+
+	async def openPassthrough(self, inode: int, flags: int) -> int:
+		""":returns: a (pooled) fd of the source file of `inode`"""
+		writable: bool = flags & os.O_ACCMODE != os.O_RDONLY
+		src: Path = self.disk.toSrc(self.disk.ino_toTmp(inode))
+		self.remote.makeAvailable()
+		if writable:
+			self.dropDemoted(self.disk.ino_toTmp_str(inode))  # the source is changed behind its back
+		fd: int = self.sourceFds.open(src, writable, truncate=writable and flags & os.O_TRUNC != 0)
+		self.passthrough.add(fd)
+		log.debug(f'Passing {Col(src)} through')
+		return fd
+
+	def reopenPassthrough(self, inode: int, fd: int) -> None:
+		"""A read only passthrough `fd` becomes writable, it isn't shared with other opens from now on"""
+		self.sourceFds.detach(fd)
+		self.__swapFd(fd, self.disk.toSrc(self.disk.ino_toTmp(inode)))
+
+	@staticmethod
+	def __swapFd(fd: int, f: Path) -> None:
+		"""`fd` refers to `f` opened for reading and writing afterwards, the kernel keeps using the same fh"""
+		fd_new = os.open(f, os.O_RDWR)
+		os.dup2(fd_new, fd)
+		os.close(fd_new)
+
+	def __admit(self, inode: int, f: Path, size: int) -> None:
+		assert not os.path.islink(f), SOFTLINK_DISABLED_ERROR
+		# e.g. the file is bigger than the whole cache size (likely on small cache sizes)
 		log.info(f"{Col(f)}")
-		if size > self.disk:
-			log.error('Tried to fetch a file larger than the cache Size Quota')
+		if not self.disk.policy.admit(inode, size):
+			log.error(f'Eviction policy {self.disk.policy.name} refused to cache {Col(f)} ({size} bytes)')
 			raise FUSEError(errno.EDQUOT)
 
-		open_paths, write_ops_reserved_size = self.journal.getDirtyPaths()
-		self.disk.cp2Cache(f, force=True, open_paths=open_paths)
-
-	def fetchFile(self, inode: int) -> Path:
+	async def fetchFile(self, inode: int, stream: bool = False) -> Path:
+		"""
+		Brings `inode` into the cache, concurrent calls for the same inode share one fetch.
+		In chunked mode files are only created as sparse files, use `fetchRange` for their data
+		:param stream: return once the copy started, `await self.streamer.wait_range(...)` before touching its data.
+		  Otherwise the cache file is complete afterwards
+		"""
+		await self.evictor.settle(inode)
 		f: Path = self.disk.ino_toTmp(inode)
-		st_size: int = self.vfs.inode_path_map[inode].entry.st_size
-		if not f.exists():
-			self.remote.makeAvailable()
-			self.__fetchFile(self.disk.toSrc(f), st_size)
+		if self.streamer.is_streaming(inode):
+			if stream:
+				return f
+			await self.streamer.settle(inode)
+		if not f.exists() or inode in self.fetcher or Disk.is_partial(f):
+			await self.fetcher.once(inode, self.__fetch, inode, f, stream)
 		return f
 
+	async def __fetch(self, inode: int, f: Path, stream: bool) -> None:
+		if Disk.is_partial(f) and not self.streamer.is_streaming(inode):
+			log.warning(f'Copy of {Col(f)} was interrupted, fetching it again')
+			self.disk.drop_partial(f)
+		if f.exists():
+			return
+
+		info: FileInfo = self.vfs.inode_path_map[inode]
+		self.remote.makeAvailable()
+		if isinstance(info, DirInfo):
+			self.disk.cp2Cache(self.disk.toSrc(f), force=True, busy_inos=self.busy_inodes())
+		elif self.disk.chunkSize:
+			self.disk.prepare_sparse(inode, info.st_size)
+		elif await self.__promoteFile(inode, f, info):
+			return
+		elif stream:
+			self.__streamFile(inode, self.disk.toSrc(f), info.st_size)
+		else:
+			await self.__fetchFile(inode, self.disk.toSrc(f), info.st_size)
+		if not isinstance(info, DirInfo):
+			self.freshness.checked(inode)
+
+	# freshness
+	# =========
+
+	def isRevalidatable(self, inode: int) -> bool:
+		"""cached regular files copied from the source which can be swapped for a new copy right now"""
+		if isinstance(self.vfs.inode_path_map.get(inode), DirInfo) or inode not in self.disk._origin:
+			return False
+		if inode in self.vfs._inode_fd_map or self.journal.isDirty(inode) or inode in self.fetcher:
+			return False
+		if self.streamer.is_streaming(inode) or self.evictor.is_evicting(inode):
+			return False
+		cpath: str = self.disk.ino_toTmp_str(inode)
+		return os.path.exists(cpath) and not Disk.is_partial(cpath)
+
+	async def revalidate(self, inode: int) -> bool:
+		"""
+		Compares the cache file of `inode` with its source, its cached siblings which are due too go into the same
+		batch of stat calls. Stale cache files are dropped, the caller refetches `inode` (streamed in the background)
+		:returns: True if `inode` was stale
+		"""
+		candidates: list[int] = [inode] + self.__dueSiblings(inode)
+		paths: list[str] = [self.disk.toSrc_str(self.disk.ino_toTmp_str(ino)) for ino in candidates]
+		self.remote.makeAvailable()
+		results = await self.stats.stat_many(paths)
+		now: float = trio.current_time()
+		stale: bool = False
+		for ino, stat in zip(candidates, results):
+			if not self.isRevalidatable(ino):
+				continue  # opened or changed while the batch ran
+			if stat is None:
+				# gone in the source, the next rescan removes it. Until then the cached copy is all there is
+				log.warning(f'{Col(self.disk.ino_to_rpath(ino))} disappeared from the source')
+				self.freshness.checked(ino, now)
+			elif self.disk._origin[ino] == (stat.st_size, stat.st_mtime_ns):
+				self.freshness.checked(ino, now)
+			else:
+				await self.__dropStale(ino, stat)
+				stale = stale or ino == inode
+		return stale
+
+	def __dueSiblings(self, inode: int) -> list[int]:
+		parent: DirInfo = cast(DirInfo, self.vfs.inode_path_map.get(self.disk.ino_parent(inode)))
+		if not isinstance(parent, DirInfo):
+			return []
+		siblings: list[int] = []
+		for ino in parent.children:
+			if len(siblings) >= StatBatcher.MAX_BATCH - 1:
+				break
+			if ino != inode and self.freshness.due(ino) and self.isRevalidatable(ino):
+				siblings.append(ino)
+		return siblings
+
+	async def __dropStale(self, inode: int, stat: os.stat_result) -> None:
+		log.info(f'{Col(self.disk.ino_to_rpath(inode))} changed in the source, refetching it')
+		info: FileInfo = self.vfs.inode_path_map[inode]
+		for attr in FileInfo.STAT_ATTRS:
+			setattr(info, attr, getattr(stat, attr))
+		self.memory.invalidate(inode)
+		self.disk.evict(inode)  # its demoted copy is older still
+		self.freshness.forget(inode)
+		self.refetched += 1
+
+	def withTimeouts(self, entry: pyfuse3.EntryAttributes, inode: int) -> pyfuse3.EntryAttributes:
+		"""the kernel asks again once the TTL of `inode` is over, so it sees what a revalidation changed"""
+		ttl: float = self.freshness.ttl(inode)
+		if not math.isinf(ttl):
+			entry.entry_timeout = entry.attr_timeout = ttl
+		return entry
+
+	async def __promoteFile(self, inode: int, f: Path, info: FileInfo) -> bool:
+		""":returns: False if `inode` has no (up to date) demoted copy in the second tier, fetch it from the source then"""
+		tier2: Optional[SecondTier] = self.disk.tier2
+		if tier2 is None:
+			return False
+		rpath: str = self.disk.toRoot(f)
+		origin: tuple[int, int] = (info.st_size, info.st_mtime_ns)
+		demoted: Optional[str] = tier2.lookup(rpath, origin)
+		if demoted is None:
+			return False
+		self.__admit(inode, f, info.st_size)
+		dest = self.disk.prepare_promotion(inode, origin, busy_inos=self.busy_inodes())
+		tier2.take(rpath)
+		self.evictor.wakeup()
+		try:
+			await self.fetcher.run_sync(Disk.promote, demoted, dest)
+		except OSError as exc:
+			log.warning(f'Could not promote {Col(rpath)} from the second tier: {exc}')
+			self.disk.drop_partial(dest)
+			return False
+		self.disk.recharge(inode)
+		return True
+
+	def dropDemoted(self, path: str) -> None:
+		"""The demoted copy of the cache path `path` is out of date"""
+		if self.disk.tier2 is not None:
+			self.disk.tier2.discard(self.disk.toRoot(path))
+
+	async def fetchRange(self, inode: int, offset: int, length: int, for_write: bool = False) -> None:
+		"""chunked mode: makes sure [offset, offset + length) of `inode` is in its sparse cache file"""
+		await self.evictor.settle(inode)
+		if for_write:
+			for chunk_offset, chunk_len in self.disk.write_edges(inode, offset, length):
+				await self.__fetchChunks(inode, chunk_offset, chunk_len)
+			await self.fetcher.wait((inode, idx) for idx in self.disk.block_map(inode).chunks(offset, length))
+			self.disk.claim_chunks(inode, offset, length, self.busy_inodes())
+		else:
+			await self.__fetchChunks(inode, offset, length)
+		self.evictor.wakeup()
+
+	async def __fetchChunks(self, inode: int, offset: int, length: int) -> None:
+		"""fetches the missing chunks of the range in a worker, chunks fetched by someone else already are waited for"""
+		missing: list[int] = self.disk.block_map(inode).missing(offset, length)
+		todo: list[int] = [idx for idx in missing if (inode, idx) not in self.fetcher]
+		if todo:
+			self.remote.makeAvailable()
+		spans = self.disk.reserve_chunks(inode, todo, offset, length, self.busy_inodes())
+		if spans:
+			cpath: str = self.disk.ino_toTmp_str(inode)
+			flight = self.fetcher.begin((inode, idx) for idx, _, _ in spans)
+			try:
+				await self.fetcher.run_sync(Disk.copy_chunks, self.disk.toSrc_str(cpath), cpath, spans)
+			except BaseException as exc:
+				self.disk.unreserve_chunks(inode, spans)
+				self.fetcher.end(flight, exc)
+				raise
+			self.disk.commit_chunks(inode, spans)
+			self.fetcher.end(flight)
+		await self.fetcher.wait((inode, idx) for idx in missing if idx not in todo)
+
 	async def rename(self,
 			inode_p_old: int,
 			name_old: str,
@@ -128,14 +475,6 @@ class VFSOps(pyfuse3.Operations, CallStackAware):
 		if flags != 0:
 			raise FUSEError(errno.EINVAL)
 
-		def rename_childs(childs: list[int], parent_new: str) -> None:
-			for child in childs:
-				child_info = self.vfs.inode_path_map[child]
-				cache: Path = self.disk.ino_toTmp(child_info.entry.st_ino)
-				assert isinstance(cache, Path), f"{self} {SOFTLINK_DISABLED_ERROR}"
-				if isinstance(child_info, DirInfo):
-					rename_childs(child_info.children, parent_new)
-
 		# TODO: https://linux.die.net/man/3/rename
 		#       could be made completly in memory as nothing is opened written
 		#       to except the parent dir (which is already in memory)
@@ -147,13 +486,20 @@ class VFSOps(pyfuse3.Operations, CallStackAware):
 
 		path_old, path_new = join(ino2Path(inode_p_old), fsdecode(name_old)), join(ino2Path(inode_p_new),
 																				   fsdecode(name_new))
-		ino_old = self.disk.path_to_ino(path_old, reuse_ino=inode_p_old)
+		ino_old = self.disk.lookup_ino(path_old)
+		if ino_old is None:
+			raise FUSEError(errno.ENOENT)
 
 		if os.path.exists(path_new):  # calls lookup and fails if path_new will be overwritten
 			raise FUSEError(errno.EINVAL)
 
 		log.info(f"{Col(path_old)} -> {Col(path_new)}")
-		self.fetchFile(ino_old)
+		await self.fetchFile(ino_old)
+		self.memory.invalidate(ino_old)
+		self.dropDemoted(path_old)
+		self.dropDemoted(path_new)
+		self.sourceFds.invalidate(self.disk.toSrc(path_old))
+		self.sourceFds.invalidate(self.disk.toSrc(path_new))
 
 		try:
 			os.rename(path_old, path_new)  # fails if file not in cachedir!
@@ -163,30 +509,30 @@ class VFSOps(pyfuse3.Operations, CallStackAware):
 		# file is renamed now we need to update our internal entries
 		info_old_p: DirInfo = cast(DirInfo, inoPathMap[inode_p_old])
 
-		old_children: list[int] = info_old_p.children
-		new_children: list[int] = cast(DirInfo, inoPathMap[inode_p_new]).children
+		old_children: DirEntries = info_old_p.children
+		new_children: DirEntries = cast(DirInfo, inoPathMap[inode_p_new]).children
 
-		def logMsg(ino_old: int, path_old: str, children: list[int], cache_path: str) -> None:
+		def logMsg(ino_old: int, path_old: str, children: DirEntries, cache_path: str) -> None:
 			ino_old, path_old = Col(ino_old), Col(path_old)
-			children, cache_path = Col(children), Col(cache_path)
+			children, cache_path = Col(list(children)), Col(cache_path)
 			log.debug(f'Trying to delete {ino_old}({path_old}) from {children} ({cache_path})')
-		info_old_p_cache: str = self.disk.ino_toTmp(info_old_p.entry.st_ino).__str__()
+		info_old_p_cache: str = self.disk.ino_toTmp_str(info_old_p.st_ino)
 		logMsg(inode_p_old, path_old, old_children, info_old_p_cache)
 
 		# remove from old parent
-		old_children.remove(ino_old)
-		self.disk.untrack(path_old)
+		old_children.pop(fsdecode(name_old))
+
+		# re-hang the translation, descendants of directories follow automatically.
+		# Cache accounting is keyed by ino and isn't affected
+		self.disk.rename_path(path_old, path_new)
+		if self.disk.chunkSize:
+			BlockMap.move(path_old, path_new)
 
 		# add to new parent
-		new_children.append(ino_old)
-		self.disk.track(path_new, reuse_ino=ino_old)
+		new_children.add(fsdecode(name_new), ino_old)
 
-		info_ino_old: DirInfo = cast(DirInfo, inoPathMap[ino_old])
-		# move FileInfo to new inode. Journal changes src if synced
-		info_ino_old.cache = Path(path_new)  # no hardlinks atm this should be fine
+		# FileInfo stays with the ino, only the translation moved. Journal changes src if synced
 		self.journal.log_rename(ino_old, path_old, path_new)
-		if os.path.isdir(path_new):
-			rename_childs(info_ino_old.children, ino2Path(inode_p_new).__str__())
 
 		if self.vfs.inLookupCnt(ino_old):
 			self.vfs._lookup_cnt[ino_old] += 1
@@ -234,16 +580,15 @@ class BasicOps(VFSOps):
 			if name != '.' and name != '..':
 				self.vfs._lookup_cnt[st_ino] += 1
 
-		path: Path = self.disk.ino_toTmp(inode_p) / Path(name)
-
 		# check if directory and children are known
 		info = self.vfs.inode_path_map[inode_p]
 		if isinstance(info, DirInfo):
-			for child_inode in info.children:
-				if path == self.disk.ino_toTmp(child_inode):
-					incLookupCount(inode_p)
-					assert child_inode == self.vfs.inode_path_map[child_inode].entry.st_ino
-					return self.vfs.inode_path_map[child_inode].entry
+			child_inode = info.children.get(name)
+			if child_inode is not None:
+				incLookupCount(inode_p)
+				child_info = self.vfs.inode_path_map[child_inode]
+				assert child_inode == child_info.st_ino
+				return self.withTimeouts(child_info.entry, child_inode)  # only built here as it goes to the kernel
 
 		# NOENT case: cache negative lookup
 		# attr = self.vfs.inode_path_map[inode_p].entry
@@ -277,6 +622,9 @@ class BasicOps(VFSOps):
 			entry.attr_timeout = float('inf')
 			return entry
 
+		self.memory.invalidate(inode)
+		if fh is None and self.vfs._inode_fd_map.get(inode) in self.passthrough:
+			fh = self.vfs._inode_fd_map[inode]  # there is no cache file to change
 		if fh is None:
 			if self.disk.ino_exists(inode):
 				path_or_fh = self.disk.ino_toTmp(inode)
@@ -288,7 +636,17 @@ class BasicOps(VFSOps):
 				return entry
 		else:
 			path_or_fh = fh
+		passthrough: bool = fh in self.passthrough
+		if fields.update_size:
+			await self.streamer.settle(inode)
+		if fields.update_size and self.disk.chunkSize and not passthrough \
+				and not isinstance(self.vfs.inode_path_map.get(inode), DirInfo):
+			await self.fetchFile(inode)
+			await self.fetcher.wait(key for key in self.fetcher.keys if isinstance(key, tuple) and key[0] == inode)
+			self.disk.truncate_chunks(inode, attr.st_size, self.busy_inodes())
 		FileInfo.setattr(attr, fields, path_or_fh, ctx)
+		if fields.update_size and not self.disk.chunkSize and not passthrough:
+			self.disk.recharge(inode, fh)
 		# todo check if attr now is attr after self.getattr
 		new_attr = await self.getattr(inode)
 		assert attr != new_attr, "attr are equal ?"
@@ -298,13 +656,13 @@ class BasicOps(VFSOps):
 		if inode in self.vfs._inode_fd_map:  # if isOpened(inode):
 			return FileInfo.getattr(fd=self.vfs._inode_fd_map[inode])
 		else:
-			return FileInfo.getattr(path=self.disk.ino_toTmp(inode))
+			return FileInfo.getattr(path=self.disk.ino_toTmp_str(inode))
 
 	async def getattr(self, inode: int, ctx: pyfuse3.RequestContext = None) -> pyfuse3.EntryAttributes:
 		entry = await self.__getattr(inode, ctx)
-		path = self.disk.ino_toTmp(inode)
+		path = self.disk.ino_toTmp_str(inode)
 		entry.st_ino = self.disk.path_to_ino(path)
-		return entry
+		return self.withTimeouts(entry, inode)
 
 	# File methods (functions with file descriptors)
 	# ==============================================
@@ -312,9 +670,23 @@ class BasicOps(VFSOps):
 	async def open(self, inode: int, flags: int, ctx: pyfuse3.RequestContext) -> pyfuse3.FileInfo:
 		log.debug(f'{Col(inode)}, flags: {Col(flags)}; old_ino: {Col(inode)}')
 
+		self.admission.record(inode)
+		if flags & os.O_TRUNC:
+			self.memory.invalidate(inode)
 		if inode in self.vfs._inode_fd_map:
 			fd: int = self.vfs._inode_fd_map[inode]
+			if fd in self.passthrough and flags & os.O_ACCMODE != os.O_RDONLY \
+					and fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_ACCMODE == os.O_RDONLY:
+				info_ = self.vfs.inode_path_map[inode]
+				try:
+					if inode in self.uncached or self.tooBig(inode, info_.st_size):
+						self.reopenPassthrough(inode, fd)
+					else:
+						await self.leavePassthrough(inode, fd)
+				except OSError as exc:
+					raise FUSEError(exc.errno)
 			self.vfs._fd_open_count[fd] += 1
+			self.disk.touch(inode)
 			# log.info(self + f" (fd, inode): ({fd}, {Col.inode(inode)})")
 			return pyfuse3.FileInfo(fh=fd)
 
@@ -323,13 +695,20 @@ class BasicOps(VFSOps):
 
 		try:
 			info: FileInfo = self.vfs.inode_path_map[inode]
-			f = self.fetchFile(inode)
-
-			# File is in Cache now
-			fd = os.open(f, flags)
-			attr = FileInfo.getattr(f)
-			attr.st_ino = inode
-			info.entry = attr
+			refreshed: bool = self.freshness.due(inode) and self.isRevalidatable(inode) \
+				and await self.revalidate(inode)
+			if self.usePassthrough(inode, info, flags):
+				fd = await self.openPassthrough(inode, flags)
+			else:
+				# O_TRUNC throws the content away anyway, no point in streaming it
+				f = await self.fetchFile(inode, stream=flags & os.O_TRUNC == 0)
+
+				# File is in Cache now
+				fd = os.open(f, flags)
+				attr = FileInfo.getattr(f)
+				attr.st_ino = inode
+				info.entry = attr
+				self.disk.touch(inode)
 		except KeyError:
 			log.error(f"({inode}, {hex(flags)})")
 			raise FUSEError(errno.ENOENT)
@@ -338,7 +717,10 @@ class BasicOps(VFSOps):
 
 		self.update_refs(fd, inode)
 
-		return pyfuse3.FileInfo(fh=fd)
+		file_info = pyfuse3.FileInfo(fh=fd)
+		if refreshed:
+			file_info.keep_cache = False  # the kernel still has pages of the old version
+		return file_info
 
 	async def create(self, inode_p: int, name: str, mode: int, flags: int,
 					 ctx: pyfuse3.RequestContext) -> (pyfuse3.FileInfo, pyfuse3.EntryAttributes):
@@ -352,6 +734,12 @@ class BasicOps(VFSOps):
 
 		attr = FileInfo.getattr(fd=fd)
 		attr.st_ino = self.disk.track(cpath.__str__())
+		self.memory.invalidate(attr.st_ino)
+		self.dropDemoted(cpath)
+		if self.disk.chunkSize:
+			# O_TRUNC -> nothing left to fetch from an existing source file
+			self.disk.init_block_map(attr.st_ino, source_size=0)
+		self.evictor.wakeup()
 		self.vfs.add_Child(inode_p, attr.st_ino, cpath, attr)
 
 		self.update_refs(fd, attr.st_ino)
@@ -368,6 +756,11 @@ class BasicOps(VFSOps):
 		parent = self.disk.ino_toTmp(inode_p)
 		path = os.path.join(parent, name)
 		inode = self.disk.path_to_ino(path)
+		await self.evictor.settle(inode)
+		await self.streamer.abort(inode)
+		self.memory.invalidate(inode)
+		self.dropDemoted(path)
+		self.sourceFds.invalidate(self.disk.toSrc(path))
 		try:
 			if os.path.exists(path):  # file exists in cache
 				os.unlink(path)
@@ -377,8 +770,8 @@ class BasicOps(VFSOps):
 		# inode from /tmp might not be present here anymore but file isn't deleted in src
 		info_p: DirInfo = cast(DirInfo, self.vfs.inode_path_map[inode_p])
 		assert isinstance(info_p, DirInfo), "Type mismatch"
-		assert inode in info_p.children, f"{inode} not in {info_p.children}, path {path}"
-		info_p.children.remove(inode)
+		assert info_p.children.get(name) == inode, f"{inode} not in {info_p.children}, path {path}"
+		info_p.children.pop(name)
 		self.disk.untrack(path)
 
 		self.journal.log_unlink(inode_p, inode, path)
@@ -387,21 +780,46 @@ class BasicOps(VFSOps):
 			del self.disk[(inode, path)]
 
 	async def read(self, fd: int, offset: int, length: int) -> bytes:
+		inode: Optional[int] = self.vfs._fd_inode_map.get(fd)
 		try:
+			if fd in self.passthrough:
+				return await pread(fd, length, offset)
+			if inode is None:
+				os.lseek(fd, offset, os.SEEK_SET)
+				return os.read(fd, length)
+			hit = self.memory.read(inode, offset, length)
+			if hit is not None:
+				self.disk.touch(inode)  # keeps its cache file around as well
+				return hit
+			if self.disk.chunkSize:
+				await self.fetchRange(inode, offset, length)
+			else:
+				self.disk.touch(inode)
+				await self.streamer.wait_range(inode, offset, length)
 			os.lseek(fd, offset, os.SEEK_SET)
-			return os.read(fd, length)
+			data: bytes = os.read(fd, length)
+			if self.memory.hot(inode):
+				await self.promote(inode, fd, offset, length)
+			return data
 		except OSError as exc:
 			raise FUSEError(exc.errno)
 
+	async def promote(self, inode: int, fd: int, offset: int, length: int) -> None:
+		"""Loads the hot parts of `inode` around a read from its cache file into the memory tier"""
+		if self.streamer.is_streaming(inode):
+			return  # not complete yet
+		size: int = os.fstat(fd).st_size
+		if self.disk.chunkSize:
+			# the sparse cache file only has the chunks which were read
+			await self.fetchRange(inode, *self.memory.span(size, offset, length))
+		self.memory.load(inode, size, offset, length, lambda n, pos: os.pread(fd, n, pos))
+
 	def __fsync_with_remote(self, cache: Path, flags: int, write_ops: list[tuple[int, int]]) -> None:
 		"""Should work with newly created files too as we are re-using the flags"""
 		remote = self.disk.toSrc(cache)
 		fd_cache, fd_remote = os.open(cache, flags), os.open(remote, flags)
 		for offset, buflen in write_ops:
-			os.lseek(fd_cache, offset, os.SEEK_SET)
-			os.lseek(fd_remote, offset, os.SEEK_SET)
-			buf = os.read(fd_cache, buflen)
-			os.write(fd_remote, buf)
+			copy_range(fd_cache, fd_remote, offset, buflen)
 		os.fsync(fd_remote)
 		os.close(fd_cache)
 		os.close(fd_remote)
@@ -415,11 +833,29 @@ class BasicOps(VFSOps):
 		#         and sync them later via write ops instead of rewriting the whole file
 		#         adv: we dont need a lot of extra space (just 2 ints per dirty file) as we use the file itself but redo everything we did in the cache file
 		#         notice: we need to set the attributes to the same values as in the cache then
+		inode_: Optional[int] = self.vfs._fd_inode_map.get(fd)
+		assert inode_ is not None
+		self.memory.invalidate(inode_)
+		if fd in self.passthrough:
+			# uncached write path: straight into the source, there is no cache file to journal and sync later
+			try:
+				return await pwrite(fd, buf, offset)
+			except OSError as exc:
+				raise FUSEError(exc.errno)
+		if self.disk.chunkSize:
+			await self.fetchRange(inode_, offset, len(buf), for_write=True)
+		else:
+			self.disk.reserve_write(inode_, offset + len(buf), self.busy_inodes())
 		try:
+			# the streamed copy must not overwrite this write later on
+			await self.streamer.wait_range(inode_, offset, len(buf))
 			os.lseek(fd, offset, os.SEEK_SET)
 			# TODO: notice: keep docstring in mind esp. direct_io
 			# if errors are encountered exceptions automatically erupt (e.g. MemoryError)
 			bytes_written = os.write(fd, buf)
+			if not self.disk.chunkSize:
+				self.disk.recharge(inode_, fd)
+				self.evictor.wakeup()
 
 			# as we might crash without notice it is paramount to be able to
 			# replay the write_ops without knowning fd<->inode relation,
@@ -444,6 +880,12 @@ class BasicOps(VFSOps):
 		del self.vfs._fd_inode_map[fd]
 		log.debug(f"fd: {fd} ino: {inode}")
 		try:
+			if fd in self.passthrough:
+				self.passthrough.remove(fd)
+				self.sourceFds.close(fd)
+				return
+			if self.disk.chunkSize:
+				self.disk.flush_block_map(inode)
 			os.close(fd)
 		except OSError as exc:
 			raise FUSEError(exc.errno)
@@ -454,12 +896,23 @@ class BasicOps(VFSOps):
 	async def flush(self, fh: int) -> None:
 		inode: Optional[int] = self.vfs._fd_inode_map.get(fh)
 		assert inode is not None
+		if fh in self.passthrough:
+			return  # written to the source already, nothing to sync
 		self.journal.log_flush(inode, fh)  # store write history for later sync
-		return os.fsync(fh)  # data is only written to cache_dir
+		os.fsync(fh)  # data is only written to cache_dir
+		await self.journal.commit()
 
 	async def fsync(self, fh: int, datasync: bool) -> None:
-		log.warning(f' Not implemented')
-		raise FUSEError(errno.ENOSYS)
+		"""durable in the cache dir, the journal entries to write it back to the source are durable too"""
+		try:
+			if datasync:
+				os.fdatasync(fh)
+			else:
+				os.fsync(fh)
+		except OSError as exc:
+			raise FUSEError(exc.errno)
+		if fh not in self.passthrough:
+			await self.journal.commit()
 
 
 class NodeOps(BasicOps):
@@ -471,9 +924,8 @@ class NodeOps(BasicOps):
 				self.printAllInodes(ino)
 
 	async def statfs(self, ctx: pyfuse3.RequestContext) -> pyfuse3.StatvfsData:
-		"""Easisest function to get an entrypoint into the code (not many df calls all around)"""
+		"""Cheap on purpose (df, file managers), the journal is written back by `self.writeback` in the background"""
 		root_ino = DiskBase.ROOT_INODE
-		self.printAllInodes()
 		root = self.disk.ino_toTmp(root_ino)
 		stat_ = pyfuse3.StatvfsData()
 		try:
@@ -485,11 +937,17 @@ class NodeOps(BasicOps):
 			setattr(stat_, attr, getattr(statfs, attr))
 
 		stat_.f_namemax = statfs.f_namemax - (len(root.__str__()) + 1)
-		log.info(f"elements in RAM: {Col.path(len(self.vfs.inode_path_map))}")
-
-		if not self.journal.isCompletelyClean():
-			log.info(self.disk.getSummary())
-		self.journal.flushCompleteJournal()
+		# df and file managers call this all the time
+		if log.isEnabledFor(logging.DEBUG):
+			log.debug(f"elements in RAM: {Col.path(len(self.vfs.inode_path_map))}")
+			log.debug(f"fetch pool: {self.fetcher}")
+			log.debug(f"admission: {self.admission}")
+			log.debug(f"passthrough: {self.sourceFds}")
+			log.debug(f"memory: {self.memory}")
+			log.debug(f"freshness: {self.freshness}, {self.stats}, refetched={self.refetched}")
+			if self.disk.tier2 is not None:
+				log.debug(f"second tier: {self.disk.tier2}")
+			log.debug(f"writeback: {self.writeback}")
 
 		# modify size, used, avail
 		return self.disk.statvfs(stat_)
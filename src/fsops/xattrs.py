@@ -1,24 +1,193 @@
 #!/usr/bin/env python
+# job of this module:
+#  - cache control through extended attributes in the user.wolfs.* namespace:
+#      setfattr -n user.wolfs.pin <path>      keep a file/subtree resident (fetches what isn't cached yet)
+#      setfattr -x user.wolfs.pin <path>      unpin it again
+#      setfattr -n user.wolfs.evict <path>    drop a file (or the clean files of a subtree) from the cache
+#      setfattr -n user.wolfs.uncached <path> never cache a file/subtree, it is read and written on the source
+#      setfattr -x user.wolfs.uncached <path> cache it again
+#      setfattr -n user.wolfs.ttl -v 30 <path> compare cached files (below it) with the source after 30s ('inf': never)
+#      setfattr -x user.wolfs.ttl <path>      inherit the TTL of the directory above again
+#      getfattr -n user.wolfs.cached <path>   resident bytes, size, dirty and pinned state (never fetches)
+#  - other xattrs aren't supported (but must not answer ENOSYS, the kernel would stop asking for ours too)
 from src.fsops.vfsops import NodeOps
 import errno
 from pyfuse3 import FUSEError, RequestContext
+from src.libwolfs.fileInfo import DirInfo, FileInfo
+from src.libwolfs.util import Col
+from typing import Final, Iterator, Optional
 import logging
 log = logging.getLogger(__name__)
 
 class XAttrsOps(NodeOps):
+	PIN: Final[bytes] = b'user.wolfs.pin'
+	EVICT: Final[bytes] = b'user.wolfs.evict'
+	CACHED: Final[bytes] = b'user.wolfs.cached'
+	UNCACHED: Final[bytes] = b'user.wolfs.uncached'
+	TTL: Final[bytes] = b'user.wolfs.ttl'
+
 	async def access(self, inode: int, mode: int, ctx: RequestContext) -> None:
 		# for permissions but eh
 		log.info('access')
 		raise FUSEError(errno.ENOSYS)
 
-	async def setxattr(self, inode: int, name: str, value: str, ctx: RequestContext) -> None:
-		raise FUSEError(errno.ENOSYS)
+	async def setxattr(self, inode: int, name: bytes, value: bytes, ctx: RequestContext) -> None:
+		if name == XAttrsOps.PIN:
+			await self.pinInode(inode)
+		elif name == XAttrsOps.EVICT:
+			await self.evictInode(inode)
+		elif name == XAttrsOps.UNCACHED:
+			await self.uncacheInode(inode)
+		elif name == XAttrsOps.TTL:
+			self.setTTL(inode, value)
+		elif name == XAttrsOps.CACHED:
+			raise FUSEError(errno.EPERM)  # read only
+		else:
+			raise FUSEError(errno.ENOTSUP)
 
-	async def getxattr(self, inode: int, name: str, ctx: RequestContext) -> None:
-		raise FUSEError(errno.ENOSYS)
+	async def getxattr(self, inode: int, name: bytes, ctx: RequestContext) -> bytes:
+		if name == XAttrsOps.PIN and inode in self.pins:
+			return b'1'
+		if name == XAttrsOps.UNCACHED and inode in self.uncached:
+			return b'1'
+		if name == XAttrsOps.TTL and inode in self.freshness.ttls:
+			return str(self.freshness.ttls[inode]).encode()
+		if name == XAttrsOps.CACHED:
+			return self.cachedState(inode).encode()
+		raise FUSEError(errno.ENODATA)
 
-	async def listxattr(self, inode: int, ctx: RequestContext) -> None:
-		raise FUSEError(errno.ENOSYS)
+	async def listxattr(self, inode: int, ctx: RequestContext) -> list[bytes]:
+		names: list[bytes] = [XAttrsOps.PIN] if inode in self.pins else []
+		if inode in self.uncached:
+			names.append(XAttrsOps.UNCACHED)
+		if inode in self.freshness.ttls:
+			names.append(XAttrsOps.TTL)
+		return names + [XAttrsOps.CACHED]
 
-	async def removexattr(self, inode: int, name: str, ctx: RequestContext) -> None:
-		raise FUSEError(errno.ENOSYS)
+	async def removexattr(self, inode: int, name: bytes, ctx: RequestContext) -> None:
+		if name == XAttrsOps.PIN and self.pins.unpin(inode):
+			log.info(f'Unpinned {Col(self.disk.ino_to_rpath(inode))}')
+			return
+		if name == XAttrsOps.UNCACHED and self.uncached.unpin(inode):
+			log.info(f'{Col(self.disk.ino_to_rpath(inode))} is cached again')
+			return
+		if name == XAttrsOps.TTL and self.freshness.clear_ttl(inode):
+			return
+		raise FUSEError(errno.ENODATA)
+
+	# cache control
+	# =============
+
+	def subtree(self, inode: int) -> Iterator[int]:
+		"""`inode` and everything below it, directories before their children"""
+		yield inode
+		info: Optional[FileInfo] = self.vfs.inode_path_map.get(inode)
+		if isinstance(info, DirInfo):
+			for child in list(info.children):
+				yield from self.subtree(child)
+
+	async def pinInode(self, inode: int) -> None:
+		"""Pins `inode` (and everything below it) and fetches what isn't cached yet"""
+		if inode not in self.vfs.inode_path_map:
+			raise FUSEError(errno.ENOENT)
+		pinned_before: bool = inode in self.pins.roots
+		self.pins.pin(inode)
+		try:
+			for ino in self.subtree(inode):
+				await self.stageInode(ino)
+		except FUSEError:
+			# e.g. the pinned files don't fit into the cache
+			if not pinned_before:
+				self.pins.unpin(inode)
+			raise
+		log.info(f'Pinned {Col(self.disk.ino_to_rpath(inode))}. {self.disk.getSummary()}')
+
+	async def stageInode(self, inode: int) -> None:
+		"""Copies `inode` into the cache completely"""
+		info: FileInfo = self.vfs.inode_path_map[inode]
+		try:
+			await self.fetchFile(inode)
+			if self.disk.chunkSize and not isinstance(info, DirInfo):
+				await self.fetchRange(inode, 0, info.st_size)
+				self.disk.flush_block_map(inode)
+		except OSError as exc:
+			raise FUSEError(exc.errno)
+
+	async def evictInode(self, inode: int) -> None:
+		"""
+		Drops the file `inode` from the cache, for directories every clean file below it which isn't in use
+		:raises FUSEError(EBUSY): if the file is open, dirty (not synced yet) or pinned
+		"""
+		info: Optional[FileInfo] = self.vfs.inode_path_map.get(inode)
+		if info is None:
+			raise FUSEError(errno.ENOENT)
+		if not isinstance(info, DirInfo):
+			if not self.isEvictable(inode):
+				raise FUSEError(errno.EBUSY)
+			await self.__evict(inode)
+			return
+
+		freed: int = 0
+		for ino in self.subtree(inode):
+			if not isinstance(self.vfs.inode_path_map.get(ino), DirInfo) and self.isEvictable(ino):
+				freed += await self.__evict(ino)
+		log.info(f'Evicted {Col(freed)} bytes below {Col(self.disk.ino_to_rpath(inode))}')
+
+	async def uncacheInode(self, inode: int) -> None:
+		"""
+		Marks `inode` (and everything below it) uncached and drops the cached copies which aren't in use,
+		open or dirty ones are served from the cache until they are closed and synced. Pins take precedence
+		"""
+		if inode not in self.vfs.inode_path_map:
+			raise FUSEError(errno.ENOENT)
+		self.uncached.pin(inode)
+		freed: int = 0
+		for ino in self.subtree(inode):
+			if not isinstance(self.vfs.inode_path_map.get(ino), DirInfo) and self.isEvictable(ino):
+				freed += await self.__evict(ino)
+		log.info(f'Marked {Col(self.disk.ino_to_rpath(inode))} uncached, evicted {Col(freed)} bytes')
+
+	def setTTL(self, inode: int, value: bytes) -> None:
+		""":param value: seconds as text, 'inf' never compares with the source"""
+		if inode not in self.vfs.inode_path_map:
+			raise FUSEError(errno.ENOENT)
+		try:
+			ttl = float(value.decode().strip())
+		except ValueError:
+			raise FUSEError(errno.EINVAL)
+		if ttl < 0 or ttl != ttl:
+			raise FUSEError(errno.EINVAL)
+		self.freshness.set_ttl(inode, ttl)
+		log.info(f'TTL of {Col(self.disk.ino_to_rpath(inode))} is {Col(ttl)}s')
+
+	def isEvictable(self, inode: int) -> bool:
+		return not (self.journal.isDirty(inode) or inode in self.vfs._inode_fd_map or inode in self.pins)
+
+	async def __evict(self, inode: int) -> int:
+		""":returns: freed bytes"""
+		await self.evictor.settle(inode)
+		await self.streamer.abort(inode)
+		self.memory.invalidate(inode)
+		# a fetch in progress would write into the file after it was dropped
+		await self.fetcher.wait(key for key in self.fetcher.keys
+								if key == inode or isinstance(key, tuple) and key[0] == inode)
+		try:
+			return self.disk.evict(inode)
+		except OSError as exc:
+			raise FUSEError(exc.errno)
+
+	def cachedState(self, inode: int) -> str:
+		"""resident bytes, size, dirty and pinned state of `inode` (summed up below directories)"""
+		if inode not in self.vfs.inode_path_map:
+			raise FUSEError(errno.ENOENT)
+		resident, size, dirty = 0, 0, False
+		for ino in self.subtree(inode):
+			info: FileInfo = self.vfs.inode_path_map[ino]
+			if isinstance(info, DirInfo):
+				continue
+			progress: Optional[int] = self.streamer.progress(ino)
+			resident += progress if progress is not None else self.disk.resident(ino)
+			size += info.st_size
+			dirty = dirty or self.journal.isDirty(ino)
+		return (f'resident={resident} size={size} dirty={int(dirty)} pinned={int(inode in self.pins)} '
+				f'uncached={int(inode in self.uncached)}')
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# job of this module:
+#  - remember which chunks of a sparse cache file are actually present
+#  - persist that bitmap next to the cache file so partially cached files survive a remount
+#  - give cached chunks back to the filesystem by punching holes into the cache file
+
+import ctypes
+import ctypes.util
+import errno
+import os
+from typing import Final, Iterator, Optional
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# <linux/falloc.h>
+FALLOC_FL_KEEP_SIZE: Final[int] = 0x01
+FALLOC_FL_PUNCH_HOLE: Final[int] = 0x02
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+_libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+_libc.fallocate.restype = ctypes.c_int
+
+
+def punch_hole(fd: int, offset: int, length: int) -> bool:
+	"""
+	Deallocates [offset, offset + length) of `fd` without changing its size (reads return zeros afterwards).
+	:returns: False if the filesystem doesn't support hole punching
+	"""
+	if _libc.fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length) == 0:
+		return True
+	err = ctypes.get_errno()
+	if err in (errno.EOPNOTSUPP, errno.ENOSYS):
+		return False
+	raise OSError(err, os.strerror(err))
+
+
+class BlockMap:
+	"""
+	Presence bitmap of the chunks of one cache file.
+	`source_size` is how much of the file is backed by the source, anything after it
+	was written/truncated locally and is never fetched.
+	Sidecar format: chunk size and source size (8 byte little endian each) followed by the bitmap (bit i <-> chunk i).
+	"""
+	__slots__ = ('chunk_size', 'source_size', 'bits')
+	SUFFIX: Final[str] = '.wolfs-blocks'
+	__FIELD: Final[int] = 8
+
+	def __init__(self, chunk_size: int, source_size: int, bits: Optional[bytearray] = None) -> None:
+		assert chunk_size > 0, "chunk size needs to be positive"
+		self.chunk_size: int = chunk_size
+		self.source_size: int = source_size
+		self.bits: bytearray = bits if bits is not None else bytearray()
+
+	# chunk arithmetic
+	# ================
+
+	def chunks(self, offset: int, length: int) -> range:
+		"""indices of all chunks overlapping [offset, offset + length)"""
+		if length <= 0:
+			return range(0)
+		return range(offset // self.chunk_size, (offset + length - 1) // self.chunk_size + 1)
+
+	def span(self, idx: int, file_size: int) -> tuple[int, int]:
+		"""(offset, length) of chunk `idx` in a file of `file_size` bytes"""
+		offset = idx * self.chunk_size
+		return offset, max(0, min(self.chunk_size, file_size - offset))
+
+	def missing(self, offset: int, length: int) -> list[int]:
+		"""chunks of [offset, offset + length) which still have to be fetched from the source"""
+		length = min(length, self.source_size - offset)
+		return [idx for idx in self.chunks(offset, length) if idx not in self]
+
+	# bitmap
+	# ======
+
+	def __contains__(self, idx: int) -> bool:
+		byte = idx >> 3
+		return byte < len(self.bits) and bool(self.bits[byte] & (1 << (idx & 7)))
+
+	def add(self, idx: int) -> None:
+		byte = idx >> 3
+		if byte >= len(self.bits):
+			self.bits.extend(bytes(byte + 1 - len(self.bits)))
+		self.bits[byte] |= 1 << (idx & 7)
+
+	def discard(self, idx: int) -> None:
+		byte = idx >> 3
+		if byte < len(self.bits):
+			self.bits[byte] &= ~(1 << (idx & 7)) & 0xff
+
+	def truncate(self, file_size: int) -> list[int]:
+		"""forgets chunks starting at or after `file_size` and stops fetching after it, :returns: their indices"""
+		self.source_size = min(self.source_size, file_size)
+		first = -(-file_size // self.chunk_size)
+		dropped = [idx for idx in self if idx >= first]
+		for idx in dropped:
+			self.discard(idx)
+		del self.bits[-(-first // 8):]
+		return dropped
+
+	def __iter__(self) -> Iterator[int]:
+		for byte_idx, byte in enumerate(self.bits):
+			while byte:
+				low = byte & -byte
+				yield (byte_idx << 3) + low.bit_length() - 1
+				byte ^= low
+
+	def __len__(self) -> int:
+		return sum(bin(byte).count('1') for byte in self.bits)
+
+	def __repr__(self) -> str:
+		return f'BlockMap(chunk_size={self.chunk_size}, chunks={list(self)})'
+
+	# persistence
+	# ===========
+
+	@staticmethod
+	def sidecar(cpath: str) -> str:
+		return cpath + BlockMap.SUFFIX
+
+	def dump(self) -> bytes:
+		field = BlockMap.__FIELD
+		return self.chunk_size.to_bytes(field, 'little') + self.source_size.to_bytes(field, 'little') + bytes(self.bits)
+
+	@classmethod
+	def load(cls, cpath: str, chunk_size: int, source_size: int) -> 'BlockMap':
+		"""
+		bitmap of `cpath`, empty if there is none or it was written with another chunk size
+		:param source_size: used if there is no sidecar yet
+		"""
+		try:
+			with open(BlockMap.sidecar(cpath), 'rb') as f:
+				data = f.read()
+		except FileNotFoundError:
+			return cls(chunk_size, source_size)
+		field = BlockMap.__FIELD
+		if len(data) < 2 * field or int.from_bytes(data[:field], 'little') != chunk_size:
+			log.warning(f'Ignoring block map of {cpath} (chunk size changed or file corrupted)')
+			return cls(chunk_size, source_size)
+		return cls(chunk_size, int.from_bytes(data[field:2 * field], 'little'), bytearray(data[2 * field:]))
+
+	@staticmethod
+	def write(cpath: str, data: bytes) -> None:
+		"""atomically replaces the sidecar of `cpath` with `data` (from `dump()`)"""
+		sidecar = BlockMap.sidecar(cpath)
+		tmp = sidecar + '.tmp'
+		with open(tmp, 'wb') as f:
+			f.write(data)
+		os.replace(tmp, sidecar)
+
+	def save(self, cpath: str) -> None:
+		BlockMap.write(cpath, self.dump())
+
+	@staticmethod
+	def remove(cpath: str) -> None:
+		try:
+			os.remove(BlockMap.sidecar(cpath))
+		except FileNotFoundError:
+			pass
+
+	@staticmethod
+	def move(cpath_old: str, cpath_new: str) -> None:
+		try:
+			os.rename(BlockMap.sidecar(cpath_old), BlockMap.sidecar(cpath_new))
+		except FileNotFoundError:
+			pass
@@ -1,38 +1,150 @@
 #!/usr/bin/env python
-from sortedcontainers import SortedDict
-from typing import Final
+from typing import Container, Final, Hashable, Iterable, Mapping, Optional
 from pathlib import Path
 from src.libwolfs.translator import InodeTranslator, MountFSDirectoryInfo
-from os import mkdir, rmdir, stat
+from os import mkdir, rmdir, stat, statvfs
 from src.libwolfs.util import Col, Path_str, formatByteSize
+from src.libwolfs.policy import DEFAULT_POLICY, EvictionPolicy, make_policy
+from src.libwolfs.blockmap import BlockMap
+from src.libwolfs.tier2 import SecondTier
+
+class BusyKeys:
+	"""
+	Cache keys which can't be evicted right now.
+	Whole files are keyed by their ino, chunks by (ino, chunk index).
+	"""
+	__slots__ = ('inos', 'chunk_inos', 'keys', 'pinned')
+
+	def __init__(self, inos: Iterable[int] = (), chunk_inos: Iterable[int] = (), pinned: Container[int] = ()) -> None:
+		"""
+		:param inos: whole files which can't go (open or dirty), :param chunk_inos: inodes whose chunks can't go (dirty)
+		:param pinned: inodes whose files and chunks can't go (see `Pins`)
+		"""
+		self.inos: set[int] = set(inos)
+		self.chunk_inos: set[int] = set(chunk_inos)
+		self.keys: set[Hashable] = set()
+		self.pinned: Container[int] = pinned
+
+	@staticmethod
+	def of(busy: Optional[Container[int]]) -> 'BusyKeys':
+		"""plain inode containers protect whole files and their chunks alike"""
+		if isinstance(busy, BusyKeys):
+			return busy
+		inos = set(busy) if busy is not None else set()  # type: ignore
+		return BusyKeys(inos, inos)
+
+	def add(self, key: Hashable) -> None:
+		self.keys.add(key)
+
+	def __contains__(self, key: Hashable) -> bool:
+		if key in self.keys:
+			return True
+		if isinstance(key, tuple):
+			return key[0] in self.chunk_inos or key[0] in self.pinned
+		return key in self.inos or key in self.pinned
+
 
 class Cache(InodeTranslator):
+	"""
+	Space accounting of the cache directory. Files are charged what they allocate on disk (`st_blocks`),
+	not their apparent size, so sparse files, block rounding and growing directories don't make it drift
+	"""
 	maxCacheSize: Final[int]
 	MIN_DIR_SIZE: Final[int]
+	ST_BLOCK_SIZE: Final[int] = 512  # unit of st_blocks, independent of the filesystem
 
 	def __init__(self, mount_info: MountFSDirectoryInfo,
-			maxCacheSize: int, noatime: bool = True, cacheThreshold: float = 0.99):
+			maxCacheSize: int, noatime: bool = True, cacheThreshold: float = 0.99, policy: str = DEFAULT_POLICY,
+			lowWatermark: Optional[float] = None, chunkSize: int = 0):
+		"""
+		:param cacheThreshold: high watermark, background eviction starts once the usage crosses it
+		:param lowWatermark: background eviction stops below it (defaults to 90% of `cacheThreshold`)
+		:param chunkSize: cache files chunk by chunk (in bytes) as they are read instead of as a whole (0)
+		"""
 		super().__init__(mount_info)
 
 		def get_min_dir_size():
 			tmpdir: Path = self.cacheDir / 'wolfs_tmp_directory'
 			mkdir(tmpdir)
-			min_dir_size = stat(tmpdir).st_size
+			min_dir_size = stat(tmpdir).st_blocks * Cache.ST_BLOCK_SIZE
 			rmdir(tmpdir)
 			return min_dir_size
 
 		# get OS dependant minimum directory size
 		self.MIN_DIR_SIZE = get_min_dir_size()
+		# allocation unit of the cache filesystem
+		self.blockSize: int = statvfs(self.cacheDir).f_frsize or Cache.ST_BLOCK_SIZE
 
 		self._current_CacheSize: int = 0
 		self._cacheThreshold: float = cacheThreshold
+		self.lowWatermark: float = lowWatermark if lowWatermark is not None else 0.9 * cacheThreshold
+		assert 0.0 <= self.lowWatermark <= self._cacheThreshold <= 1.0, 'watermarks need to be 0 <= low <= high <= 1'
 		self.maxCacheSize = maxCacheSize * self.__MEGABYTE__
+		# usage + free space of the cache filesystem, other files on it might leave less than maxCacheSize for us
+		self._fsLimit: int = self.maxCacheSize
+		self.refresh_fs_limit()
 
 		self.time_attr: str = 'st_mtime_ns' if noatime else 'st_atime_ns'  # remote has mountopt noatime set?
 
-		self.in_cache: SortedDict[int, (str, int)] = SortedDict()
-		self.path_timestamp: dict[str, int] = dict()
-		self._cached_inos: set[int] = set()
+		# decides admission and eviction order of cached inodes (or (ino, chunk) pairs in chunked mode)
+		self.policy: EvictionPolicy = make_policy(policy, self.maxCacheSize)
+		self.chunkSize: int = chunkSize
+		# chunked mode: ino -> presence bitmap of its sparse cache file (and the ones not persisted yet)
+		self._block_maps: dict[int, BlockMap] = dict()
+		self._unsaved_maps: set[int] = set()
+		# ino -> (size, mtime) of the source file its cache file was copied from (see `Manifest`)
+		self._origin: dict[int, tuple[int, int]] = dict()
+		# evicted whole files are demoted there instead of being deleted (optional)
+		self.tier2: Optional[SecondTier] = None
+
+	@property
+	def in_cache(self) -> Mapping[Hashable, int]:
+		"""cached ino -> reserved size"""
+		return self.policy.sizes
+
+	# space accounting
+	@property
+	def capacity(self) -> int:
+		"""bytes the cache may use right now, at most `maxCacheSize`"""
+		return min(self.maxCacheSize, self._fsLimit)
+
+	def allocated(self, nbytes: int) -> int:
+		""":returns: `nbytes` rounded up to whole blocks of the cache filesystem"""
+		return -(-nbytes // self.blockSize) * self.blockSize
+
+	def refresh_fs_limit(self, fs_free: Optional[int] = None) -> None:
+		""":param fs_free: available bytes on the cache filesystem (statvfs'd if None)"""
+		if fs_free is None:
+			fs_stat = statvfs(self.cacheDir)
+			fs_free = fs_stat.f_bavail * fs_stat.f_frsize
+		self._fsLimit = self._current_CacheSize + fs_free
+
+	def resize(self, key: Hashable, size: int) -> int:
+		"""
+		Charges `size` bytes for the cached `key` from now on without counting it as an access
+		:returns: difference to what was charged before
+		"""
+		old_size: Optional[int] = self.in_cache.get(key)
+		if old_size is None:
+			return 0
+		self.policy.on_resize(key, size)
+		self._current_CacheSize += size - old_size
+		return size - old_size
+
+	# access order
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self.policy
+
+	def touch(self, key: Hashable) -> None:
+		"""Tells the eviction policy that `key` was accessed (no-op if it isn't cached)"""
+		self.policy.on_access(key)
+
+	def victim(self, skip: Optional[Container[Hashable]] = None) -> Optional[Hashable]:
+		"""
+		:param skip: keys which can't be evicted right now (e.g. open or dirty files), see `BusyKeys`
+		:returns: the next key to evict according to the policy or None if there is none
+		"""
+		return self.policy.victim(skip)
 
 	# fullness of cache
 	def __le__(self, other: int) -> bool:
@@ -48,11 +160,19 @@ class Cache(InodeTranslator):
 	def __ge__(self, other: int) -> bool:
 		return other >= self.maxCacheSize
 
+	def usage(self) -> float:
+		"""fraction of the cache in use [0.0, 1.0]"""
+		return self._current_CacheSize / self.capacity
+
+	def hasRoom(self, size: int) -> bool:
+		"""Fit `size` more bytes below the high watermark? (otherwise storing them makes something else go)"""
+		return self._current_CacheSize + size <= self._cacheThreshold * self.capacity
+
 	def isFull(self, use_threshold: bool = False) -> bool:
 		def isFilledBy(percent: float) -> bool:
 			""":param percent: between [0.0, 1.0]"""
 			assert 0.0 <= percent <= 1.0, 'disk_isFullBy: needs to be [0-1]'
-			diskUsage = self._current_CacheSize / self.maxCacheSize
+			diskUsage = self._current_CacheSize / self.capacity
 			return True if diskUsage >= percent else False
 
 		percentage = self._cacheThreshold if use_threshold else 1.0
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# job of this module:
+#  - copy file contents between cache and source without dragging every byte through python buffers
+#  - clone files (reflink) if cache and source live on the same filesystem
+#  - keep holes of sparse files instead of filling them with zeros
+
+import errno
+import fcntl
+import logging
+import os
+from typing import Final, Iterator
+
+from src.libwolfs.util import Path_str
+
+log = logging.getLogger(__name__)
+
+# <linux/fs.h>: _IOW(0x94, 9, int)
+FICLONE: Final[int] = 0x40049409
+
+# errnos meaning "this way of copying doesn't work here", anything else is a real error
+_UNSUPPORTED: Final[frozenset[int]] = frozenset(
+	{errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.ETXTBSY})
+
+# switched off for the rest of the run once the kernel (or filesystem) refused them
+use_copy_file_range: bool = hasattr(os, 'copy_file_range')
+use_sendfile: bool = hasattr(os, 'sendfile')
+use_reflink: bool = True
+
+
+def reflink(fd_src: int, fd_dst: int) -> bool:
+	"""
+	Lets `fd_dst` share the extents of `fd_src` (btrfs, xfs, ...), both have to be on the same filesystem.
+	:returns: False if cloning isn't possible
+	"""
+	global use_reflink
+	if not use_reflink or os.fstat(fd_src).st_dev != os.fstat(fd_dst).st_dev:
+		return False
+	try:
+		fcntl.ioctl(fd_dst, FICLONE, fd_src)
+		return True
+	except OSError as exc:
+		if exc.errno not in _UNSUPPORTED:
+			raise
+		if exc.errno in (errno.ENOSYS, errno.ENOTTY):
+			use_reflink = False
+		return False
+
+
+def copy_range(fd_src: int, fd_dst: int, offset: int, length: int) -> int:
+	"""
+	Copies [offset, offset + length) of `fd_src` to the same offset in `fd_dst`
+	(copy_file_range -> sendfile -> pread/pwrite, whatever works first)
+	:returns: copied bytes, less than `length` if `fd_src` ends earlier
+	"""
+	global use_copy_file_range, use_sendfile
+	copied: int = 0
+	if use_copy_file_range:
+		try:
+			while copied < length:
+				n = os.copy_file_range(fd_src, fd_dst, length - copied, offset + copied, offset + copied)
+				if n == 0:
+					return copied
+				copied += n
+			return copied
+		except OSError as exc:
+			if exc.errno not in _UNSUPPORTED:
+				raise
+			if exc.errno == errno.ENOSYS:
+				use_copy_file_range = False
+			log.debug(f'copy_file_range failed ({exc}), falling back to sendfile')
+
+	if use_sendfile:
+		try:
+			os.lseek(fd_dst, offset + copied, os.SEEK_SET)
+			while copied < length:
+				n = os.sendfile(fd_dst, fd_src, offset + copied, length - copied)
+				if n == 0:
+					return copied
+				copied += n
+			return copied
+		except OSError as exc:
+			if exc.errno not in _UNSUPPORTED:
+				raise
+			if exc.errno == errno.ENOSYS:
+				use_sendfile = False
+
+	while copied < length:
+		data = os.pread(fd_src, min(length - copied, 1024 * 1024), offset + copied)
+		if not data:
+			break
+		os.pwrite(fd_dst, data, offset + copied)
+		copied += len(data)
+	return copied
+
+
+def data_segments(fd: int, size: int) -> Iterator[tuple[int, int]]:
+	"""(offset, length) of the parts of `fd` which aren't holes, everything if the filesystem can't tell"""
+	offset: int = 0
+	while offset < size:
+		try:
+			start = os.lseek(fd, offset, os.SEEK_DATA)
+		except OSError as exc:
+			if exc.errno == errno.ENXIO:
+				return  # only a hole left
+			if exc.errno not in _UNSUPPORTED:
+				raise
+			yield offset, size - offset
+			return
+		end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+		yield start, end - start
+		offset = end
+
+
+def copy_file(src: Path_str, dst: Path_str) -> None:
+	"""Copies the contents of `src` into `dst` (created or truncated), holes stay holes. Attributes aren't copied"""
+	fd_src = os.open(src, os.O_RDONLY)
+	try:
+		fd_dst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+		try:
+			if reflink(fd_src, fd_dst):
+				return
+			size: int = os.fstat(fd_src).st_size
+			os.ftruncate(fd_dst, size)
+			for offset, length in data_segments(fd_src, size):
+				copy_range(fd_src, fd_dst, offset, length)
+		finally:
+			os.close(fd_dst)
+	finally:
+		os.close(fd_src)
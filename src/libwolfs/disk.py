@@ -19,13 +19,21 @@ import logging
 from pyfuse3 import FUSEError, StatvfsData
 from src.libwolfs.util import Col, Path_str
 from src.libwolfs.errors import NotEnoughSpaceError, SOFTLINK_DISABLED_ERROR
-from typing import Union
-from src.libwolfs.cache import Cache
-from math import floor, ceil
+from typing import Callable, Container, Final, Hashable, Iterator, Optional, Union
+from src.libwolfs.cache import BusyKeys, Cache
+from src.libwolfs.blockmap import BlockMap, punch_hole
+from src.libwolfs.copyengine import copy_file, copy_range
+from src.libwolfs.manifest import Manifest, ManifestEntry
+from src.libwolfs.tier2 import move
+from math import floor
 
 log = logging.getLogger(__name__)
 
+# what `Disk.release` frees: (cache path, offset, length, new sidecar content, path in the second tier to demote to)
+ReleasePlan = tuple[str, int, int, Optional[bytes], Optional[str]]
+
 class Disk(Cache):
+	PARTIAL_SUFFIX: Final[str] = '.wolfs-partial'
 
 	# ==========
 	# public api
@@ -66,9 +74,10 @@ class Disk(Cache):
 		# block related
 		stat.f_blocks = floor(self.maxCacheSize // stat.f_frsize)
 
-		assert self.maxCacheSize >= self._current_CacheSize
-		stat.f_bfree = floor((self.maxCacheSize // stat.f_bsize)) - ceil(self._current_CacheSize // stat.f_bsize)
-		stat.f_bavail = floor((self.maxCacheSize - self._current_CacheSize) // stat.f_bsize)
+		# the cache filesystem itself might have less room left than our own limit
+		free: int = max(0, self.capacity - self._current_CacheSize)
+		stat.f_bfree = min(stat.f_blocks, floor(free // stat.f_frsize))
+		stat.f_bavail = stat.f_bfree
 
 		# inode related (translator)
 		assert stat.f_blocks * stat.f_frsize == self.maxCacheSize
@@ -79,7 +88,7 @@ class Disk(Cache):
 		"""Does the cache have room  for `path` ?"""
 		if isinstance(size_or_path, int):
 			size: int = size_or_path
-			return (size + self._current_CacheSize) < self.maxCacheSize
+			return (size + self._current_CacheSize) <= self.capacity
 
 		elif isinstance(size_or_path, Path):
 			path: Path = size_or_path
@@ -95,95 +104,158 @@ class Disk(Cache):
 				in_between_dir_sizes += self.MIN_DIR_SIZE
 				cpath = cpath.parent
 
-			cache_size = in_between_dir_sizes + os.path.getsize(src) + self._current_CacheSize
-			return cache_size <= self.maxCacheSize
+			cache_size = in_between_dir_sizes + self.estimate(src) + self._current_CacheSize
+			return cache_size <= self.capacity
 
 		assert False, f'{self}: Types are wrong: {size_or_path}({type(size_or_path)}) not in [Path, str, FileInfo]'
 
 	# Book-Keeping related
 
-	def track(self, path: str, reuse_ino=0) -> int:
+	def track(self, path: str, reuse_ino=0, size: Optional[int] = None) -> int:
 		"""
-		Add `path` to internal filing structure and reserve its disk space
+		Add `path` to internal filing structure and reserve its disk space.
+		Tracking an already tracked path just updates its size and marks it as most recently used.
 		reuse_ino: re-use an old inode
+		size: charge this instead of measuring (or estimating) it
 		"""
 
-		# handling of create and mkdir (files don't exist yet so os.stat(path_) will throw an error)
-		path_: str = self.toSrc(path).__str__()
-		if not os.path.exists(path_):
-			path_ = self.toTmp(path).__str__()
-
-		# get info about tracked file
-		timestamp: int = getattr(os.stat(path_), self.time_attr) // self.__NANOSEC_PER_SEC__
-		size: int = os.path.getsize(path_)
-		src_path: str = self.toSrc(path).__str__()
+		src_path: str = self.toSrc_str(path)
+		cpath: str = self.toTmp_str(path)
 		ino: int = self.path_to_ino(src_path, reuse_ino=reuse_ino)
-		tracked_path = self.in_cache.get(timestamp)
-
-		# save meta info
-		assert isinstance(tracked_path, list) or isinstance(tracked_path, tuple) or tracked_path is None, "Type mismatch!"
-		if isinstance(tracked_path, list):
-			self.in_cache[timestamp].append((src_path, size))
-		elif isinstance(tracked_path, tuple):
-			self.in_cache[timestamp] = [self.in_cache[timestamp]] + [(src_path, size)]
-		else:
-			self.in_cache[timestamp] = (src_path, size)
+		if self.chunkSize and not os.path.isdir(cpath):
+			# chunked files are accounted chunk by chunk (see fetch_chunks)
+			return ino
+		# files not copied (completely) yet are charged what they might take (see `recharge` once they are complete)
+		if size is None:
+			copied: bool = os.path.lexists(cpath) and not Disk.is_partial(cpath)
+			size = Disk.allocation(cpath) if copied else self.estimate(src_path)
 
 		# update bookkeeping
-		self.path_timestamp[src_path] = timestamp
-		self._cached_inos.add(ino)
-		self._current_CacheSize += size
+		old_size: int = self.in_cache.get(ino, 0)
+		self.policy.on_insert(ino, size)
+		self._current_CacheSize += size - old_size
+		# a new entry might have made its directory grow
+		parent: Optional[int] = self.lookup_ino(os.path.dirname(src_path))
+		if parent is not None and parent != ino and parent in self.in_cache:
+			self.resize(parent, Disk.allocation(os.path.dirname(cpath)))
 		return ino
 
 	def untrack(self, path: str) -> None:
 		"""Doesn't track `path` anymore and frees up its reserved size. Can be seen as a 'delete'"""
-		src_path: str = self.toSrc(path).__str__()
-		timestamp = self.path_timestamp.get(src_path)
-		if timestamp is None:
+		ino: Optional[int] = self.lookup_ino(self.toSrc_str(path))
+		if ino is None:
 			return
+		self.untrack_ino(ino)
+		if self.chunkSize:
+			block_map = self._block_maps.pop(ino, None)
+			for idx in block_map if block_map is not None else ():
+				self.untrack_key((ino, idx))
+			self._unsaved_maps.discard(ino)
+			BlockMap.remove(self.toTmp_str(path))
+
+	def untrack_ino(self, ino: int, evicted: bool = False) -> None:
+		""":param evicted: `ino` was removed to make room and not deleted"""
+		self.untrack_key(ino, evicted)
+		self._origin.pop(ino, None)
 
-		i: int = 0
+	@staticmethod
+	def allocation(path: Path_str) -> int:
+		""":returns: bytes `path` takes up on disk"""
+		return os.lstat(path).st_blocks * Disk.ST_BLOCK_SIZE
 
-		# assign references for a bit of a speedup / readablity
-		in_cache = self.in_cache
+	def estimate(self, src: Path_str) -> int:
+		"""
+		:returns: bytes a copy of the source file `src` might take up in the cache. Holes might stay holes
+		  in the copy but the source filesystem could be compressed, so its st_blocks can't be trusted
+		"""
+		if os.path.isdir(src):
+			return self.MIN_DIR_SIZE
+		return self.allocated(os.path.getsize(src))
 
-		try:
-			# getting the correct item by type
-			og_item: Union[tuple[str, int], list[tuple[str, int]]] = in_cache[timestamp]
-			if isinstance(og_item, list):
-				i = [y[0] for y in og_item].index(src_path)
-				item = og_item[i]
-			else:
-				item = og_item
-			(t_path, size) = item[0], item[1]
-
-			# actual clean up
-			if isinstance(og_item, list):
-				del og_item[i]
-				if len(in_cache) == 0:
-					del in_cache[timestamp]
-			else:
-				del in_cache[timestamp]
+	def recharge(self, ino: int, fd: Optional[int] = None) -> int:
+		"""
+		Charges what the cache file of `ino` takes up right now, call after writing/truncating it
+		:param fd: open file descriptor of the cache file (saves a path lookup)
+		:returns: difference to what was charged before
+		"""
+		if ino not in self.in_cache:
+			return 0
+		blocks: int = os.fstat(fd).st_blocks if fd is not None else os.lstat(self.ino_toTmp_str(ino)).st_blocks
+		return self.resize(ino, blocks * Disk.ST_BLOCK_SIZE)
+
+	def reserve_write(self, ino: int, end: int, busy_inos: Optional[Container[int]] = None) -> None:
+		"""Makes room before a write up to `end` grows the cache file of `ino` (whole files only)"""
+		growth: int = self.allocated(end) - self.in_cache.get(ino, 0)
+		if growth > 0:
+			self.make_room(growth, busy_inos)
+
+	def accounting_snapshot(self) -> list[tuple[Hashable, str, int]]:
+		""":returns: (ino, cache path, charged size) of every whole file and directory for `reconcile`"""
+		return [(key, self.ino_toTmp_str(key), size)  # type: ignore
+				for key, size in self.in_cache.items() if not isinstance(key, tuple)]
 
-			del self.path_timestamp[src_path]
-			self._cached_inos.remove(self.path_to_ino(src_path))
+	@staticmethod
+	def measure(cpaths: list[str], cacheDir: Path_str) -> tuple[list[Optional[int]], int]:
+		"""
+		Takes the real disk usage of `cpaths` (None if gone or still being copied), safe to call from a worker thread
+		:returns: their usage and the available bytes of the cache filesystem
+		"""
+		measured: list[Optional[int]] = []
+		for cpath in cpaths:
+			try:
+				measured.append(None if Disk.is_partial(cpath) else Disk.allocation(cpath))
+			except OSError:
+				measured.append(None)
+		fs_stat = os.statvfs(cacheDir)
+		return measured, fs_stat.f_bavail * fs_stat.f_frsize
+
+	def reconcile(self, snapshot: list[tuple[Hashable, str, int]], measured: list[Optional[int]],
+				  fs_free: int) -> int:
+		"""
+		Corrects the accounting by what `measure` found (entries which changed in the meantime are skipped)
+		:returns: corrected bytes
+		"""
+		drift: int = 0
+		for (key, _, charged), size in zip(snapshot, measured):
+			if size is not None and size != charged and self.in_cache.get(key) == charged:
+				drift += abs(self.resize(key, size))
+		self.refresh_fs_limit(fs_free)
+		if drift:
+			log.info(f'Reconciled cache accounting by {Col(drift)} bytes. {self.getSummary()}')
+		return drift
+
+	def note_origin(self, ino: int, src: Path_str, origin: Optional[tuple[int, int]] = None) -> None:
+		"""
+		Remembers which version of the source `ino` was cached from (call after copying or syncing it)
+		:param origin: `Disk.origin(src)` taken earlier, e.g. in a worker thread
+		"""
+		self._origin[ino] = Disk.origin(src) if origin is None else origin
+
+	@staticmethod
+	def origin(src: Path_str) -> tuple[int, int]:
+		""":returns: (size, mtime) `revalidate` compares the source against"""
+		stat = os.stat(src)
+		return stat.st_size, stat.st_mtime_ns
+
+	def untrack_key(self, key: Hashable, evicted: bool = False) -> None:
+		""":param key: ino of a whole file or (ino, chunk index)"""
+		size: Optional[int] = self.in_cache.get(key)
+		if size is not None:
+			self.policy.on_remove(key, evicted)
 			self._current_CacheSize -= size
-		except KeyError as e:
-			log.error("KeyError Exception that shouldnt have happened happened")
-			log.exception(e)
 
 	# todo: think about making a write cache for newly created files -> store write_ops
 	#       check after a timeout if said files still exist or are still referenced if not
 	#       then they were tempfiles anyway otherwise sync them to the backend
-	def cp2Cache(self, path: Path, force: bool = False, open_paths: list[Path] = None) -> Path:
+	def cp2Cache(self, path: Path, force: bool = False, busy_inos: Optional[Container[int]] = None) -> Path:
 		"""
 		:param path: file/dir to be copied
 		:param force: Delete files if necessary
-		:param open_paths: paths which have an open file descriptor and can't be closed as they are in use
+		:param busy_inos: inodes which have an open file descriptor or are dirty and can't be deleted
 		:raises NotEnoughSpaceError: If there isn't enough space to save `path` and `force` wasn't set
 		:raises FUSEError(errno.EDQUOT): if all non-open files were deleted and there still isn't enough room for `path`
 		:returns: Cache path of copied file/dir
-		Copy `file` and its meta-data into Cache. If `force` is set it deletes least recently used files until enough space is available.
+		Copy `file` and its meta-data into Cache. If `force` is set it evicts files chosen by the eviction policy until enough space is available.
 
 		Note:
 		  Make sure to sync the cache and remote before copying if using `force` as it could potentially delete
@@ -191,21 +263,17 @@ class Disk(Cache):
 		  calls assert if this happens at the moment
 		"""
 		assert self.toSrc(path) == path, f"{path} doesn't have {self.sourceDir} prefix"
-		self.__make_room_for_path(force, path, open_paths)
+		self.__make_room_for_path(force, path, busy_inos)
 
 		if self.canStore(path):
 			dest = self.toTmp(path)
-			addedDirsSize, addedFolders = self.__cp_path(path, dest)
-			self._current_CacheSize += addedDirsSize
-			# folders which are created by cp2Dir are untracked and should be tracked...
-			# elements in cache doesn't model reality (too few entries too many undocumented)
+			_, addedFolders = self.__cp_path(path, dest)
+			# in between folders created on the way are tracked as well (track reserves their size)
 			for parent in addedFolders:
-				self.path_to_ino(parent)
 				self.track(parent.__str__())
-
-			if addedDirsSize == 0:
-				self.path_to_ino(dest)
-				self.track(path.__str__())
+			ino = self.track(path.__str__())
+			if not path.is_dir():
+				self.note_origin(ino, path)
 
 			# TODO: use xattributes later and make a custom field:
 			# sth like __wolfs_atime__ : time.time_ns()
@@ -216,44 +284,501 @@ class Disk(Cache):
 		else:
 			raise NotEnoughSpaceError('Not enough space')
 
-	def __make_room_for_path(self, force: bool, path: Path, open_paths: list[Path] = None) -> None:
-		def get_head_in_cache(self) -> tuple[str, int]:
-			item: Union[tuple[str, int], list[tuple[str, int]]] = self.in_cache.peekitem(index=0)[1]
-			if isinstance(item, list):
-				item = item[0]
-			src_path, size = item[0], item[1]
-			return src_path, size
+	def prepare_stream(self, path: Path, busy_inos: Optional[Container[int]] = None, force: bool = True) -> Path:
+		"""
+		Like `cp2Cache(path, force)` but only reserves the space and creates a sparse cache file of full size,
+		the data is copied by the `Streamer`. A marker next to the cache file flags it as incomplete until
+		`finish_stream` (a crash mid copy must not leave a file which looks cached)
+		:raises NotEnoughSpaceError: If there isn't enough space to save `path` and `force` wasn't set
+		:returns: Cache path of the file
+		"""
+		assert self.toSrc(path) == path, f"{path} doesn't have {self.sourceDir} prefix"
+		self.__make_room_for_path(force, path, busy_inos)
+		if not self.canStore(path):
+			raise NotEnoughSpaceError('Not enough space')
+
+		dest: Path = self.toTmp(path)
+		if not dest.parent.exists():
+			_, addedFolders = self.mkdir_p(path.parent)
+			for parent in addedFolders:
+				self.track(parent.__str__())
+		open(Disk.partial_marker(dest), 'wb').close()
+		with open(dest, 'wb') as f:
+			f.truncate(os.path.getsize(path))
+		Disk.copystat(path, dest)
+		self.note_origin(self.track(path.__str__()), path)
+		return dest
+
+	def prepare_promotion(self, ino: int, origin: tuple[int, int], busy_inos: Optional[Container[int]] = None) -> Path:
+		"""
+		Like `prepare_stream` for a file coming back from the second tier, its source isn't touched
+		(apart from its parent directories if they aren't cached). Copy it with `promote`
+		:param origin: (size, mtime) of the source version of the demoted copy
+		"""
+		size: int = self.allocated(origin[0])
+		self.make_room(size, busy_inos)
+		dest: Path = self.ino_toTmp(ino)
+		if not dest.parent.exists():
+			_, addedFolders = self.mkdir_p(self.toSrc(dest.parent))
+			for parent in addedFolders:
+				self.track(parent.__str__())
+		open(Disk.partial_marker(dest), 'wb').close()
+		self.track(dest.__str__(), size=size)
+		self._origin[ino] = origin
+		return dest
+
+	@staticmethod
+	def promote(demoted: str, dst: Path_str) -> None:
+		"""Moves a demoted copy into the cache file `prepare_promotion` made, safe to call from a worker thread"""
+		move(demoted, dst)
+		os.remove(Disk.partial_marker(dst))
+
+	@staticmethod
+	def partial_marker(cpath: Path_str) -> str:
+		return f'{cpath}{Disk.PARTIAL_SUFFIX}'
+
+	@staticmethod
+	def is_partial(cpath: Path_str) -> bool:
+		""":returns: True if the copy of `cpath` didn't finish (yet)"""
+		return os.path.exists(Disk.partial_marker(cpath))
+
+	@staticmethod
+	def finish_stream(src: Path_str, dst: Path_str) -> None:
+		Disk.copystat(src, dst)
+		os.remove(Disk.partial_marker(dst))
+
+	@staticmethod
+	def fill(src: Path_str, dst: Path_str) -> None:
+		"""Copies `src` into the cache file `prepare_stream` made for it in one go, safe to call from a worker thread"""
+		copy_file(src, dst)
+		Disk.finish_stream(src, dst)
+
+	def drop_partial(self, cpath: Path_str) -> None:
+		"""Deletes an incomplete cache file and frees its space"""
+		for path in (cpath, Disk.partial_marker(cpath)):
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+		self.untrack(str(cpath))
 
-		if open_paths is None:
-			open_paths = []
+	def evict(self, ino: int) -> int:
+		"""
+		Drops the cache file of the regular file `ino` on demand (whole or chunked, the caller makes sure it isn't busy)
+		:returns: freed bytes
+		"""
+		cpath: str = self.ino_toTmp_str(ino)
+		used: int = self._current_CacheSize
+		self.untrack(cpath)
+		if self.tier2 is not None:
+			self.tier2.discard(self.toRoot(cpath))
+		for path in (cpath, Disk.partial_marker(cpath)):
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+		return used - self._current_CacheSize
+
+	def resident(self, ino: int) -> int:
+		""":returns: bytes of the regular file `ino` which can be read from the cache right now (never fetches)"""
+		cpath: str = self.ino_toTmp_str(ino)
+		if not os.path.exists(cpath) or Disk.is_partial(cpath):
+			return 0
+		if not self.chunkSize:
+			return os.path.getsize(cpath)
+		block_map = self.block_map(ino)
+		file_size: int = os.path.getsize(cpath)
+		return sum(block_map.span(idx, file_size)[1] for idx in block_map)
+
+	def __make_room_for_path(self, force: bool, path: Path, busy_inos: Optional[Container[int]] = None) -> None:
+		"""Evicts inodes chosen by the eviction policy (skipping `busy_inos`) until `path` fits"""
+		busy: BusyKeys = BusyKeys.of(busy_inos)
 		while force and not self.canStore(path):
+			self.__evict_one(busy, path)
+
+	def make_room(self, nbytes: int, busy_inos: Optional[Container[int]] = None) -> None:
+		"""Evicts keys chosen by the eviction policy (skipping `busy_inos`) until `nbytes` more fit"""
+		busy: BusyKeys = BusyKeys.of(busy_inos)
+		while not self.canStore(nbytes):
+			self.__evict_one(busy, nbytes)
+
+	def __evict_one(self, busy: BusyKeys, needed_for: Union[Path, int]) -> None:
+		victim: Optional[Hashable] = self.victim(skip=busy)
+		if victim is None:
+			log.warning(f"Deleted all non open files and still couldn't store: {needed_for}")
+			raise FUSEError(errno.EDQUOT)
+
+		if isinstance(victim, tuple):
+			Disk.release(*self.detach(victim))
+			return
+
+		cpath: str = self.ino_toTmp_str(victim)
+		if self.tier2 is not None and os.path.isfile(cpath):
+			Disk.release(*self.detach(victim))  # demotes it
+			return
+		try:
+			if os.path.isdir(cpath):
+				os.rmdir(cpath)
+			elif os.path.lexists(cpath):
+				os.remove(cpath)
+			else:
+				log.warning(f'File {Col(cpath)} not in cache although it should be ?')
+		except OSError:
+			# directory isn't empty -> keep it tracked, move it out of the way and try the next one
+			self.touch(victim)
+			busy.add(victim)
+			return
+		self.untrack_ino(victim, evicted=True)
+
+	def detach(self, key: Hashable) -> ReleasePlan:
+		"""
+		Untracks the victim `key` (no directories) and tells what has to be freed on disk (see `release`)
+		:returns: (cache path, offset, length, new sidecar content, demotion target); length is -1 for whole files
+		"""
+		if isinstance(key, tuple):
+			ino, idx = key
+			block_map = self.block_map(ino)
+			block_map.discard(idx)
+			self.untrack_key(key, evicted=True)
+			return self.ino_toTmp_str(ino), idx * self.chunkSize, self.chunkSize, block_map.dump(), None
+
+		cpath: str = self.ino_toTmp_str(key)  # type: ignore
+		demote_to: Optional[str] = self.__demotion_target(key, cpath)  # type: ignore
+		self.untrack_ino(key, evicted=True)  # type: ignore
+		return cpath, 0, -1, None, demote_to
+
+	def __demotion_target(self, ino: int, cpath: str) -> Optional[str]:
+		"""reserves room for the evicted whole file `ino` in the second tier, None if it is deleted instead"""
+		origin = self._origin.get(ino)
+		# files never synced can't be checked against their source later on, chunks aren't demoted
+		if self.tier2 is None or self.chunkSize or origin is None or Disk.is_partial(cpath):
+			return None
+		return self.tier2.admit(self.toRoot(cpath), self.in_cache[ino], origin)
+
+	@staticmethod
+	def release(cpath: str, offset: int, length: int, block_map: Optional[bytes], demote_to: Optional[str] = None) -> None:
+		"""Frees what `detach` returned, safe to call from a worker thread"""
+		try:
+			if length < 0 and demote_to is not None:
+				try:
+					move(cpath, demote_to)
+				except OSError as exc:
+					# the tier drops the copy once it notices it is missing
+					log.warning(f'Could not demote {cpath}: {exc}')
+					os.remove(cpath)
+				return
+			if length < 0:
+				os.remove(cpath)
+				return
+
+			fd = os.open(cpath, os.O_WRONLY)
 			try:
-				(src_path, size) = get_head_in_cache(self)
-				#assert timestamp in self.path_timestamp
-				self.untrack(src_path)
-			except IndexError:
-				log.warning(f"Deleted all non open files and still couldn't store file: {path}")
-				raise FUSEError(errno.EDQUOT)
+				# bitmap first: a chunk marked missing which is still there is harmless, the other way round isn't
+				assert block_map is not None
+				BlockMap.write(cpath, block_map)
+				if not punch_hole(fd, offset, length):
+					log.warning(f'{cpath}: filesystem of the cache dir can\'t punch holes, space stays allocated')
+			finally:
+				os.close(fd)
+		except FileNotFoundError:
+			pass
+
+	# Chunked mode
+	# ============
+
+	def block_map(self, ino: int) -> BlockMap:
+		"""presence bitmap of the sparse cache file of `ino` (chunks cached by an earlier mount are re-tracked)"""
+		block_map = self._block_maps.get(ino)
+		if block_map is None:
+			cpath = self.ino_toTmp_str(ino)
+			src = self.toSrc_str(cpath)
+			block_map = BlockMap.load(cpath, self.chunkSize, os.path.getsize(src) if os.path.exists(src) else 0)
+			self._block_maps[ino] = block_map
+			file_size = os.path.getsize(cpath)
+			for idx in block_map:
+				self.__track_chunk(ino, idx, block_map.span(idx, file_size)[1])
+		return block_map
+
+	def prepare_sparse(self, ino: int, size: int) -> str:
+		"""
+		Creates an empty sparse cache file of `size` bytes (and its parent directories) for `ino`.
+		Data is fetched chunk by chunk later on.
+		:returns: cache path
+		"""
+		cpath: str = self.ino_toTmp_str(ino)
+		if os.path.exists(cpath):
+			return cpath
 
-			cpath: Path = Path(self.toTmp(src_path))
+		src: Path = self.toSrc(cpath)
+		if not os.path.exists(os.path.dirname(cpath)):
+			_, addedFolders = self.mkdir_p(src.parent)
+			for parent in addedFolders:
+				self.track(parent.__str__())
+		with open(cpath, 'wb') as f:
+			f.truncate(size)
+		Disk.copystat(src, cpath)
+		self.note_origin(ino, src)
+
+		self.init_block_map(ino, size)
+		return cpath
+
+	def init_block_map(self, ino: int, source_size: int) -> BlockMap:
+		"""Starts an empty bitmap for a new cache file of `ino` (a left over sidecar describes an old file)"""
+		cpath: str = self.ino_toTmp_str(ino)
+		old_map = self._block_maps.get(ino)
+		for idx in old_map if old_map is not None else ():
+			self.untrack_key((ino, idx))
+		block_map = self._block_maps[ino] = BlockMap(self.chunkSize, source_size)
+		BlockMap.remove(cpath)
+		self._unsaved_maps.add(ino)
+		return block_map
+
+	def has_range(self, ino: int, offset: int, length: int) -> bool:
+		"""Is [offset, offset + length) of `ino` completely cached?"""
+		return not self.block_map(ino).missing(offset, length)
+
+	def fetch_chunks(self, ino: int, offset: int, length: int, busy_inos: Optional[Container[int]] = None) -> int:
+		"""
+		Copies the missing chunks of [offset, offset + length) from the source into the sparse cache file
+		and marks the cached ones as accessed (`reserve_chunks` + `copy_chunks` + `commit_chunks` in one go)
+		:param busy_inos: see `BusyKeys`, chunks of clean open files may be evicted
+		:returns: fetched bytes
+		"""
+		block_map = self.block_map(ino)
+		spans = self.reserve_chunks(ino, block_map.missing(offset, length), offset, length, busy_inos)
+		if not spans:
+			return 0
+		try:
+			Disk.copy_chunks(self.toSrc_str(self.ino_toTmp_str(ino)), self.ino_toTmp_str(ino), spans)
+		except OSError:
+			self.unreserve_chunks(ino, spans)
+			raise
+		self.commit_chunks(ino, spans)
+		return sum(chunk_len for _, _, chunk_len in spans)
+
+	def reserve_chunks(self, ino: int, chunks: list[int], offset: int, length: int,
+					   busy_inos: Optional[Container[int]] = None) -> list[tuple[int, int, int]]:
+		"""
+		Marks the chunks of [offset, offset + length) as accessed and makes room for `chunks`
+		(chunks of the range are never evicted for it). Their space is accounted from here on, they count as
+		present once `commit_chunks` was called
+		:returns: (index, offset, length) of `chunks`
+		"""
+		block_map = self.block_map(ino)
+		for idx in block_map.chunks(offset, length):
+			self.touch((ino, idx))
+		if not chunks:
+			return []
+
+		spans = [(idx, *block_map.span(idx, block_map.source_size)) for idx in chunks]
+		busy: BusyKeys = BusyKeys.of(busy_inos)
+		for idx in block_map.chunks(offset, length):
+			busy.add((ino, idx))
+		self.make_room(sum(self.allocated(chunk_len) for _, _, chunk_len in spans), busy)
+		for idx, _, chunk_len in spans:
+			self.__track_chunk(ino, idx, chunk_len)
+		return spans
 
-			# skip open files (we can't sync and close them as they might be written / read from)
-			if cpath in open_paths:
+	@staticmethod
+	def copy_chunks(src: str, cpath: str, spans: list[tuple[int, int, int]]) -> None:
+		"""Copies the chunks `reserve_chunks` returned, safe to call from a worker thread"""
+		fd_src, fd_cache = os.open(src, os.O_RDONLY), os.open(cpath, os.O_WRONLY)
+		try:
+			for _, chunk_offset, chunk_len in spans:
+				copy_range(fd_src, fd_cache, chunk_offset, chunk_len)
+		finally:
+			os.close(fd_src)
+			os.close(fd_cache)
+
+	def commit_chunks(self, ino: int, spans: list[tuple[int, int, int]]) -> None:
+		block_map = self.block_map(ino)
+		for idx, _, _ in spans:
+			block_map.add(idx)
+		self._unsaved_maps.add(ino)
+
+	def unreserve_chunks(self, ino: int, spans: list[tuple[int, int, int]]) -> None:
+		"""Gives the space of chunks back which couldn't be copied"""
+		for idx, _, _ in spans:
+			self.untrack_key((ino, idx))
+
+	def write_edges(self, ino: int, offset: int, length: int) -> list[tuple[int, int]]:
+		"""(offset, length) of the missing chunks a write to [offset, offset + length) only partially covers"""
+		block_map = self.block_map(ino)
+		chunks = block_map.chunks(offset, length)
+		edges: list[tuple[int, int]] = []
+		for idx in sorted({chunks[0], chunks[-1]}) if chunks else ():
+			chunk_offset, chunk_len = block_map.span(idx, block_map.source_size)
+			partially_covered = offset > chunk_offset or offset + length < chunk_offset + chunk_len
+			if partially_covered and idx not in block_map and chunk_len:
+				edges.append((chunk_offset, chunk_len))
+		return edges
+
+	def claim_chunks(self, ino: int, offset: int, length: int, busy_inos: Optional[Container[int]] = None) -> None:
+		"""Marks the chunks a write completely overwrites as present without fetching them (see `write_edges`)"""
+		block_map = self.block_map(ino)
+		claimed = [idx for idx in block_map.chunks(offset, length) if idx not in block_map]
+		if not claimed:
+			return
+		new_size = max(os.path.getsize(self.ino_toTmp_str(ino)), offset + length)
+		spans = [block_map.span(idx, new_size) for idx in claimed]
+		self.make_room(sum(self.allocated(chunk_len) for _, chunk_len in spans), busy_inos)
+		for idx, (_, chunk_len) in zip(claimed, spans):
+			block_map.add(idx)
+			self.__track_chunk(ino, idx, chunk_len)
+		self._unsaved_maps.add(ino)
+
+	def prepare_write(self, ino: int, offset: int, length: int, busy_inos: Optional[Container[int]] = None) -> None:
+		"""
+		Read-modify-write for chunked files: chunks only partially covered by the write are fetched first,
+		completely overwritten ones are just claimed.
+		"""
+		for chunk_offset, chunk_len in self.write_edges(ino, offset, length):
+			self.fetch_chunks(ino, chunk_offset, chunk_len, busy_inos)
+		self.claim_chunks(ino, offset, length, busy_inos)
+
+	def truncate_chunks(self, ino: int, size: int, busy_inos: Optional[Container[int]] = None) -> None:
+		"""Call before truncating the cache file of `ino` to `size`"""
+		block_map = self.block_map(ino)
+		if size % self.chunkSize:
+			# keep the head of the last chunk
+			self.fetch_chunks(ino, size - size % self.chunkSize, size % self.chunkSize, busy_inos)
+		for idx in block_map.truncate(size):
+			self.untrack_key((ino, idx))
+		self._unsaved_maps.add(ino)
+
+	def flush_block_map(self, ino: int) -> None:
+		"""Persists the bitmap of `ino` once its chunks are durable"""
+		if ino not in self._unsaved_maps:
+			return
+		self._unsaved_maps.discard(ino)
+		cpath: str = self.ino_toTmp_str(ino)
+		fd = os.open(cpath, os.O_RDONLY)
+		try:
+			os.fdatasync(fd)
+		finally:
+			os.close(fd)
+		self._block_maps[ino].save(cpath)
+
+	def __track_chunk(self, ino: int, idx: int, size: int) -> None:
+		key = (ino, idx)
+		size = self.allocated(size)
+		old_size: int = self.in_cache.get(key, 0)
+		self.policy.on_insert(key, size)
+		self._current_CacheSize += size - old_size
+
+	# Manifest
+	# ========
+
+	def manifest_entries(self) -> Iterator[ManifestEntry]:
+		"""cached files and directories from the least to the most recently used one (chunks are summed up per file)"""
+		files: dict[int, int] = dict()
+		for key in self.policy.recency():
+			ino: int = key[0] if isinstance(key, tuple) else key  # type: ignore
+			# a file is as recent as its most recently used chunk
+			files[ino] = files.pop(ino, 0) + self.in_cache[key]
+
+		for ino, size in files.items():
+			cpath: str = self.ino_toTmp_str(ino)
+			rpath: str = self.toRoot(cpath)
+			if os.path.isdir(cpath):
+				yield ManifestEntry(rpath, size, 0, 0, True)
 				continue
+			origin = self._origin.get(ino)
+			if origin is None:
+				continue  # created here and never synced, the source doesn't know about it
+			complete = not Disk.is_partial(cpath)
+			if self.chunkSize:
+				block_map = self.block_map(ino)
+				complete = len(block_map) == len(block_map.chunks(0, block_map.source_size))
+			yield ManifestEntry(rpath, size, *origin, complete)
+
+	def save_manifest(self) -> None:
+		for ino in list(self._unsaved_maps):
+			self.flush_block_map(ino)
+		count = Manifest(self.cacheDir).save(self.manifest_entries(), self.chunkSize)
+		log.info(f'Saved cache manifest with {Col(count)} entries')
+
+	def adopt_manifest(self, source_attrs: Callable[[int], Optional[tuple[int, int]]]) -> tuple[int, int]:
+		"""
+		Tracks what an earlier run left in the cache directory instead of copying it again.
+		Cache files whose source changed in the meantime (or whose copy never finished) are deleted,
+		files the manifest doesn't know about are adopted if they match their source.
+		:param source_attrs: ino -> (size, mtime) of its source file, None if it doesn't exist anymore
+		:returns: number of adopted and dropped cache files
+		"""
+		entries = Manifest(self.cacheDir).load(self.chunkSize)
+		listed: set[str] = {entry.rpath for entry in entries}
+		# unknown files have no recency, they are the first to go
+		adopted, dropped = 0, 0
+		for entry in self.__orphans(listed) + entries:
+			if self.__adopt(entry, source_attrs):
+				adopted += 1
+			else:
+				dropped += 1
+		# adopted files were on the cache filesystem already
+		self.refresh_fs_limit()
+		log.info(f'Adopted {Col(adopted)} cache entries, dropped {Col(dropped)}. {self.getSummary()}')
+		return adopted, dropped
+
+	def __orphans(self, listed: set[str]) -> list[ManifestEntry]:
+		"""cache files the manifest doesn't know about (e.g. after a crash), children before their directories"""
+		orphans: list[ManifestEntry] = []
+		ignored = (Manifest.FILE_NAME, f'{Manifest.FILE_NAME}.tmp', BlockMap.SUFFIX, f'{BlockMap.SUFFIX}.tmp',
+				   Disk.PARTIAL_SUFFIX)
+		for dirpath, dirnames, filenames in os.walk(self.cacheDir, topdown=False):
+			for name in dirnames + filenames:
+				cpath = os.path.join(dirpath, name)
+				rpath = self.toRoot(cpath)
+				if rpath in listed or name.endswith(ignored) or os.path.islink(cpath):
+					continue
+				stat = os.lstat(cpath)
+				complete = not Disk.is_partial(cpath)
+				orphans.append(ManifestEntry(rpath, stat.st_size, stat.st_size, stat.st_mtime_ns, complete))
+		return orphans
+
+	def __adopt(self, entry: ManifestEntry, source_attrs: Callable[[int], Optional[tuple[int, int]]]) -> bool:
+		cpath, src = self.toTmp_str(entry.rpath), self.toSrc_str(entry.rpath)
+		if not os.path.lexists(cpath):
+			return False
+		ino = self.lookup_ino(src)
+		attrs = source_attrs(ino) if ino is not None else None
+
+		if os.path.isdir(cpath):
+			if attrs is None:
+				# gone in the source, so is everything below it
+				self.__drop(cpath)
+				return False
+			self.track(cpath)
+			return True
+
+		assert ino is not None or attrs is None
+		valid = attrs == (entry.src_size, entry.src_mtime_ns) \
+			and (self.chunkSize > 0 or entry.complete and os.path.getsize(cpath) == entry.src_size)
+		if not valid or Disk.is_partial(cpath):
+			log.debug(f'Dropping {Col(cpath)}, source changed or copy incomplete')
+			self.__drop(cpath)
+			return False
+
+		assert ino is not None
+		if self.chunkSize:
+			self.block_map(ino)  # tracks the cached chunks
+		else:
+			self.track(cpath)
+		self._origin[ino] = attrs
+		return True
 
-			assert cpath.exists(), f'File {Col(cpath)} not in cache although it should be ?'
-
-			if os.path.isfile(cpath):
+	@staticmethod
+	def __drop(cpath: str) -> None:
+		try:
+			if os.path.isdir(cpath):
+				shutil.rmtree(cpath)
+			else:
 				os.remove(cpath)
-			elif os.path.isdir(cpath):
-				try:
-					os.rmdir(cpath)
-				except OSError:
-					# directory isn't empty though I don't know what to do at this point
-					# as re-adding it isn't an option ( directory entries only change if files are added or deleted so)
-					# furthermore it would break the heap
-					# at least don't let the CacheSize get corrupted by this
-					self._current_CacheSize += size
+		except OSError as exc:
+			log.warning(f'Could not drop {Col(cpath)}: {exc}')
+		for side in (BlockMap.sidecar(cpath), Disk.partial_marker(cpath)):
+			if os.path.exists(side):
+				os.remove(side)
 
 	def __cp_path(self, src: Path_str, dst: Path_str) -> tuple[int, list[Path]]:
 		"""
@@ -279,7 +804,7 @@ class Disk(Cache):
 		elif src.is_file():
 			if not dst.parent.exists():
 				addedDirsSize, addedFolders = self.mkdir_p(src.parent)
-			shutil.copy2(src, dst)
+			copy_file(src, dst)
 		else:
 			msg = f'{Col.BR} Unrecognized filetype: {src} -> ignoring'
 			log.error(msg)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# job of this module:
+#  - keep free space in the cache ahead of time so open() doesn't have to evict inline
+#  - start evicting once the usage crosses the high watermark and stop at the low watermark
+#  - delete cache files in batches in a worker thread so the trio loop keeps serving requests
+
+import logging
+from typing import Callable, Final, Union, cast
+
+import trio
+
+from src.libwolfs.cache import BusyKeys
+from src.libwolfs.disk import Disk, ReleasePlan
+from src.libwolfs.util import Col, formatByteSize
+
+log = logging.getLogger(__name__)
+
+
+class Evictor:
+	BATCH_SIZE: Final[int] = 64
+	POLL_INTERVAL: Final[float] = 1.0  # seconds
+	RECONCILE_INTERVAL: Final[float] = 60.0  # seconds
+
+	def __init__(self, disk: Disk, busy_inos: Callable[[], Union[set[int], BusyKeys]], is_dir: Callable[[int], bool]) -> None:
+		"""
+		:param busy_inos: returns a fresh set (or `BusyKeys`) of inodes which must not be evicted (open or dirty)
+		:param is_dir: directories are left alone, they can only go once they are empty
+		"""
+		self.disk = disk
+		self.__busy_inos = busy_inos
+		self.__is_dir = is_dir
+		self.__wakeup: trio.Event = trio.Event()
+		# inodes whose cache files are being deleted right now -> event of their batch
+		self.__evicting: dict[int, trio.Event] = dict()
+		self.evicted_files: int = 0
+		self.evicted_bytes: int = 0
+
+	def wakeup(self) -> None:
+		"""Cheap enough to be called after every allocation"""
+		if self.disk.isFull(use_threshold=True):
+			self.__wakeup.set()
+
+	def is_evicting(self, ino: int) -> bool:
+		return ino in self.__evicting
+
+	async def settle(self, ino: int) -> None:
+		"""Waits until an ongoing eviction of `ino` has finished (its cache file is gone afterwards)"""
+		done = self.__evicting.get(ino)
+		if done is not None:
+			await done.wait()
+
+	async def run(self, task_status: 'trio.TaskStatus[None]' = trio.TASK_STATUS_IGNORED) -> None:
+		task_status.started()
+		last_reconcile: float = trio.current_time()
+		while True:
+			with trio.move_on_after(Evictor.POLL_INTERVAL):
+				await self.__wakeup.wait()
+			self.__wakeup = trio.Event()
+			if trio.current_time() - last_reconcile >= Evictor.RECONCILE_INTERVAL:
+				last_reconcile = trio.current_time()
+				await self.reconcile()
+			if self.disk.isFull(use_threshold=True):
+				await self.evict_to(self.disk.lowWatermark)
+
+	async def reconcile(self) -> int:
+		"""
+		Measures the cached files and the free space of the cache filesystem again in a worker thread,
+		whatever the incremental accounting missed is corrected
+		:returns: corrected bytes
+		"""
+		snapshot = self.disk.accounting_snapshot()
+		measured, fs_free = await trio.to_thread.run_sync(
+			Disk.measure, [cpath for _, cpath, _ in snapshot], self.disk.cacheDir)
+		return self.disk.reconcile(snapshot, measured, fs_free)
+
+	async def evict_to(self, watermark: float) -> int:
+		"""
+		Evicts batches of victims until the usage is below `watermark`
+		:returns: freed bytes
+		"""
+		target: int = int(watermark * self.disk.capacity)
+		freed: int = 0
+		while self.disk._current_CacheSize > target:
+			batch = self.__pick_batch(self.disk._current_CacheSize - target)
+			if not batch:
+				log.warning(f'{Col.BR}Only open, dirty, pinned or directory inodes left, '
+							f'usage stays at {100 * self.disk.usage():.1f}%')
+				break
+
+			done = trio.Event()
+			for ino, _, _ in batch:
+				self.__evicting[ino] = done
+			try:
+				await trio.to_thread.run_sync(Evictor.release_all, [plan for _, plan, _ in batch])
+			finally:
+				for ino, _, _ in batch:
+					self.__evicting.pop(ino, None)
+				done.set()
+
+			batch_size = sum(size for _, _, size in batch)
+			freed += batch_size
+			self.evicted_files += len(batch)
+			self.evicted_bytes += batch_size
+			# let foreground requests run between batches
+			await trio.sleep(0)
+
+		if freed:
+			log.info(f'Evicted {Col(formatByteSize(freed))}, {self.disk.getSummary()}')
+		return freed
+
+	def __pick_batch(self, nbytes: int) -> list[tuple[int, ReleasePlan, int]]:
+		"""
+		Chooses victims worth at least `nbytes` (at most BATCH_SIZE) and untracks them right away
+		so foreground fetches can use the space already
+		:returns: (ino, what Disk.release needs, size) of every victim
+		"""
+		# plain inode sets protect whole files and their chunks alike, like everywhere else in `Disk`
+		skip: BusyKeys = BusyKeys.of(self.__busy_inos())
+		batch: list[tuple[int, ReleasePlan, int]] = []
+		while nbytes > 0 and len(batch) < Evictor.BATCH_SIZE:
+			key = self.disk.victim(skip)
+			if key is None:
+				break
+			skip.add(key)
+			if isinstance(key, tuple):
+				ino: int = key[0]
+			else:
+				ino = cast(int, key)
+				if self.__is_dir(ino):
+					continue
+			size = self.disk.in_cache[key]
+			batch.append((ino, self.disk.detach(key), size))
+			nbytes -= size
+		return batch
+
+	@staticmethod
+	def release_all(plans: list[ReleasePlan]) -> None:
+		"""runs in a worker thread"""
+		for plan in plans:
+			try:
+				Disk.release(*plan)
+			except OSError as exc:
+				log.error(f'Could not evict {plan[0]}: {exc}')
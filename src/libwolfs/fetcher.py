@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# job of this module:
+#  - run the blocking copies from the source on a bounded pool of worker threads
+#  - let concurrent requests for the same inode (or chunk) share one fetch instead of racing
+#  - tell how busy the pool is so it can be sized
+
+import errno
+import logging
+from typing import Any, Awaitable, Callable, Final, Hashable, Iterable, Optional
+
+import trio
+
+log = logging.getLogger(__name__)
+
+
+class Flight:
+	"""One fetch in progress, every key it was started for waits on it"""
+	__slots__ = ('keys', 'done', 'error')
+
+	def __init__(self, keys: list[Hashable]) -> None:
+		self.keys: list[Hashable] = keys
+		self.done: trio.Event = trio.Event()
+		self.error: Optional[BaseException] = None
+
+	async def wait(self) -> None:
+		""":raises: whatever the fetch failed with (OSError(EINTR) if it was cancelled)"""
+		await self.done.wait()
+		if isinstance(self.error, Exception):
+			raise self.error
+		if self.error is not None:
+			raise OSError(errno.EINTR, 'fetch was cancelled')
+
+
+class FetchEngine:
+	DEFAULT_WORKERS: Final[int] = 4
+
+	def __init__(self, workers: int = DEFAULT_WORKERS) -> None:
+		""":param workers: maximum number of copies running at the same time"""
+		assert workers > 0, "need at least one worker"
+		self.limiter: trio.CapacityLimiter = trio.CapacityLimiter(workers)
+		self.__flights: dict[Hashable, Flight] = dict()
+		self.fetches: int = 0
+		self.shared: int = 0
+
+	# pool statistics
+	# ===============
+
+	@property
+	def workers(self) -> int:
+		return int(self.limiter.total_tokens)
+
+	@property
+	def in_flight(self) -> int:
+		"""copies running in a worker right now"""
+		return self.limiter.borrowed_tokens
+
+	@property
+	def queue_depth(self) -> int:
+		"""copies waiting for a free worker"""
+		return self.limiter.statistics().tasks_waiting
+
+	@property
+	def keys(self) -> set[Hashable]:
+		"""keys with a fetch in progress (their cache space is reserved but not filled yet)"""
+		return set(self.__flights)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self.__flights
+
+	def __repr__(self) -> str:
+		return (f'FetchEngine(workers={self.workers}, in_flight={self.in_flight}, queue_depth={self.queue_depth}, '
+				f'fetches={self.fetches}, shared={self.shared})')
+
+	# single flight
+	# =============
+
+	def begin(self, keys: Iterable[Hashable]) -> Flight:
+		"""Claims `keys` (none of them may be fetched already), call `end` once the fetch is over"""
+		flight = Flight(list(keys))
+		for key in flight.keys:
+			assert key not in self.__flights, f"{key} is fetched already"
+			self.__flights[key] = flight
+		self.fetches += 1
+		return flight
+
+	def end(self, flight: Flight, error: Optional[BaseException] = None) -> None:
+		for key in flight.keys:
+			del self.__flights[key]
+		flight.error = error
+		flight.done.set()
+
+	async def wait(self, keys: Iterable[Hashable]) -> None:
+		"""Waits for the fetches of `keys` (if any) to finish, :raises: their errors"""
+		for key in keys:
+			flight = self.__flights.get(key)
+			if flight is not None:
+				self.shared += 1
+				await flight.wait()
+
+	async def once(self, key: Hashable, fetch: Callable[..., Awaitable[Any]], *args: Any) -> None:
+		"""
+		Runs `fetch(*args)` unless a fetch of `key` is in progress already, then that one is waited for instead
+		:raises: whatever the fetch failed with
+		"""
+		flight = self.__flights.get(key)
+		if flight is not None:
+			self.shared += 1
+			await flight.wait()
+			return
+
+		flight = self.begin([key])
+		try:
+			await fetch(*args)
+		except BaseException as exc:
+			self.end(flight, exc)
+			raise
+		self.end(flight)
+
+	# worker pool
+	# ===========
+
+	async def run_sync(self, func: Callable[..., Any], *args: Any) -> Any:
+		"""Runs the blocking `func(*args)` in the pool"""
+		return await trio.to_thread.run_sync(func, *args, limiter=self.limiter)
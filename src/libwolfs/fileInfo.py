@@ -8,31 +8,54 @@ from pathlib import Path
 
 import pyfuse3
 from pyfuse3 import FUSEError, EntryAttributes
-from typing import Union, Any
+from typing import Union, Any, Final, Iterable, Iterator, ItemsView, Optional
 import stat as stat_m
 
 class FileInfo:
-
-	def __init__(self, fileAttrs: EntryAttributes) -> None:
-		self.entry: EntryAttributes = fileAttrs
-
-	@staticmethod
-	def getattr(path: Union[str, Path] = None, fd: int = None) -> EntryAttributes:
-		assert fd is None or path is None
-		assert not (fd is None and path is None)
+	"""
+	Compact record of the attributes of one inode.
+	Only plain ints are kept (no per instance __dict__, no EntryAttributes), the
+	EntryAttributes are only built in `entry` when a reply goes to the kernel
+	"""
+	STAT_ATTRS: Final[tuple[str, ...]] = (
+		'st_mode', 'st_nlink', 'st_uid', 'st_gid',
+		'st_rdev', 'st_size', 'st_atime_ns', 'st_mtime_ns',
+		'st_ctime_ns')
+	__slots__ = ('st_ino',) + STAT_ATTRS
+
+	def __init__(self, fileAttrs: Union[EntryAttributes, 'FileInfo']) -> None:
+		self.entry = fileAttrs
+
+	@classmethod
+	def from_path(cls, path: Union[str, Path], ino: int) -> 'FileInfo':
+		"""Record of `path` straight from lstat() without building EntryAttributes"""
 		try:
-			if fd is None:  # get inode attr
-				stat = os.lstat(path.__str__())
-			else:
-				stat = os.fstat(fd)
+			stat = os.lstat(path.__str__())
 		except OSError as exc:
 			raise FUSEError(exc.errno)
-
+		info = cls.__new__(cls)
+		for attr in FileInfo.STAT_ATTRS:
+			setattr(info, attr, getattr(stat, attr))
+		info.st_ino = ino
+		return info
+
+	@property
+	def entry(self) -> EntryAttributes:
 		entry = EntryAttributes()
+		FileInfo._fill_entry(entry, self)
+		entry.st_ino = self.st_ino
+		return entry
+
+	@entry.setter
+	def entry(self, fileAttrs: Union[EntryAttributes, 'FileInfo']) -> None:
+		for attr in FileInfo.STAT_ATTRS:
+			setattr(self, attr, getattr(fileAttrs, attr))
+		self.st_ino = fileAttrs.st_ino
+
+	@staticmethod
+	def _fill_entry(entry: EntryAttributes, stat: Any) -> None:
 		# copy file attributes
-		for attr in ('st_mode', 'st_nlink', 'st_uid', 'st_gid',
-					 'st_rdev', 'st_size', 'st_atime_ns', 'st_mtime_ns',
-					 'st_ctime_ns'):
+		for attr in FileInfo.STAT_ATTRS:
 			setattr(entry, attr, getattr(stat, attr))  # more general way of entry.'attr' = stat.'attr'
 		# TODO: probably needs a rework after the NFS is mounted
 		# 		the inode generation in nfs is not stable after a server restart
@@ -45,6 +68,21 @@ class FileInfo:
 
 		entry.st_blksize = 512
 		entry.st_blocks = ((entry.st_size + entry.st_blksize - 1) // entry.st_blksize)
+
+	@staticmethod
+	def getattr(path: Union[str, Path] = None, fd: int = None) -> EntryAttributes:
+		assert fd is None or path is None
+		assert not (fd is None and path is None)
+		try:
+			if fd is None:  # get inode attr
+				stat = os.lstat(path.__str__())
+			else:
+				stat = os.fstat(fd)
+		except OSError as exc:
+			raise FUSEError(exc.errno)
+
+		entry = EntryAttributes()
+		FileInfo._fill_entry(entry, stat)
 		# st_ino can't be set here as we don't have access to InodeTranslator
 		# but ino == 0 is either way an error as we begin counting at 1 in our table
 		# so if there is a slipup it will be noticed immediately
@@ -110,20 +148,70 @@ class FileInfo:
 			raise FUSEError(exc.errno)
 
 
-class listset(list):
-	# for checking of something got added twice which is absolutely wrong
-	def append(self, item: Any) -> None:
-		assert item not in self
-		super(listset, self).append(item)
+class DirEntries:
+	"""
+	Entries of a directory: name -> ino in insertion order (which is also the readdir order).
+	Keeps the reverse mapping too, so membership tests by ino stay O(1)
+	"""
+	__slots__ = ('_names', '_inos')
+
+	def __init__(self, entries: Iterable[tuple[str, int]] = ()) -> None:
+		self._names: dict[str, int] = dict()
+		self._inos: dict[int, str] = dict()
+		for name, ino in entries:
+			self.add(name, ino)
+
+	def add(self, name: str, ino: int) -> None:
+		known: Optional[int] = self._names.get(name)
+		if known == ino:
+			return
+		# for checking of something got added twice which is absolutely wrong
+		assert known is None, f"{name} already maps to {known} (new: {ino})"
+		self._names[name] = ino
+		self._inos.setdefault(ino, name)  # hardlinks in the same directory keep their first name
+
+	def get(self, name: str) -> Optional[int]:
+		return self._names.get(name)
+
+	def name(self, ino: int) -> Optional[str]:
+		return self._inos.get(ino)
+
+	def pop(self, name: str) -> int:
+		ino: int = self._names.pop(name)
+		if self._inos.get(ino) == name:
+			del self._inos[ino]
+			# hardlink in the same directory: fall back to another name (rare so a scan is fine)
+			for other_name, other_ino in self._names.items():
+				if other_ino == ino:
+					self._inos[ino] = other_name
+					break
+		return ino
+
+	def remove(self, ino: int) -> None:
+		self.pop(self._inos[ino])
+
+	def items(self) -> ItemsView[str, int]:
+		return self._names.items()
+
+	def __iter__(self) -> Iterator[int]:
+		return iter(self._names.values())
+
+	def __contains__(self, ino: object) -> bool:
+		return ino in self._inos
+
+	def __len__(self) -> int:
+		return len(self._names)
+
+	def __repr__(self) -> str:
+		return list(self._names.values()).__repr__()
 
-	def __add__(self, other):
-		assert other not in self
-		super(listset, self).__add__(other)
 
 class DirInfo(FileInfo):
-	def __init__(self, fileAttrs: EntryAttributes, child_inodes: list[int]) -> None:
+	__slots__ = ('children',)
+
+	def __init__(self, fileAttrs: EntryAttributes, children: Iterable[tuple[str, int]] = ()) -> None:
 		super().__init__(fileAttrs)
-		self.children: listset[int] = listset(child_inodes)
+		self.children: DirEntries = DirEntries(children)
 
 	def __str__(self) -> str:
 		return f'childs:{self.children}'
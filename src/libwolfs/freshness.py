@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# job of this module:
+#  - decide when a cached file has to be checked against its source again (TTL, configurable per subtree)
+#  - stat source files of concurrent opens in one go in a worker thread instead of one round trip each
+
+import logging
+import math
+import os
+from typing import Final, Optional
+
+import trio
+
+from src.libwolfs.translator import InodeTranslator
+
+log = logging.getLogger(__name__)
+
+
+class Freshness:
+	"""
+	A cached file is trusted for `ttl` seconds after it was copied or last checked, then it is compared with its
+	source on the next open. Directories can have their own TTL, the closest one above a file wins
+	(looked up along the path like pins, so files created later on get it too). inf never checks
+	"""
+
+	def __init__(self, translator: InodeTranslator, ttl: float = math.inf) -> None:
+		self.__translator = translator
+		self.default_ttl: float = ttl
+		self.ttls: dict[int, float] = dict()
+		self.__checked: dict[int, float] = dict()
+
+	def set_ttl(self, ino: int, ttl: float) -> None:
+		self.ttls[ino] = ttl
+
+	def clear_ttl(self, ino: int) -> bool:
+		""":returns: False if `ino` had no TTL of its own"""
+		return self.ttls.pop(ino, None) is not None
+
+	def ttl(self, ino: int) -> float:
+		if not self.ttls:
+			return self.default_ttl
+		translator = self.__translator
+		while translator.ino_exists(ino):
+			ttl: Optional[float] = self.ttls.get(ino)
+			if ttl is not None:
+				return ttl
+			parent = translator.ino_parent(ino)
+			if parent == ino:
+				break
+			ino = parent
+		return self.default_ttl
+
+	def checked(self, ino: int, now: Optional[float] = None) -> None:
+		"""the cache file of `ino` matches its source (as of `now`)"""
+		self.__checked[ino] = trio.current_time() if now is None else now
+
+	def due(self, ino: int, now: Optional[float] = None) -> bool:
+		ttl: float = self.ttl(ino)
+		if math.isinf(ttl):
+			return False
+		now = trio.current_time() if now is None else now
+		# never checked: as old as the mount, its copy might be older than that
+		return now - self.__checked.get(ino, -math.inf) >= ttl
+
+	def forget(self, ino: int) -> None:
+		self.__checked.pop(ino, None)
+
+	def __repr__(self) -> str:
+		return f'Freshness(ttl={self.default_ttl}, subtrees={len(self.ttls)}, checked={len(self.__checked)})'
+
+
+class _Request:
+	__slots__ = ('done', 'result')
+
+	def __init__(self) -> None:
+		self.done = trio.Event()
+		self.result: Optional[os.stat_result] = None
+
+
+class StatBatcher:
+	"""Collects the stat() calls of concurrent requests for `WINDOW` seconds and runs them in one worker thread"""
+	WINDOW: Final[float] = 0.002  # seconds
+	MAX_BATCH: Final[int] = 256
+
+	def __init__(self, window: float = WINDOW) -> None:
+		self.window: float = window
+		self.__pending: dict[str, _Request] = dict()
+		self.__wakeup: trio.Event = trio.Event()
+		self.batches: int = 0
+		self.stats: int = 0
+
+	async def run(self, task_status: 'trio.TaskStatus[None]' = trio.TASK_STATUS_IGNORED) -> None:
+		task_status.started()
+		while True:
+			await self.__wakeup.wait()
+			self.__wakeup = trio.Event()
+			if len(self.__pending) < StatBatcher.MAX_BATCH:
+				await trio.sleep(self.window)
+			batch, self.__pending = self.__pending, dict()
+			results = await trio.to_thread.run_sync(StatBatcher.stat_all, list(batch))
+			for request, result in zip(batch.values(), results):
+				request.result = result
+				request.done.set()
+			self.batches += 1
+			self.stats += len(batch)
+
+	async def stat(self, path: str) -> Optional[os.stat_result]:
+		""":returns: stat of `path`, None if it doesn't exist (anymore)"""
+		request = self.__pending.get(path)
+		if request is None:
+			request = self.__pending[path] = _Request()
+			self.__wakeup.set()
+		await request.done.wait()
+		return request.result
+
+	async def stat_many(self, paths: list[str]) -> list[Optional[os.stat_result]]:
+		"""all of `paths` go into the same batch"""
+		results: list[Optional[os.stat_result]] = [None] * len(paths)
+
+		async def one(idx: int, path: str) -> None:
+			results[idx] = await self.stat(path)
+
+		async with trio.open_nursery() as nursery:
+			for idx, path in enumerate(paths):
+				nursery.start_soon(one, idx, path)
+		return results
+
+	@staticmethod
+	def stat_all(paths: list[str]) -> list[Optional[os.stat_result]]:
+		"""runs in a worker thread"""
+		results: list[Optional[os.stat_result]] = []
+		for path in paths:
+			try:
+				results.append(os.stat(path))
+			except OSError:
+				results.append(None)
+		return results
+
+	def __repr__(self) -> str:
+		return f'StatBatcher(batches={self.batches}, stats={self.stats})'
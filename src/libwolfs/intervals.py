@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# job of this module:
+#  - remember which byte ranges of a file were written since its last writeback
+#  - overlapping and adjacent writes are merged, so a file written sequentially is a single range
+
+from bisect import bisect_left, bisect_right
+from typing import Iterator
+
+Write_Op = tuple[int, int]
+
+
+class IntervalSet:
+	"""Disjoint, non-adjacent [start, end) ranges sorted by their start, memory grows with the fragmentation only"""
+	__slots__ = ('__starts', '__ends', 'size')
+
+	def __init__(self) -> None:
+		self.__starts: list[int] = []
+		self.__ends: list[int] = []
+		self.size: int = 0  # bytes covered
+
+	def add(self, offset: int, length: int) -> int:
+		""":returns: number of bytes which weren't covered before (0 for a rewrite of a dirty range)"""
+		if length <= 0:
+			return 0
+		start, end = offset, offset + length
+		# ranges touching [start, end): first one ending at or after start, last one starting at or before end
+		first = bisect_left(self.__ends, start)
+		last = bisect_right(self.__starts, end)
+		merged: int = 0
+		if first < last:
+			start = min(start, self.__starts[first])
+			end = max(end, self.__ends[last - 1])
+			merged = sum(self.__ends[i] - self.__starts[i] for i in range(first, last))
+		self.__starts[first:last] = [start]
+		self.__ends[first:last] = [end]
+		added: int = end - start - merged
+		self.size += added
+		return added
+
+	def update(self, other: 'IntervalSet') -> None:
+		for offset, length in other:
+			self.add(offset, length)
+
+	def __iter__(self) -> Iterator[Write_Op]:
+		""":returns: (offset, length) of every range"""
+		for start, end in zip(self.__starts, self.__ends):
+			yield start, end - start
+
+	def __len__(self) -> int:
+		return len(self.__starts)
+
+	def __bool__(self) -> bool:
+		return bool(self.__starts)
+
+	def __repr__(self) -> str:
+		return f'IntervalSet({len(self)} ranges, {self.size} bytes)'
@@ -8,12 +8,16 @@
 #    namely: disk, vfs
 
 # external imports
+import errno
+import math
 import sys
+import time
 from pathlib import Path
 import os
 from enum import Flag, auto
 import dataclasses
 import logging
+from bisect import bisect_left, bisect_right, insort
 
 import pyfuse3
 
@@ -23,14 +27,16 @@ log = logging.getLogger(__name__)
 
 # custom imports
 from src.libwolfs.disk import Disk
+from src.libwolfs.copyengine import copy_range
 from src.libwolfs.vfs import VFS
 from src.libwolfs.util import Col, __functionName__
+from src.libwolfs.intervals import IntervalSet, Write_Op
+from src.libwolfs.wal import WalRecord, WriteAheadLog
 from IPython import embed
 
 embed = embed
-from typing import Final
+from typing import Final, Iterator, Optional, cast
 
-Write_Op = tuple[int, int]
 INVALID_VALUE: Final[int] = -1
 
 
@@ -50,16 +56,97 @@ class LogEntry:
 	flags: int = INVALID_VALUE
 	mode: int = INVALID_VALUE
 	path_new: str = ""
+	# WRITE: dirty byte ranges of all writes merged into this entry
+	ranges: IntervalSet = dataclasses.field(default_factory=IntervalSet)
+	lsn: int = 0  # number of its first record in the write-ahead log
+
+	def record(self) -> WalRecord:
+		""":returns: how the entry is stored in the write-ahead log"""
+		offset, length = self.writes
+		return WalRecord(self.op.value, self.inode, self.path, offset, length, self.flags, self.mode, self.path_new)
+
+	@staticmethod
+	def from_record(record: WalRecord) -> 'LogEntry':
+		# inodes don't survive a restart, they are looked up by path again
+		return LogEntry(File_Ops(record.op), 0, record.path, (record.offset, record.length),
+						record.flags, record.mode, record.path_new)
+
+@dataclasses.dataclass
+class Flush:
+	"""Entries on their way to the source, see `Journal.beginFlush`"""
+	history: list[LogEntry]  # compacted by the first `Journal.replay`
+	unapplied: list[int]  # lsn of the oldest record not on the source yet, once the entries before it are
+	dirty: dict[int, int]  # inode -> its size before it was modified
+	logged: int  # records in the log when the flush began
+	dirty_since: Optional[float]
+	compacted: bool = False
+	position: int = 0  # entries replayed so far
+	# writes of files which were moved while they were written back
+	skipped: list[LogEntry] = dataclasses.field(default_factory=list)
+	# (inode or 0 to look it up, source path, its (size, mtime) once synced), `Disk` learns about them on the loop
+	origins: list[tuple[int, Path, tuple[int, int]]] = dataclasses.field(default_factory=list)
+
+def ancestors(path: str) -> Iterator[str]:
+	""":returns: the directories above `path` (normalized), closest first"""
+	parent = os.path.dirname(path)
+	while parent != path:
+		yield parent
+		path, parent = parent, os.path.dirname(parent)
+
+class PathIndex:
+	"""Positions of ops by the (normalized) paths they touch, finds the ones at, above or below a path"""
+	def __init__(self) -> None:
+		self.at: dict[str, list[int]] = dict()
+		self.below: dict[str, list[int]] = dict()  # directory -> positions of the paths somewhere inside it
+
+	def add(self, path: str, i: int) -> None:
+		insort(self.at.setdefault(path, []), i)
+		for parent in ancestors(path):
+			insort(self.below.setdefault(parent, []), i)
+
+	def remove(self, path: str, i: int) -> None:
+		PathIndex.__remove(self.at[path], i)
+		for parent in ancestors(path):
+			PathIndex.__remove(self.below[parent], i)
+
+	def touched_between(self, path: str, first: int, second: int) -> bool:
+		""":returns: if an op after `first` and before `second` touches `path`, something in it or above it"""
+		return (PathIndex.__between(self.at.get(path), first, second)
+				or PathIndex.__between(self.below.get(path), first, second)
+				or any(PathIndex.__between(self.at.get(parent), first, second) for parent in ancestors(path)))
+
+	@staticmethod
+	def __remove(positions: list[int], i: int) -> None:
+		del positions[bisect_left(positions, i)]
+
+	@staticmethod
+	def __between(positions: Optional[list[int]], first: int, second: int) -> bool:
+		if not positions:
+			return False
+		k = bisect_right(positions, first)
+		return k < len(positions) and positions[k] < second
 
 class Journal:
 	supported_ops: Final = [File_Ops.CREATE, File_Ops.WRITE, File_Ops.UNLINK, File_Ops.MKDIR, File_Ops.RENAME]
 	__EMPTY_FDS = (0, 0)
-	__history: list[LogEntry] = []
-	__inode_dirty_map2: dict[int, int] = dict()
-	__last_remote_path: str = ""
-	__last_fds: Write_Op = __EMPTY_FDS
+	__MARK_EVERY: Final[int] = 256  # entries replayed between two markers in the log
 
-	def __init__(self, disk: Disk, vfs: VFS, logFile: Path):
+	def __init__(self, disk: Disk, vfs: VFS, logFile: Optional[Path],
+				 syncInterval: float = WriteAheadLog.DEFAULT_SYNC_INTERVAL):
+		"""
+		:param logFile: write-ahead log of the entries, none if it isn't a regular file (e.g. /dev/stdout) or a log
+		:param syncInterval: seconds the entries of concurrent FUSE ops are collected for one fdatasync of the log,
+		  0 syncs every entry on its own
+		"""
+		self.__history: list[LogEntry] = []
+		self.__inode_dirty_map2: dict[int, int] = dict()
+		self.__last_remote_path: str = ""
+		self.__last_fds: Write_Op = Journal.__EMPTY_FDS
+		# path -> its WRITE entry later writes are merged into (until another op is logged)
+		self.__open_writes: dict[str, LogEntry] = dict()
+		self.__logged: int = 0  # records in the log (markers don't count)
+		self.__flushing: dict[int, int] = dict()  # dirty inodes of the running flush
+		self.dirty_since: Optional[float] = None  # time.monotonic() of the oldest entry
 		self.disk: Disk = disk
 		self.src_statvfs = os.statvfs(disk.sourceDir)
 		if self.src_statvfs.f_bsize == 0:
@@ -68,14 +155,32 @@ class Journal:
 		self.bytes_unwritten: int = 0
 		self.vfs: VFS = vfs
 		self.logFile = logFile
+		self.wal: Optional[WriteAheadLog] = None
+		if logFile is not None and Journal.isLogFile(logFile):
+			self.wal = WriteAheadLog(logFile, syncInterval)
+
+	@staticmethod
+	def isLogFile(logFile: Optional[Path]) -> bool:
+		if logFile is None or str(logFile) in ('', '.'):
+			return False
+		path = Path(logFile)
+		if path.exists() and not path.is_file():
+			log.warning(f'{Col(path)} is not a regular file, the journal is not persisted (no crash recovery)')
+			return False
+		if not WriteAheadLog.is_log(path):
+			log.warning(f'{Col(path)} is some other file, the journal is not persisted (no crash recovery)')
+			return False
+		return True
 
 	# private api
 	# ===========
-	def __fsyncFile_with_remote(self, cache_file: str, write_ops: list[Write_Op]) -> None:
+	def __fsyncFile_with_remote(self, cache_file: str, write_ops: list[Write_Op], flush: Flush) -> bool:
 		"""
 		Syncs `cache_file` with remote by applying `write_ops` to the corresponding remote file
 		:param cache_file: cached file to be synced
 		:param write_ops: history of write operations to file preceeding last sync
+		:param flush: notes the synced version of the remote file
+		:returns: False if `cache_file` isn't there (anymore)
 		"""
 		remote: Path = self.disk.toSrc(cache_file)
 		if cache_file != self.disk.toTmp(cache_file):
@@ -86,6 +191,9 @@ class Journal:
 						break
 					elif entry.op == File_Ops.WRITE:
 						assert "Tried to overwrite cache with remote file"
+		if not os.path.exists(cache_file):
+			log.warning(f'{Col(cache_file)} is gone from the cache, skipping its writes')
+			return False
 		assert remote.exists(), "Writing before the file was created ???"
 
 		fd_cache, fd_remote = self.__last_fds
@@ -101,18 +209,17 @@ class Journal:
 
 		# copy file Contents without truncuation
 		for offset, buflen in write_ops:
-			os.lseek(fd_cache, offset, os.SEEK_SET)
-			os.lseek(fd_remote, offset, os.SEEK_SET)
-			buf = os.read(fd_cache, buflen)
-			os.write(fd_remote, buf)
+			copy_range(fd_cache, fd_remote, offset, buflen)
 
 		# copy file Attributes (keeps us from logging setattrs too)
 		# TODO: could probably just change them when we really need to
 		#      like if remote == last entry of history or sth
 		#      and somewhere in the self.__last_remote_path is different
 		Disk.copystat(cache_file, remote)
+		flush.origins.append((0, remote, Disk.origin(remote)))
+		return True
 
-	def __replayFile_Op(self, op: File_Ops, src_path: Path, logEntry: LogEntry, i: int) -> int:
+	def __replayFile_Op(self, op: File_Ops, src_path: Path, logEntry: LogEntry, i: int, flush: Flush) -> int:
 		def __unlink(src_path: Path) -> None:
 			try:
 				os.remove(src_path)
@@ -126,17 +233,25 @@ class Journal:
 			mode: int = getattr(logEntry, 'mode')
 			try:
 				os.mkdir(src_path, mode)
+			except FileExistsError:
+				if not src_path.is_dir():
+					raise pyfuse3.FUSEError(errno.EEXIST)
 			except OSError as exc:
 				log.exception(exc)
 				raise pyfuse3.FUSEError(exc.errno)
 
 		def __create(src_path: Path, logEntry: LogEntry) -> None:
-			flags: int = getattr(logEntry, 'flags')
+			# replayed again after a crash: the file might be there already
+			flags: int = getattr(logEntry, 'flags') & ~os.O_EXCL
 			fd = os.open(src_path, flags)
 			os.close(fd)
+			if logEntry.inode:
+				flush.origins.append((logEntry.inode, src_path, Disk.origin(src_path)))
 
 		def __rename(src_path: Path, logEntry: LogEntry) -> None:
 			path_new: Path = self.disk.toSrc(getattr(logEntry, 'path_new'))
+			if not os.path.lexists(src_path) and os.path.lexists(path_new):
+				return  # renamed before a crash already
 			os.rename(src_path, path_new)
 
 		switcher = {
@@ -146,17 +261,20 @@ class Journal:
 			File_Ops.RENAME: lambda x, y, z: __rename(x, y),
 		}
 		if op == File_Ops.WRITE:
-			# fetch all writes happening directly after this one
-			writes: list[Write_Op] = []
+			# fetch all writes happening directly after this one, every merged range is copied once
+			writes = IntervalSet()
 			file_path = logEntry.path
-			history_iter = iter(self.__history[i:])
+			lsn: int = logEntry.lsn
+			history_iter = iter(flush.history[i:])
 			while writeEntry := next(history_iter, None):
 				if writeEntry.op != File_Ops.WRITE or writeEntry.path != file_path:
 					break
 				else:
-					writes.append(getattr(writeEntry, 'writes'))
+					writes.update(writeEntry.ranges)
+					lsn = min(lsn, writeEntry.lsn)
 					i += 1
-			self.__fsyncFile_with_remote(logEntry.path, writes)
+			if not self.__fsyncFile_with_remote(logEntry.path, list(writes), flush):
+				flush.skipped.append(LogEntry(File_Ops.WRITE, logEntry.inode, file_path, ranges=writes, lsn=lsn))
 			return i
 		else:
 			switcher[op](src_path, logEntry, i)
@@ -166,77 +284,350 @@ class Journal:
 	# ==========
 
 	def flushCompleteJournal(self) -> None:
-		def clearBuffers():
-			# clean internal buffers
-			self.__history.clear()
-			self.__inode_dirty_map2.clear()
-			self.__last_fds = Journal.__EMPTY_FDS
-			self.__last_remote_path = ""
-			self.bytes_unwritten = 0
-
-		# TODO: What if a file was:
-		#  1. written to
-		#  2. deleted
-		#  3. created again
-		#  4. written to again
-		#  current approach would just delete the file and ignore the updates to the new file
-		#  => Lost Update! -> Disable "speedup" for know
-		compacted_history = self.__history
-		"""
-		unlink_entries = list(filter(lambda x: x.op == File_Ops.UNLINK, self.__history))
-		unlink_inos = list(map(lambda x: x.inode, unlink_entries))
+		"""Writes the whole journal back to the source right away (see `Writeback` for doing so in the background)"""
+		flush: Flush = self.beginFlush()
+		try:
+			self.replay(flush, mark=True)
+		except BaseException:
+			self.abortFlush(flush)
+			raise
+		self.endFlush(flush)
 
-		compacted_history = []
-		for logEntry in self.__history:
-			if logEntry.inode not in unlink_inos:
-				item = logEntry
+		# TODO: might be a good place to rearrange some data that was accessed longest ago to make some room for buffers
+		#	aka let some buffer
+
+	def beginFlush(self) -> Flush:
+		"""Takes the history out of the journal, new entries start a fresh one while it is replayed"""
+		flush = Flush(self.__history, [], self.__inode_dirty_map2, self.__logged, self.dirty_since)
+		# still dirty until they are on the source
+		self.__flushing = flush.dirty
+		self.__history, self.__open_writes, self.__inode_dirty_map2 = [], dict(), dict()
+		self.dirty_since, self.bytes_unwritten = None, 0
+		return flush
+
+	@staticmethod
+	def __compactFlush(flush: Flush) -> None:
+		"""compacts the history of `flush` before its first entry is replayed"""
+		compacted_history = Journal.compact(flush.history)
+		unapplied: list[int] = [0] * len(compacted_history)
+		oldest: int = flush.logged + 1
+		for i in reversed(range(len(compacted_history))):
+			oldest = unapplied[i] = min(oldest, compacted_history[i].lsn)
+
+		if compacted_history:
+			log.info(f'{Col.BG}Flushing complete Journal: {Col.BY}{len(compacted_history)}{Col.BG} entries '
+					 f'(compacted from {Col.BY}{len(flush.history)}{Col.BG})')
+		flush.history, flush.unapplied, flush.compacted = compacted_history, unapplied, True
+
+	def replay(self, flush: Flush, count: Optional[int] = None, mark: bool = False) -> bool:
+		"""
+		Applies the next `count` entries of `flush` (all if None) to the source, runs in worker threads too
+		(and so does the compaction before the first entry)
+		:param mark: note the progress in the log as it goes (not from a worker thread)
+		:returns: True once every entry is replayed
+		"""
+		if not flush.compacted:
+			Journal.__compactFlush(flush)
+		history: list[LogEntry] = flush.history
+		stop: int = len(history) if count is None else min(len(history), flush.position + count)
+		marked: int = flush.position
+		try:
+			while flush.position < stop:
+				logEntry = history[flush.position]
+				src_path = self.disk.toSrc(logEntry.path)
+				flush.position = self.__replayFile_Op(logEntry.op, src_path, logEntry, flush.position, flush)
+				if mark and self.wal is not None and flush.position - marked >= Journal.__MARK_EVERY:
+					self.wal.mark_applied(self.__appliedRecords(flush))
+					marked = flush.position
+		except BaseException:
+			# a crash before the next flush doesn't replay the applied part again
+			if mark and self.wal is not None and flush.position > marked:
+				self.wal.mark_applied(self.__appliedRecords(flush))
+			raise
+		finally:
+			fd_cache, fd_remote = self.__last_fds
+			if self.__last_fds != Journal.__EMPTY_FDS:
+				os.fsync(fd_remote)
+				os.close(fd_cache); os.close(fd_remote)
+				self.__last_fds = Journal.__EMPTY_FDS
+				self.__last_remote_path = ""
+		return flush.position == len(history)
+
+	def endFlush(self, flush: Flush) -> None:
+		"""`flush` is on the source"""
+		self.__flushing = dict()
+		self.__noteOrigins(flush)
+		if flush.skipped:
+			# retried along with the entries of their move
+			self.__requeue(flush, flush.skipped)
+		if flush.history:
+			log.info(f'{Col.BW}Finished flushing complete Journal')
+		if not flush.skipped and self.__logged == flush.logged:
+			# everything in the log is on the source now
+			if self.wal is not None and self.__logged:
+				self.wal.checkpoint()
+			self.__logged = 0
+		elif self.wal is not None:
+			applied: int = min([flush.logged] + [e.lsn - 1 for e in flush.skipped])
+			self.wal.mark_applied(applied, sync=False)
+
+	def abortFlush(self, flush: Flush) -> None:
+		"""`flush` failed: whatever wasn't replayed yet goes back into the journal"""
+		self.__flushing = dict()
+		self.__noteOrigins(flush)
+		self.__requeue(flush, flush.skipped + flush.history[flush.position:])
+
+	def __noteOrigins(self, flush: Flush) -> None:
+		"""the versions of the source `replay` synced, the inodes are looked up here as renames happen on the loop"""
+		for inode, src, origin in flush.origins:
+			ino: Optional[int] = inode or self.disk.lookup_ino(src)
+			if ino is not None:
+				self.disk.note_origin(ino, src, origin)
+		flush.origins.clear()
+
+	def __requeue(self, flush: Flush, entries: list[LogEntry]) -> None:
+		self.__history[:0] = entries
+		for inode, size in flush.dirty.items():
+			self.__inode_dirty_map2.setdefault(inode, size)
+		if flush.dirty_since is not None:
+			self.dirty_since = min(flush.dirty_since, self.dirty_since or math.inf)
+		self.bytes_unwritten += sum(e.ranges.size for e in entries if e.op == File_Ops.WRITE)
+
+	def __appliedRecords(self, flush: Flush) -> int:
+		""":returns: number of records at the start of the log which are on the source by now"""
+		# the records of an entry come after its first one: the ones before the oldest entry left are applied
+		# (or belong to entries compaction dropped)
+		i: int = flush.position
+		return flush.unapplied[i] - 1 if i < len(flush.unapplied) else flush.logged
+
+	@staticmethod
+	def compact(history: list[LogEntry]) -> list[LogEntry]:
+		"""
+		Drops what the source doesn't need to see before replaying `history`.
+		Every incarnation of a path (created, or already on the source, until it is unlinked or replaced) is a
+		generation of its own, a file deleted and created again doesn't lose the writes of the new one:
+		 - creating and unlinking a generation cancels out, so does a rename back to where it came from
+		 - rename chains collapse into one rename (or into the create / the unlink)
+		 - writes to deleted generations are dropped, the others are merged into one write per file at the end
+		   (they are copied from the cache file as it is now, which is at its final path by then)
+		Ops are only merged if no op of another generation in between touches their paths
+		"""
+		generations: list[int] = []
+		current: dict[str, int] = dict()  # path -> its generation right now
+		inside: dict[str, set[str]] = dict()  # directory -> the paths of `current` somewhere below it
+		dead: set[int] = set()
+		count: int = 0
+
+		def track(path: str, gen: int) -> None:
+			current[path] = gen
+			for parent in ancestors(path):
+				inside.setdefault(parent, set()).add(path)
+
+		def untrack(path: str) -> int:
+			for parent in ancestors(path):
+				inside[parent].discard(path)
+			return current.pop(path)
+
+		def new_generation(path: str) -> int:
+			nonlocal count
+			count += 1
+			if path in current:
+				dead.add(current[path])  # replaced
+			track(path, count)
+			return count
+
+		def generation(path: str) -> int:
+			# not created by the journal: on the source already
+			return current[path] if path in current else new_generation(path)
+
+		for e in history:
+			path = os.path.normpath(e.path)
+			if e.op in (File_Ops.CREATE, File_Ops.MKDIR):
+				generations.append(new_generation(path))
+			elif e.op == File_Ops.RENAME:
+				gen = generation(path)
+				path_new = os.path.normpath(e.path_new)
+				moved = {p: untrack(p) for p in [path, *inside.get(path, ())]}
+				if path_new in current:
+					dead.add(current[path_new])
+				for p, g in moved.items():
+					track(path_new + p[len(path):], g)
+				generations.append(gen)
+			elif e.op == File_Ops.UNLINK:
+				gen = generation(path)
+				untrack(path)
+				dead.add(gen)
+				generations.append(gen)
+			else:
+				generations.append(generation(path))
+		final: dict[int, str] = {g: p for p, g in current.items()}
+
+		# structural ops, None once compaction dropped them
+		ops: list[Optional[LogEntry]] = []
+		op_generations: list[int] = []
+		writes: dict[int, LogEntry] = dict()
+		for e, gen in zip(history, generations):
+			if e.op != File_Ops.WRITE:
+				ops.append(dataclasses.replace(e))
+				op_generations.append(gen)
+			elif gen not in dead:
+				merged = writes.get(gen)
+				if merged is None:
+					merged = writes[gen] = LogEntry(File_Ops.WRITE, e.inode, final[gen], lsn=e.lsn)
+				merged.inode = e.inode
+				merged.ranges.update(e.ranges)
+				merged.lsn = min(merged.lsn, e.lsn)
+
+		def paths(e: LogEntry) -> list[str]:
+			return [os.path.normpath(p) for p in (e.path, e.path_new) if p]
+
+		index = PathIndex()
+		for idx, entry in enumerate(ops):
+			for p in paths(cast(LogEntry, entry)):
+				index.add(p, idx)
+
+		def independent(first: int, second: int) -> bool:
+			"""nothing between the two ops touches their paths"""
+			touched = paths(cast(LogEntry, ops[first])) + paths(cast(LogEntry, ops[second]))
+			return not any(index.touched_between(p, first, second) for p in touched)
+
+		def fold(first: int, second: int) -> bool:
+			"""merges the op at `second` into the one at `first` (same generation)"""
+			a, b = cast(LogEntry, ops[first]), cast(LogEntry, ops[second])
+			if b.op == File_Ops.RENAME:
+				if a.op in (File_Ops.CREATE, File_Ops.MKDIR):
+					a.path = b.path_new
+				elif a.op == File_Ops.RENAME:
+					a.path_new = b.path_new
+					if os.path.normpath(a.path) == os.path.normpath(a.path_new):
+						ops[first] = None
+				else:
+					return False
+			elif b.op == File_Ops.UNLINK:
+				if a.op in (File_Ops.CREATE, File_Ops.MKDIR):
+					ops[first] = None
+				elif a.op == File_Ops.RENAME:
+					a.op, a.path, a.path_new = File_Ops.UNLINK, a.path, ""
+				else:
+					return False
 			else:
-				# insert unlink_entry and skip every other entry according to that ino
-				try:
-					item = unlink_entries[unlink_inos.index(logEntry.inode)]
-				except KeyError:
+				return False
+			a.lsn = min(a.lsn, b.lsn)
+			ops[second] = None
+			return True
+
+		# cancelling the contents of a directory can make its own ops independent
+		changed: bool = True
+		while changed:
+			changed = False
+			last: dict[int, int] = dict()  # generation -> index of its latest op left
+			for idx, gen in enumerate(op_generations):
+				if ops[idx] is None:
 					continue
-			compacted_history.append(item)
-		"""
-
-		len_history = len(compacted_history)
-		log.info(f'{Col.BG}Flushing complete Journal: {Col.BY}{len_history}{Col.BG} entries')
-
-		i = 0
-		while i < len_history:
-			logEntry = compacted_history[i]
-			src_path = self.disk.toSrc(logEntry.path)
-			i = self.__replayFile_Op(logEntry.op, src_path, logEntry, i)
-			if i % 25 == 0:
-				print(f'Processed {i} items')
+				prev = last.get(gen)
+				if prev is not None and ops[prev] is not None and independent(prev, idx):
+					before, folded = paths(cast(LogEntry, ops[prev])), paths(cast(LogEntry, ops[idx]))
+					if not fold(prev, idx):
+						last[gen] = idx
+						continue
+					changed = True
+					for p in before:
+						index.remove(p, prev)
+					for p in folded:
+						index.remove(p, idx)
+					if ops[prev] is not None:
+						for p in paths(cast(LogEntry, ops[prev])):
+							index.add(p, prev)
+						continue  # the merged op stays at prev
+					last.pop(gen)
+					continue
+				last[gen] = idx
 
-		log.info(f'{Col.BW}Finished flushing complete Journal')
-		clearBuffers()
+		return [e for e in ops if e is not None] + sorted(writes.values(), key=lambda e: e.lsn)
 
-		# TODO: might be a good place to rearrange some data that was accessed longest ago to make some room for buffers
-		#	aka let some buffer
+	def recover(self) -> int:
+		"""
+		Replays what the log of an unclean shutdown has and the source doesn't (call before indexing the source).
+		The entries go back into the history and are flushed like any other, replaying them twice does no harm:
+		if the recovery is interrupted, the next mount runs it again
+		:returns: number of recovered entries
+		"""
+		if self.wal is None:
+			return 0
+		applied, records = self.wal.unapplied()
+		if records:
+			log.warning(f'Recovering {Col(len(records))} journal entries of an unclean shutdown '
+						f'({Col(applied)} were written back already)')
+		self.__logged = applied
+		for record in records:
+			e = LogEntry.from_record(record)
+			if e.op == File_Ops.WRITE:
+				self.__add_write(e.inode, e.path, record.offset, record.length, logged=True)
+			else:
+				self.__append(e, logged=True)
+		self.flushCompleteJournal()
+		return len(records)
 
 	def getDirtyPaths(self) -> tuple[list[Path], int]:
+		""":returns: cache files with unwritten writes (recovered entries have no inode) and their dirty bytes"""
 		dirty_paths: list[Path] = []
 		write_ops_reserved_size: int = 0
 		for logEntry in self.__history:
 			if logEntry.op != File_Ops.WRITE:
 				continue
-			(_, bytes_written) = getattr(logEntry, 'writes')
-			dirty_paths.append(self.disk.ino_toTmp(logEntry.inode))
-			write_ops_reserved_size += bytes_written
+			dirty_paths.append(Path(logEntry.path))
+			write_ops_reserved_size += logEntry.ranges.size
 		return dirty_paths, write_ops_reserved_size
 
+	def dirtyInodes(self) -> set[int]:
+		return set(self.__inode_dirty_map2).union(self.__flushing)
+
 	def isDirty(self, inode: int) -> bool:
-		return inode in self.__inode_dirty_map2
+		return inode in self.__inode_dirty_map2 or inode in self.__flushing
 
 	def isCompletelyClean(self) -> bool:
-		return self.__inode_dirty_map2 == {}
+		return self.__inode_dirty_map2 == {} and self.__flushing == {}
 
 	def __markDirty(self, inode: int) -> None:
 		# only save the orginal file size
-		if not self.isDirty(inode):
-			self.__inode_dirty_map2[inode] = self.vfs.inode_path_map[inode].entry.st_size
+		if inode not in self.__inode_dirty_map2:
+			size: Optional[int] = self.__flushing.get(inode)
+			self.__inode_dirty_map2[inode] = self.vfs.inode_path_map[inode].st_size if size is None else size
+
+	def __append(self, e: LogEntry, logged: bool = False) -> None:
+		""":param logged: `e` is in the write-ahead log already (recovered)"""
+		# writes after `e` are replayed after it
+		self.__open_writes.clear()
+		e.lsn = self.__log(e.record(), logged)
+		self.__history.append(e)
+
+	def __add_write(self, inode: int, path: str, offset: int, bytes_written: int, logged: bool = False) -> None:
+		if bytes_written <= 0 and not logged:
+			return
+		e: Optional[LogEntry] = self.__open_writes.get(path)
+		if e is None:
+			e = self.__open_writes[path] = LogEntry(File_Ops.WRITE, inode, path)
+			self.__history.append(e)
+		# rewriting dirty bytes changes nothing for the writeback
+		added: int = e.ranges.add(offset, bytes_written)
+		self.bytes_unwritten += added
+		if added or logged:
+			lsn = self.__log(WalRecord(File_Ops.WRITE.value, inode, path, offset, bytes_written), logged)
+			e.lsn = e.lsn or lsn
+
+	def __log(self, record: WalRecord, logged: bool) -> int:
+		""":returns: number of `record` in the log"""
+		self.__logged += 1
+		if self.dirty_since is None:
+			self.dirty_since = time.monotonic()
+		if self.wal is not None and not logged:
+			self.wal.append(record)
+		return self.__logged
+
+	async def commit(self) -> None:
+		"""Waits until the log has every entry so far on disk"""
+		if self.wal is not None:
+			await self.wal.commit()
 
 	# public api
 	# ==========
@@ -247,13 +638,11 @@ class Journal:
 		self.__markDirty(ino_p)
 		e: LogEntry = LogEntry(File_Ops.CREATE, inode, self.disk.toTmp(path).__str__())
 		e.flags = flags
-		self.__history.append(e)
+		self.__append(e)
 
 	def log_write(self, inode: int, offset: int, bytes_written: int) -> None:
 		self.__markDirty(inode)
-		e: LogEntry = LogEntry(File_Ops.WRITE, inode, self.disk.ino_toTmp(inode).__str__())
-		e.writes = (offset, bytes_written)
-		self.__history.append(e)
+		self.__add_write(inode, self.disk.ino_toTmp(inode).__str__(), offset, bytes_written)
 
 	def log_flush(self, inode: int, fh: int) -> None:
 		"""Re-calculates unwritten"""
@@ -264,7 +653,7 @@ class Journal:
 		return
 
 		# oh, actually we can just diff for the size lol
-		curr_size = self.vfs.inode_path_map[inode].entry.st_size
+		curr_size = self.vfs.inode_path_map[inode].st_size
 		prev_size = self.__inode_dirty_map2[inode]
 
 		self.bytes_unwritten += (curr_size - prev_size)
@@ -274,7 +663,7 @@ class Journal:
 		self.__markDirty(inode)
 		e: LogEntry = LogEntry(File_Ops.RENAME, inode, path_old)
 		e.path_new = path_new
-		self.__history.append(e)
+		self.__append(e)
 
 	def log_unlink(self, inode_p: int, inode: int, path: str) -> None:
 		"""Delete inode in inode_p"""
@@ -289,7 +678,7 @@ class Journal:
 		#           to at least mitigate/shrink the potential data loss
 		#  - [ ] path has to be checked if it's in cache tracked
 		self.src_bytes_avail += size
-		self.__history.append(e)
+		self.__append(e)
 
 	def log_rmdir(self, inode_p: int, inode: int, path: str) -> None:
 		self.log_unlink(inode_p, inode, path)
@@ -299,4 +688,4 @@ class Journal:
 		self.__markDirty(inode_p)
 		e: LogEntry = LogEntry(File_Ops.MKDIR, inode, path=path)
 		e.mode = mode
-		self.__history.append(e)
+		self.__append(e)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# job of this module:
+#  - remember what is in the cache directory across restarts (path, size, source version, recency, completeness)
+#  - so a restart can adopt the cache files instead of copying them again
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Final, Iterable, NamedTuple
+
+from src.libwolfs.util import Col
+
+log = logging.getLogger(__name__)
+
+
+class ManifestEntry(NamedTuple):
+	"""One cached file or directory, `src_size`/`src_mtime_ns` describe the source version it was copied from"""
+	rpath: str
+	size: int
+	src_size: int
+	src_mtime_ns: int
+	complete: bool
+
+
+class Manifest:
+	"""
+	JSON lines in the cache directory: a header followed by one entry per line,
+	from the least to the most recently used one
+	"""
+	FILE_NAME: Final[str] = '.wolfs-manifest'
+	VERSION: Final[int] = 1
+
+	def __init__(self, cacheDir: Path) -> None:
+		self.path: Path = cacheDir / Manifest.FILE_NAME
+
+	def save(self, entries: Iterable[ManifestEntry], chunk_size: int) -> int:
+		""":returns: number of saved entries"""
+		tmp = f'{self.path}.tmp'
+		count: int = 0
+		with open(tmp, 'w') as f:
+			f.write(json.dumps({'version': Manifest.VERSION, 'chunk_size': chunk_size}) + '\n')
+			for entry in entries:
+				f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+				count += 1
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp, self.path)
+		return count
+
+	def load(self, chunk_size: int) -> list[ManifestEntry]:
+		"""
+		:param chunk_size: a manifest written with another chunk size doesn't match the cache files anymore
+		:returns: entries from the least to the most recently used one, nothing if there is no (usable) manifest
+		"""
+		try:
+			with open(self.path) as f:
+				header = json.loads(f.readline() or '{}')
+				if header.get('version') != Manifest.VERSION or header.get('chunk_size') != chunk_size:
+					log.warning(f'Ignoring cache manifest {Col(self.path)} ({header})')
+					return []
+				return [ManifestEntry(*json.loads(line)) for line in f if line.strip()]
+		except FileNotFoundError:
+			return []
+		except (ValueError, TypeError) as exc:
+			log.warning(f'Ignoring corrupted cache manifest {Col(self.path)}: {exc}')
+			return []
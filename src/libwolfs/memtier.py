@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# job of this module:
+#  - keep hot small files (whole) and hot blocks of bigger files in RAM above the cache directory,
+#    a read served from here costs no syscall
+#  - promote what is read often, demote the least frequently read entries once it is full
+#  - forget an inode as soon as it is written to or truncated (see VFSOps)
+
+import logging
+from typing import Callable, Final, Hashable, Optional, Union
+
+from src.libwolfs.policy import LFU, TinyLFU
+
+log = logging.getLogger(__name__)
+
+Buffer = Union[bytes, memoryview]
+
+
+class MemoryTier:
+	"""
+	Keys are inodes for files of up to `max_file_size` bytes (kept whole) and (ino, block index) for
+	`BLOCK_SIZE` blocks of bigger ones. Reads are counted by a TinyLFU sketch: a key is promoted once it was
+	read `promote_after` times recently and demotes an entry only if it was read more often than it
+	"""
+	BLOCK_SIZE: Final[int] = 64 * 1024
+	PROMOTE_AFTER: Final[int] = 3
+
+	def __init__(self, capacity: int, max_file_size: int = BLOCK_SIZE, promote_after: int = PROMOTE_AFTER) -> None:
+		""":param capacity: bytes kept in RAM, 0 disables the tier"""
+		self.capacity: int = capacity
+		self.max_file_size: int = max_file_size
+		self.promote_after: int = promote_after
+		self.policy = LFU(capacity)
+		self.frequency = TinyLFU(capacity, width=1 << 12)
+		self.__data: dict[Hashable, bytes] = dict()
+		self.__blocks: dict[int, set[int]] = dict()
+		self.hits: int = 0
+		self.misses: int = 0
+
+	def read(self, ino: int, offset: int, length: int) -> Optional[Buffer]:
+		""":returns: the data if it is in RAM completely, otherwise None (the read counts towards a promotion)"""
+		if not self.capacity:
+			return None
+		data: Optional[bytes] = self.__data.get(ino)
+		if data is not None:
+			self.__hit(ino)
+			return memoryview(data)[offset:offset + length]
+
+		first, last = self.__block_range(offset, length)
+		self.frequency.record(ino)
+		blocks: Optional[set[int]] = self.__blocks.get(ino)
+		if blocks is not None and all(idx in blocks for idx in range(first, last + 1)):
+			for idx in range(first, last + 1):
+				self.__hit((ino, idx))
+			start: int = offset - first * MemoryTier.BLOCK_SIZE
+			if first == last:
+				return memoryview(self.__data[(ino, first)])[start:start + length]
+			joined = b''.join(self.__data[(ino, idx)] for idx in range(first, last + 1))
+			return memoryview(joined)[start:start + length]
+
+		self.misses += 1
+		for idx in range(first, last + 1):
+			self.frequency.record((ino, idx))
+		return None
+
+	def hot(self, ino: int) -> bool:
+		"""Is `ino` read often enough to load (parts of) it into RAM?"""
+		return self.capacity > 0 and self.frequency.estimate(ino) >= self.promote_after
+
+	def span(self, size: int, offset: int, length: int) -> tuple[int, int]:
+		""":returns: (offset, length) of what `load` would read for a read of [offset, offset + length)"""
+		if size <= self.max_file_size:
+			return 0, size
+		first, last = self.__block_range(offset, length)
+		start: int = first * MemoryTier.BLOCK_SIZE
+		return start, min(size, (last + 1) * MemoryTier.BLOCK_SIZE) - start
+
+	def load(self, ino: int, size: int, offset: int, length: int, reader: Callable[[int, int], bytes]) -> int:
+		"""
+		Promotes the hot parts of `ino` touched by the read [offset, offset + length)
+		:param size: size of the file
+		:param reader: reads (length, offset) from the cache file
+		:returns: bytes loaded into RAM
+		"""
+		if size <= self.max_file_size:
+			if ino in self.__data or not self.hot(ino):
+				return 0
+			return size if self.__store(ino, reader(size, 0)) else 0
+
+		loaded: int = 0
+		first, last = self.__block_range(offset, min(length, max(0, size - offset)))
+		for idx in range(first, last + 1):
+			key = (ino, idx)
+			if key in self.__data or self.frequency.estimate(key) < self.promote_after:
+				continue
+			start: int = idx * MemoryTier.BLOCK_SIZE
+			block: bytes = reader(min(MemoryTier.BLOCK_SIZE, size - start), start)
+			if block and self.__store(key, block):
+				self.__blocks.setdefault(ino, set()).add(idx)
+				loaded += len(block)
+		return loaded
+
+	def invalidate(self, ino: int) -> None:
+		"""`ino` changed (or is gone), drops everything of it"""
+		if ino in self.__data:
+			self.__drop(ino)
+		for idx in self.__blocks.pop(ino, ()):
+			self.__drop((ino, idx))
+
+	def __store(self, key: Hashable, data: bytes) -> bool:
+		size: int = len(data)
+		if size > self.capacity:
+			return False
+		wanted: int = self.frequency.estimate(key)
+		while self.policy.used + size > self.capacity:
+			victim: Optional[Hashable] = self.policy.victim()
+			# demote only what is read less often
+			if victim is None or self.frequency.estimate(victim) >= wanted:
+				return False
+			self.__drop(victim)
+			if isinstance(victim, tuple):
+				self.__blocks[victim[0]].discard(victim[1])
+				if not self.__blocks[victim[0]]:
+					del self.__blocks[victim[0]]
+		self.__data[key] = data
+		self.policy.on_insert(key, size)
+		return True
+
+	def __drop(self, key: Hashable) -> None:
+		del self.__data[key]
+		self.policy.on_remove(key, evicted=True)
+
+	def __hit(self, key: Hashable) -> None:
+		self.hits += 1
+		self.policy.on_access(key)
+		self.frequency.record(key)
+
+	@staticmethod
+	def __block_range(offset: int, length: int) -> tuple[int, int]:
+		first: int = offset // MemoryTier.BLOCK_SIZE
+		return first, max(first, (offset + length - 1) // MemoryTier.BLOCK_SIZE)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self.__data
+
+	def __len__(self) -> int:
+		return len(self.__data)
+
+	def __repr__(self) -> str:
+		return (f'MemoryTier({len(self)} entries, {self.policy.used}/{self.capacity} bytes, '
+				f'hits={self.hits}, misses={self.misses})')
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# job of this module:
+#  - hand out file descriptors of source files for passthrough opens (files which aren't cached)
+#  - share one fd between opens of the same file and keep closed ones around for a while,
+#    opening a file on a remote source costs a round trip
+#  - read and write them with pread/pwrite in a worker thread so a slow source doesn't block the trio loop
+
+import logging
+import os
+from collections import OrderedDict
+from typing import Final
+
+import trio
+
+from src.libwolfs.util import Path_str
+
+log = logging.getLogger(__name__)
+
+
+class SourceFds:
+	DEFAULT_IDLE: Final[int] = 64
+
+	def __init__(self, idle_max: int = DEFAULT_IDLE) -> None:
+		""":param idle_max: fds of closed files kept open for the next open of the same file"""
+		self.idle_max: int = idle_max
+		# (path, writable) -> fd, the idle ones from the least to the most recently closed one
+		self.__active: dict[tuple[str, bool], int] = dict()
+		self.__idle: OrderedDict[tuple[str, bool], int] = OrderedDict()
+		self.__keys: dict[int, tuple[str, bool]] = dict()
+		self.__refs: dict[int, int] = dict()
+		self.opened: int = 0
+		self.reused: int = 0
+
+	def open(self, path: Path_str, writable: bool = False, truncate: bool = False) -> int:
+		""":raises OSError: if the source file can't be opened"""
+		key = (str(path), writable)
+		fd = self.__active.get(key)
+		if fd is None:
+			fd = self.__idle.pop(key, None)
+			if fd is None:
+				fd = os.open(key[0], os.O_RDWR if writable else os.O_RDONLY)
+				self.opened += 1
+				self.__keys[fd] = key
+			else:
+				self.reused += 1
+			self.__active[key] = fd
+			self.__refs[fd] = 0
+		else:
+			self.reused += 1
+		self.__refs[fd] += 1
+		if truncate:
+			os.ftruncate(fd, 0)
+		return fd
+
+	def close(self, fd: int) -> None:
+		"""Gives `fd` back, fds the pool doesn't know (anymore) are closed right away"""
+		key = self.__keys.get(fd)
+		if key is None:
+			os.close(fd)
+			return
+		self.__refs[fd] -= 1
+		if self.__refs[fd] > 0:
+			return
+		del self.__refs[fd]
+		del self.__active[key]
+		self.__idle[key] = fd
+		while len(self.__idle) > self.idle_max:
+			self.__drop(*self.__idle.popitem(last=False))
+
+	def detach(self, fd: int) -> None:
+		"""The caller owns `fd` from now on (e.g. it was dup2'ed over), other opens get a new one"""
+		key = self.__keys.pop(fd, None)
+		if key is not None:
+			self.__refs.pop(fd, None)
+			self.__active.pop(key, None)
+
+	def invalidate(self, path: Path_str) -> None:
+		"""`path` was renamed or deleted: idle fds of it must not be handed out for a new file of that name"""
+		for writable in (False, True):
+			key = (str(path), writable)
+			fd = self.__idle.pop(key, None)
+			if fd is not None:
+				self.__drop(key, fd)
+			fd = self.__active.get(key)
+			if fd is not None:
+				# keeps working for whoever has it open, closed on its last release
+				self.detach(fd)
+
+	def close_all(self) -> None:
+		for key, fd in list(self.__idle.items()):
+			self.__drop(key, fd)
+		self.__idle.clear()
+
+	def __drop(self, key: tuple[str, bool], fd: int) -> None:
+		self.__keys.pop(fd, None)
+		try:
+			os.close(fd)
+		except OSError as exc:
+			log.warning(f'Closing source fd of {key[0]} failed: {exc}')
+
+	def __contains__(self, fd: int) -> bool:
+		return fd in self.__keys
+
+	def __repr__(self) -> str:
+		return (f'SourceFds(active={len(self.__active)}, idle={len(self.__idle)}, '
+				f'opened={self.opened}, reused={self.reused})')
+
+
+async def pread(fd: int, length: int, offset: int) -> bytes:
+	return await trio.to_thread.run_sync(os.pread, fd, length, offset)
+
+
+async def pwrite(fd: int, buf: bytes, offset: int) -> int:
+	return await trio.to_thread.run_sync(os.pwrite, fd, buf, offset)
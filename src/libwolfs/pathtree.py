@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# job of this module:
+#  - store root paths component-wise (one node per name) instead of as full strings
+#    -> siblings share their parent prefix, so memory grows with the number of names
+#       and not with the total length of all paths
+#  - renaming a directory is a pointer swap, descendants follow automatically
+#  - parent lookups are a pointer hop instead of string slicing
+
+from typing import Iterator, Optional, Union
+
+PathNode_set = Union['PathNode', set['PathNode']]
+
+
+class PathNode:
+	"""A single path component. `ino == 0` marks an in between node without an inode"""
+	__slots__ = ('name', 'parent', 'children', 'ino')
+
+	def __init__(self, name: str, parent: Optional['PathNode'], ino: int = 0) -> None:
+		self.name: str = name
+		self.parent: Optional[PathNode] = parent
+		# most nodes are files -> only allocate a dict if we really need one
+		self.children: Optional[dict[str, PathNode]] = None
+		self.ino: int = ino
+
+	def child(self, name: str) -> Optional['PathNode']:
+		return self.children.get(name) if self.children else None
+
+	def attach(self, node: 'PathNode') -> None:
+		if self.children is None:
+			self.children = dict()
+		node.parent = self
+		self.children[node.name] = node
+
+	def detach(self, node: 'PathNode') -> None:
+		assert self.children is not None and self.children.get(node.name) is node, "Consistency Error"
+		del self.children[node.name]
+		if not self.children:
+			self.children = None
+		node.parent = None
+
+	def rpath(self) -> str:
+		"""walks up to the root and joins the names on the way"""
+		names: list[str] = []
+		node: Optional[PathNode] = self
+		while node is not None and node.parent is not None:
+			names.append(node.name)
+			node = node.parent
+		return '/' + '/'.join(reversed(names)) if names else '/'
+
+	def __repr__(self) -> str:
+		return f'PathNode({self.rpath()!r}, ino={self.ino})'
+
+
+class PathTree:
+	"""
+	Radix tree of root paths (e.g. '/dir/file') mapping to inodes and back.
+	Hardlinks are modelled as multiple nodes sharing the same inode.
+	"""
+
+	def __init__(self, root_ino: int) -> None:
+		self.root: PathNode = PathNode('', None, root_ino)
+		self.__ino_nodes: dict[int, PathNode_set] = {root_ino: self.root}
+
+	@staticmethod
+	def split(rpath: str) -> list[str]:
+		return [name for name in rpath.split('/') if name]
+
+	# lookups
+	# =======
+
+	def node(self, rpath: str) -> Optional[PathNode]:
+		node: Optional[PathNode] = self.root
+		for name in PathTree.split(rpath):
+			node = node.child(name)  # type: ignore
+			if node is None:
+				return None
+		return node
+
+	def get(self, rpath: str) -> Optional[int]:
+		"""inode of `rpath` or None if it isn't known"""
+		node = self.node(rpath)
+		return node.ino if node is not None and node.ino != 0 else None
+
+	def __contains__(self, rpath: str) -> bool:
+		return self.get(rpath) is not None
+
+	def has_ino(self, ino: int) -> bool:
+		return ino in self.__ino_nodes
+
+	def nodes(self, ino: int) -> list[PathNode]:
+		maybe_nodes = self.__ino_nodes.get(ino)
+		if maybe_nodes is None:
+			return []
+		return list(maybe_nodes) if isinstance(maybe_nodes, set) else [maybe_nodes]
+
+	def ino_node(self, ino: int) -> Optional[PathNode]:
+		"""some node of `ino` (the first one if there are hardlinks)"""
+		maybe_nodes = self.__ino_nodes.get(ino)
+		if isinstance(maybe_nodes, set):
+			return next(iter(maybe_nodes))
+		return maybe_nodes
+
+	def parent_ino(self, ino: int) -> Optional[int]:
+		"""inode of the directory containing `ino` (root is its own parent)"""
+		node = self.ino_node(ino)
+		if node is None:
+			return None
+		if node.parent is None:
+			return node.ino if node is self.root else None
+		return node.parent.ino
+
+	def walk(self, node: Optional[PathNode] = None) -> Iterator[PathNode]:
+		"""depth first iteration over all nodes below (and including) `node`"""
+		stack: list[PathNode] = [node if node is not None else self.root]
+		while stack:
+			node = stack.pop()
+			yield node
+			if node.children:
+				stack.extend(node.children.values())
+
+	# modifications
+	# =============
+
+	def insert(self, rpath: str, ino: int) -> PathNode:
+		"""Map `rpath` to `ino`. Creates in between nodes if necessary"""
+		assert ino > 0, "inos cant be negative"
+		node: PathNode = self.root
+		for name in PathTree.split(rpath):
+			next_node = node.child(name)
+			if next_node is None:
+				next_node = PathNode(name, node)
+				node.attach(next_node)
+			node = next_node
+
+		if node.ino == ino:
+			return node
+		assert node.ino == 0, f"Logic Error: {rpath} already maps to {node.ino}"
+		node.ino = ino
+
+		maybe_nodes = self.__ino_nodes.get(ino)
+		if maybe_nodes is None:
+			self.__ino_nodes[ino] = node
+		elif isinstance(maybe_nodes, set):
+			maybe_nodes.add(node)
+		else:
+			self.__ino_nodes[ino] = {maybe_nodes, node}
+		return node
+
+	def remove(self, rpath: str) -> int:
+		"""
+		Unmaps `rpath`.
+		:returns: the inode count of `ino` left afterwards (0 -> inode is free now)
+		"""
+		node = self.node(rpath)
+		assert node is not None and node.ino != 0, f"Logic Error: {rpath} is not mapped"
+		assert node is not self.root, "Root can't be removed"
+		ino = node.ino
+
+		maybe_nodes = self.__ino_nodes[ino]
+		left: int = 0
+		if isinstance(maybe_nodes, set):
+			maybe_nodes.remove(node)
+			left = len(maybe_nodes)
+			# return to original single node type
+			if left == 1:
+				self.__ino_nodes[ino] = maybe_nodes.pop()
+		else:
+			del self.__ino_nodes[ino]
+
+		node.ino = 0
+		self.__prune(node)
+		return left
+
+	def move(self, rpath_old: str, rpath_new: str) -> PathNode:
+		"""
+		Moves the node of `rpath_old` (and with it the whole subtree) to `rpath_new`
+		in O(depth) regardless of the amount of descendants.
+		"""
+		node = self.node(rpath_old)
+		assert node is not None and node.ino != 0, f"Logic Error: {rpath_old} is not mapped"
+		assert node is not self.root, "Root can't be moved"
+		assert self.get(rpath_new) is None, f"{rpath_new} is already mapped"
+
+		*parent_names, name = PathTree.split(rpath_new)
+		parent: PathNode = self.root
+		for parent_name in parent_names:
+			next_node = parent.child(parent_name)
+			if next_node is None:
+				next_node = PathNode(parent_name, parent)
+				parent.attach(next_node)
+			parent = next_node
+
+		# a directory can't be moved into itself
+		ancestor: Optional[PathNode] = parent
+		while ancestor is not None:
+			assert ancestor is not node, f"Can't move {rpath_old} into itself ({rpath_new})"
+			ancestor = ancestor.parent
+
+		old_parent = node.parent
+		assert old_parent is not None
+		old_parent.detach(node)
+
+		# an unmapped in between node might already exist at the destination (e.g. from a removed path)
+		if (existing := parent.child(name)) is not None:
+			assert existing.ino == 0
+			if existing.children:
+				for child in list(existing.children.values()):
+					assert node.child(child.name) is None, f"{rpath_new}/{child.name} would be shadowed"
+					existing.detach(child)
+					node.attach(child)
+			parent.detach(existing)
+
+		node.name = name
+		parent.attach(node)
+		self.__prune(old_parent)
+		return node
+
+	def __prune(self, node: Optional[PathNode]) -> None:
+		"""removes unmapped leafs on the way up to the root"""
+		while node is not None and node is not self.root and node.ino == 0 and not node.children:
+			parent = node.parent
+			if parent is None:
+				break
+			parent.detach(node)
+			node = parent
+
+	def __len__(self) -> int:
+		return len(self.__ino_nodes)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# job of this module:
+#  - remember which files/directories the user pinned into the cache (see XAttrsOps)
+#  - tell if an inode is pinned itself or lies below a pinned directory, so it isn't evicted
+
+import logging
+from typing import Iterator
+
+from src.libwolfs.translator import InodeTranslator
+
+log = logging.getLogger(__name__)
+
+
+class Pins:
+	"""
+	Pinned inodes. Pinning a directory pins everything below it, files created or moved in there later on too
+	(membership is looked up along the path instead of being copied onto the children)
+	"""
+
+	def __init__(self, translator: InodeTranslator) -> None:
+		self.__translator = translator
+		self.roots: set[int] = set()
+
+	def pin(self, ino: int) -> None:
+		self.roots.add(ino)
+
+	def unpin(self, ino: int) -> bool:
+		""":returns: False if `ino` wasn't pinned itself (it might still be pinned by a directory above it)"""
+		if ino not in self.roots:
+			return False
+		self.roots.remove(ino)
+		return True
+
+	def pinned_by(self, ino: int) -> Iterator[int]:
+		"""pinned inodes on the way from `ino` up to the root"""
+		translator = self.__translator
+		while translator.ino_exists(ino):
+			if ino in self.roots:
+				yield ino
+			parent = translator.ino_parent(ino)
+			if parent == ino:
+				return
+			ino = parent
+
+	def __contains__(self, ino: object) -> bool:
+		if not self.roots or not isinstance(ino, int):
+			return False
+		return next(self.pinned_by(ino), None) is not None
+
+	def __len__(self) -> int:
+		return len(self.roots)
@@ -0,0 +1,580 @@
+#!/usr/bin/env python
+# job of this module:
+#  - decide what gets evicted from the cache (and whether something is worth caching at all, see `Admission`)
+#  - keep eviction strategies swappable so Disk/Cache don't care which one is used
+#  - replay access traces offline to compare strategies before mounting with one of them
+#
+# Keys are opaque hashables (inodes for whole files), sizes are in bytes.
+
+import dataclasses
+import heapq
+from collections import OrderedDict
+from typing import Container, Final, Hashable, Iterable, Optional
+
+
+class EvictionPolicy:
+	"""
+	Base class of all eviction policies.
+	Subclasses implement the `_insert`, `_access`, `_remove` and `_victim` hooks,
+	the public methods keep the byte accounting consistent.
+	"""
+	name: str = ''
+
+	def __init__(self, capacity: int) -> None:
+		""":param capacity: size of the cache in bytes"""
+		self.capacity: int = capacity
+		self.used: int = 0
+		self.sizes: dict[Hashable, int] = dict()
+		# logical time of the last insert/access of every key, independent of the policy (see `recency`)
+		self.last_access: dict[Hashable, int] = dict()
+		self.__clock: int = 0
+
+	# public api
+	# ==========
+
+	def admit(self, key: Hashable, size: int) -> bool:
+		"""Is `key` worth caching at all?"""
+		return size <= self.capacity
+
+	def on_insert(self, key: Hashable, size: int) -> None:
+		"""`key` was stored. Re-inserting a known key updates its size and counts as an access"""
+		old_size: Optional[int] = self.sizes.get(key)
+		self.sizes[key] = size
+		self.__stamp(key)
+		if old_size is None:
+			self.used += size
+			self._insert(key, size)
+		else:
+			self.used += size - old_size
+			self._resize(key, old_size, size)
+			self._access(key)
+
+	def on_resize(self, key: Hashable, size: int) -> None:
+		"""The size of `key` changed without an access (e.g. its disk usage was measured again)"""
+		old_size: Optional[int] = self.sizes.get(key)
+		if old_size is None or old_size == size:
+			return
+		self.sizes[key] = size
+		self.used += size - old_size
+		self._resize(key, old_size, size)
+
+	def on_access(self, key: Hashable) -> None:
+		if key in self.sizes:
+			self.__stamp(key)
+			self._access(key)
+
+	def on_remove(self, key: Hashable, evicted: bool = False) -> None:
+		"""
+		`key` left the cache.
+		:param evicted: True if it was removed to make room (policies might remember it)
+		  and False if it was deleted/renamed
+		"""
+		size: Optional[int] = self.sizes.pop(key, None)
+		if size is None:
+			return
+		self.used -= size
+		del self.last_access[key]
+		self._remove(key, size, evicted)
+
+	def victim(self, skip: Optional[Container[Hashable]] = None) -> Optional[Hashable]:
+		"""
+		Next key to evict. Doesn't remove it, call `on_remove(key, evicted=True)` once it is gone.
+		:param skip: keys which can't be evicted right now (e.g. open or dirty files)
+		:returns: None if every cached key is in `skip`
+		"""
+		return self._victim(skip if skip is not None else ())
+
+	def recency(self) -> list[Hashable]:
+		"""cached keys from least to most recently used (re-inserting them in this order restores the recency)"""
+		return sorted(self.sizes, key=self.last_access.__getitem__)
+
+	def __stamp(self, key: Hashable) -> None:
+		self.__clock += 1
+		self.last_access[key] = self.__clock
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self.sizes
+
+	def __len__(self) -> int:
+		return len(self.sizes)
+
+	def __repr__(self) -> str:
+		return f'{self.__class__.__name__}({len(self)} keys, {self.used}/{self.capacity} bytes)'
+
+	# policy hooks
+	# ============
+
+	def _insert(self, key: Hashable, size: int) -> None:
+		raise NotImplementedError()
+
+	def _access(self, key: Hashable) -> None:
+		raise NotImplementedError()
+
+	def _resize(self, key: Hashable, old_size: int, new_size: int) -> None:
+		pass
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		raise NotImplementedError()
+
+	def _victim(self, skip: Container[Hashable]) -> Optional[Hashable]:
+		raise NotImplementedError()
+
+
+class LRU(EvictionPolicy):
+	"""Least recently used goes first"""
+	name = 'lru'
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__(capacity)
+		self.__order: OrderedDict[Hashable, None] = OrderedDict()
+
+	def _insert(self, key: Hashable, size: int) -> None:
+		self.__order[key] = None
+
+	def _access(self, key: Hashable) -> None:
+		self.__order.move_to_end(key)
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		del self.__order[key]
+
+	def _victim(self, skip: Container[Hashable]) -> Optional[Hashable]:
+		for key in self.__order:
+			if key not in skip:
+				return key
+		return None
+
+
+class _HeapPolicy(EvictionPolicy):
+	"""Evicts the key with the lowest `_priority()`, ties are broken by insertion/access order"""
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__(capacity)
+		# stale heap entries are skipped lazily, `__current` holds the valid one per key
+		self.__heap: list[tuple[float, int, Hashable]] = []
+		self.__current: dict[Hashable, tuple[float, int]] = dict()
+		self.__tick: int = 0
+
+	def _priority(self, key: Hashable) -> float:
+		raise NotImplementedError()
+
+	def _push(self, key: Hashable) -> None:
+		self.__tick += 1
+		entry = (self._priority(key), self.__tick)
+		self.__current[key] = entry
+		heapq.heappush(self.__heap, (entry[0], entry[1], key))
+
+		# don't let stale entries pile up
+		if len(self.__heap) > 2 * len(self.__current) + 64:
+			self.__heap = [(prio, tick, k) for k, (prio, tick) in self.__current.items()]
+			heapq.heapify(self.__heap)
+
+	def _current_priority(self, key: Hashable) -> float:
+		return self.__current[key][0]
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		del self.__current[key]
+
+	def _victim(self, skip: Container[Hashable]) -> Optional[Hashable]:
+		heap = self.__heap
+		skipped: list[tuple[float, int, Hashable]] = []
+		found: Optional[Hashable] = None
+		while heap:
+			prio, tick, key = heap[0]
+			if self.__current.get(key) != (prio, tick):
+				heapq.heappop(heap)
+			elif key in skip:
+				skipped.append(heapq.heappop(heap))
+			else:
+				found = key
+				break
+		for entry in skipped:
+			heapq.heappush(heap, entry)
+		return found
+
+
+class LFU(_HeapPolicy):
+	"""Least frequently used goes first (least recently used among equally frequent ones)"""
+	name = 'lfu'
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__(capacity)
+		self._freq: dict[Hashable, int] = dict()
+
+	def _priority(self, key: Hashable) -> float:
+		return self._freq[key]
+
+	def _insert(self, key: Hashable, size: int) -> None:
+		self._freq[key] = 1
+		self._push(key)
+
+	def _access(self, key: Hashable) -> None:
+		self._freq[key] += 1
+		self._push(key)
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		super()._remove(key, size, evicted)
+		del self._freq[key]
+
+
+class GDSF(LFU):
+	"""
+	Greedy-Dual-Size-Frequency: priority = L + frequency / size
+	Small, often used files stay; huge files have to be used a lot to keep their space.
+	`L` is raised to the priority of every evicted key so long unused entries age out.
+	"""
+	name = 'gdsf'
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__(capacity)
+		self.__inflation: float = 0.0
+
+	def _priority(self, key: Hashable) -> float:
+		return self.__inflation + self._freq[key] / max(self.sizes[key], 1)
+
+	def _resize(self, key: Hashable, old_size: int, new_size: int) -> None:
+		self._push(key)
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		if evicted:
+			self.__inflation = max(self.__inflation, self._current_priority(key))
+		super()._remove(key, size, evicted)
+
+
+class ARC(EvictionPolicy):
+	"""
+	Adaptive Replacement Cache (Megiddo & Modha) measured in bytes instead of entries:
+	  T1: seen once recently, T2: seen at least twice recently
+	  B1/B2: ghosts of keys evicted from T1/T2 which steer the target size `p` of T1
+	"""
+	name = 'arc'
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__(capacity)
+		self.__t1: OrderedDict[Hashable, None] = OrderedDict()
+		self.__t2: OrderedDict[Hashable, None] = OrderedDict()
+		self.__b1: OrderedDict[Hashable, int] = OrderedDict()
+		self.__b2: OrderedDict[Hashable, int] = OrderedDict()
+		self.__t1_bytes: int = 0
+		self.__b1_bytes: int = 0
+		self.__b2_bytes: int = 0
+		self.p: float = 0.0
+
+	def _insert(self, key: Hashable, size: int) -> None:
+		if key in self.__b1:
+			# recency list was too small
+			delta = max(self.__b2_bytes / max(self.__b1_bytes, 1), 1) * size
+			self.p = min(float(self.capacity), self.p + delta)
+			self.__b1_bytes -= self.__b1.pop(key)
+			self.__t2[key] = None
+		elif key in self.__b2:
+			# frequency list was too small
+			delta = max(self.__b1_bytes / max(self.__b2_bytes, 1), 1) * size
+			self.p = max(0.0, self.p - delta)
+			self.__b2_bytes -= self.__b2.pop(key)
+			self.__t2[key] = None
+		else:
+			self.__t1[key] = None
+			self.__t1_bytes += size
+
+	def _access(self, key: Hashable) -> None:
+		if key in self.__t1:
+			del self.__t1[key]
+			self.__t1_bytes -= self.sizes[key]
+			self.__t2[key] = None
+		else:
+			self.__t2.move_to_end(key)
+
+	def _resize(self, key: Hashable, old_size: int, new_size: int) -> None:
+		if key in self.__t1:
+			self.__t1_bytes += new_size - old_size
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		if key in self.__t1:
+			del self.__t1[key]
+			self.__t1_bytes -= size
+			if evicted:
+				self.__b1[key] = size
+				self.__b1_bytes += size
+		else:
+			del self.__t2[key]
+			if evicted:
+				self.__b2[key] = size
+				self.__b2_bytes += size
+
+		# |T1| + |B1| <= c and |T1| + |T2| + |B1| + |B2| <= 2c
+		while self.__b1 and self.__t1_bytes + self.__b1_bytes > self.capacity:
+			self.__b1_bytes -= self.__b1.popitem(last=False)[1]
+		while self.__b2 and self.used + self.__b1_bytes + self.__b2_bytes > 2 * self.capacity:
+			self.__b2_bytes -= self.__b2.popitem(last=False)[1]
+
+	def _victim(self, skip: Container[Hashable]) -> Optional[Hashable]:
+		lists = (self.__t1, self.__t2) if self.__t1_bytes > self.p else (self.__t2, self.__t1)
+		for lst in lists:
+			for key in lst:
+				if key not in skip:
+					return key
+		return None
+
+
+class S3FIFO(EvictionPolicy):
+	"""
+	S3-FIFO (Yang et al.): a small probationary FIFO (10% of the capacity) filters out one-hit wonders,
+	keys accessed while in it are moved to the main FIFO which does a CLOCK-like second chance.
+	Evicted keys from the small queue are remembered in a ghost FIFO and go straight to main when they come back.
+	Note: looking for a victim already moves keys between the queues.
+	"""
+	name = 's3fifo'
+	SMALL_RATIO: Final[float] = 0.1
+	MAX_FREQ: Final[int] = 3
+
+	def __init__(self, capacity: int) -> None:
+		super().__init__(capacity)
+		self.__small: OrderedDict[Hashable, None] = OrderedDict()
+		self.__main: OrderedDict[Hashable, None] = OrderedDict()
+		self.__ghost: OrderedDict[Hashable, int] = OrderedDict()
+		self.__small_bytes: int = 0
+		self.__ghost_bytes: int = 0
+		self.__freq: dict[Hashable, int] = dict()
+
+	def _insert(self, key: Hashable, size: int) -> None:
+		self.__freq[key] = 0
+		if key in self.__ghost:
+			self.__ghost_bytes -= self.__ghost.pop(key)
+			self.__main[key] = None
+		else:
+			self.__small[key] = None
+			self.__small_bytes += size
+
+	def _access(self, key: Hashable) -> None:
+		self.__freq[key] = min(self.__freq[key] + 1, S3FIFO.MAX_FREQ)
+
+	def _resize(self, key: Hashable, old_size: int, new_size: int) -> None:
+		if key in self.__small:
+			self.__small_bytes += new_size - old_size
+
+	def _remove(self, key: Hashable, size: int, evicted: bool) -> None:
+		del self.__freq[key]
+		if key in self.__small:
+			del self.__small[key]
+			self.__small_bytes -= size
+			if evicted:
+				self.__ghost[key] = size
+				self.__ghost_bytes += size
+				while self.__ghost_bytes > self.capacity:
+					self.__ghost_bytes -= self.__ghost.popitem(last=False)[1]
+		else:
+			del self.__main[key]
+
+	def __sweep(self, queue: OrderedDict[Hashable, None], skip: Container[Hashable]) -> Optional[Hashable]:
+		"""Walks `queue` from its head, keys in `skip` are requeued as if they were accessed"""
+		skipped: int = 0
+		while queue and skipped < len(queue):
+			key = next(iter(queue))
+			if key in skip:
+				queue.move_to_end(key)
+				skipped += 1
+			elif self.__freq[key] > 0:
+				if queue is self.__small:
+					# promote to main
+					del self.__small[key]
+					self.__small_bytes -= self.sizes[key]
+					self.__main[key] = None
+					self.__freq[key] = 0
+				else:
+					self.__freq[key] -= 1
+					self.__main.move_to_end(key)
+				skipped = 0
+			else:
+				return key
+		return None
+
+	def _victim(self, skip: Container[Hashable]) -> Optional[Hashable]:
+		if self.__small_bytes >= S3FIFO.SMALL_RATIO * self.capacity or not self.__main:
+			queues = (self.__small, self.__main)
+		else:
+			queues = (self.__main, self.__small)
+		for queue in queues:
+			key = self.__sweep(queue, skip)
+			if key is not None:
+				return key
+		return None
+
+
+POLICIES: Final[dict[str, type[EvictionPolicy]]] = {p.name: p for p in (LRU, LFU, GDSF, ARC, S3FIFO)}
+DEFAULT_POLICY: Final[str] = LRU.name
+
+
+def make_policy(name: str, capacity: int) -> EvictionPolicy:
+	try:
+		return POLICIES[name](capacity)
+	except KeyError:
+		raise ValueError(f'Unknown eviction policy {name!r} (choose from: {", ".join(POLICIES)})')
+
+
+# =========
+# Admission
+# =========
+
+class Admission:
+	"""
+	Filter in front of the eviction policy: decides on a miss whether a file is worth displacing cached ones.
+	Rejected files are read from the source directly. This one admits everything that fits into the cache at all
+	"""
+	name: str = 'always'
+
+	def __init__(self, capacity: int) -> None:
+		""":param capacity: size of the cache in bytes"""
+		self.capacity: int = capacity
+		self.admitted: int = 0
+		self.rejected: int = 0
+
+	def record(self, key: Hashable) -> None:
+		"""`key` was requested (hit or miss)"""
+
+	def admit(self, key: Hashable, size: int, fits: bool, victim: Optional[Hashable]) -> bool:
+		"""
+		:param fits: `key` fits into the cache without evicting anything
+		:param victim: what the eviction policy would evict first to make room (None if nothing can go)
+		"""
+		admitted: bool = size <= self.capacity and (fits or self._admit(key, victim))
+		if admitted:
+			self.admitted += 1
+		else:
+			self.rejected += 1
+		return admitted
+
+	def _admit(self, key: Hashable, victim: Optional[Hashable]) -> bool:
+		return True
+
+	def __repr__(self) -> str:
+		return f'{self.__class__.__name__}(admitted={self.admitted}, rejected={self.rejected})'
+
+
+class TinyLFU(Admission):
+	"""
+	Admits a file which doesn't fit anymore only if it was requested more often than the victim it
+	displaces (TinyLFU, Einziger et al.), so a one-shot scan can't flush the hot files.
+	Request counts are approximated by a count-min sketch behind a doorkeeper (a file has to be requested twice
+	before it reaches the sketch) and halved every `sample_size` requests so old popularity fades.
+	"""
+	name = 'tinylfu'
+	ROWS: Final[int] = 4
+	MAX_COUNT: Final[int] = 15
+	__SEEDS: Final[tuple[int, ...]] = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5)
+	__MASK: Final[int] = (1 << 64) - 1
+	__HALVE: Final[bytes] = bytes(count >> 1 for count in range(256))
+
+	def __init__(self, capacity: int, width: int = 1 << 16) -> None:
+		""":param width: counters per row (a power of 2), should be a multiple of the number of cached files"""
+		super().__init__(capacity)
+		assert width > 1 and width & (width - 1) == 0, "width has to be a power of 2"
+		self.__shift: int = 64 - (width.bit_length() - 1)
+		self.__sketch: list[bytearray] = [bytearray(width) for _ in range(TinyLFU.ROWS)]
+		self.__doorkeeper: bytearray = bytearray(width)
+		self.sample_size: int = 10 * width
+		self.__samples: int = 0
+
+	def __slots_of(self, key: Hashable) -> list[int]:
+		h = hash(key) & TinyLFU.__MASK
+		return [((h * seed) & TinyLFU.__MASK) >> self.__shift for seed in TinyLFU.__SEEDS]
+
+	def record(self, key: Hashable) -> None:
+		slots = self.__slots_of(key)
+		door = self.__doorkeeper
+		if not (door[slots[0]] and door[slots[1]]):
+			door[slots[0]] = door[slots[1]] = 1
+		else:
+			# conservative update: only the smallest counters grow
+			counts = [row[slot] for row, slot in zip(self.__sketch, slots)]
+			least = min(counts)
+			if least < TinyLFU.MAX_COUNT:
+				for row, slot, count in zip(self.__sketch, slots, counts):
+					if count == least:
+						row[slot] = least + 1
+		self.__samples += 1
+		if self.__samples >= self.sample_size:
+			self.__age()
+
+	def estimate(self, key: Hashable) -> int:
+		""":returns: approximate number of recent requests of `key`"""
+		slots = self.__slots_of(key)
+		seen: int = 1 if self.__doorkeeper[slots[0]] and self.__doorkeeper[slots[1]] else 0
+		return seen + min(row[slot] for row, slot in zip(self.__sketch, slots))
+
+	def __age(self) -> None:
+		for row in self.__sketch:
+			row[:] = row.translate(TinyLFU.__HALVE)
+		self.__doorkeeper[:] = bytes(len(self.__doorkeeper))
+		self.__samples //= 2
+
+	def _admit(self, key: Hashable, victim: Optional[Hashable]) -> bool:
+		if victim is None:
+			return False  # nothing could make room for it anyway
+		return self.estimate(key) > self.estimate(victim)
+
+
+ADMISSIONS: Final[dict[str, type[Admission]]] = {a.name: a for a in (Admission, TinyLFU)}
+DEFAULT_ADMISSION: Final[str] = TinyLFU.name
+
+
+def make_admission(name: str, capacity: int) -> Admission:
+	try:
+		return ADMISSIONS[name](capacity)
+	except KeyError:
+		raise ValueError(f'Unknown admission filter {name!r} (choose from: {", ".join(ADMISSIONS)})')
+
+
+# ===============
+# Offline replays
+# ===============
+
+@dataclasses.dataclass
+class SimResult:
+	policy: str
+	requests: int = 0
+	hits: int = 0
+	requested_bytes: int = 0
+	hit_bytes: int = 0
+
+	@property
+	def hit_ratio(self) -> float:
+		return self.hits / self.requests if self.requests else 0.0
+
+	@property
+	def byte_hit_ratio(self) -> float:
+		return self.hit_bytes / self.requested_bytes if self.requested_bytes else 0.0
+
+
+def simulate(policy: EvictionPolicy, trace: Iterable[tuple[Hashable, int]],
+			 admission: Optional[Admission] = None) -> SimResult:
+	"""
+	Replays `trace` of (key, size) accesses against `policy` like Disk would:
+	misses get admitted, victims are evicted until the key fits
+	:param admission: filter misses have to pass before they are cached
+	"""
+	result = SimResult(policy.name if admission is None else f'{policy.name}+{admission.name}')
+	for key, size in trace:
+		result.requests += 1
+		result.requested_bytes += size
+		if admission is not None:
+			admission.record(key)
+		if key in policy:
+			result.hits += 1
+			result.hit_bytes += size
+			policy.on_access(key)
+			continue
+
+		if not policy.admit(key, size):
+			continue
+		if admission is not None:
+			fits = policy.used + size <= policy.capacity
+			if not admission.admit(key, size, fits, None if fits else policy.victim()):
+				continue
+		while policy.used + size > policy.capacity:
+			victim = policy.victim()
+			if victim is None:
+				break
+			policy.on_remove(victim, evicted=True)
+		if policy.used + size <= policy.capacity:
+			policy.on_insert(key, size)
+	return result
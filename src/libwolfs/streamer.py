@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# job of this module:
+#  - copy files into the cache in the background so open() can return right away
+#  - keep a watermark per inode of how far its copy got
+#  - let read()/write() wait only until their range has landed in the cache file
+
+import logging
+import os
+from pathlib import Path
+from typing import Awaitable, Callable, Final, Optional
+
+import trio
+
+from src.libwolfs.copyengine import copy_range
+from src.libwolfs.disk import Disk
+from src.libwolfs.util import Col, formatByteSize
+
+log = logging.getLogger(__name__)
+
+
+class Stream:
+	"""Progress of one background copy, everything below `watermark` is in the cache file already"""
+	__slots__ = ('ino', 'src', 'dst', 'size', 'watermark', 'error', 'done', 'cancel_scope', 'throttle', 'wanted',
+				 '_throttle_scope', '_progress')
+
+	def __init__(self, ino: int, src: Path, dst: Path, size: int,
+				 throttle: Optional[Callable[[int], Awaitable[None]]] = None) -> None:
+		self.ino: int = ino
+		self.src: Path = src
+		self.dst: Path = dst
+		self.size: int = size
+		self.watermark: int = 0
+		self.error: Optional[OSError] = None
+		self.done: trio.Event = trio.Event()
+		self.cancel_scope: trio.CancelScope = trio.CancelScope()
+		# awaited with the size of every piece (e.g. a bandwidth cap) until someone waits for the data
+		self.throttle: Optional[Callable[[int], Awaitable[None]]] = throttle
+		self.wanted: bool = False
+		self._throttle_scope: Optional[trio.CancelScope] = None
+		self._progress: trio.Event = trio.Event()
+
+	def advance(self, nbytes: int) -> None:
+		self.watermark += nbytes
+		self._progress.set()
+		self._progress = trio.Event()
+
+	def finish(self, error: Optional[OSError] = None) -> None:
+		self.error = error
+		self._progress.set()
+		self.done.set()
+
+	async def wait_for(self, end: int) -> None:
+		""":raises OSError: if the copy failed"""
+		end = min(end, self.size)
+		while self.watermark < end and not self.done.is_set():
+			self.wanted = True
+			if self._throttle_scope is not None:
+				self._throttle_scope.cancel()
+			await self._progress.wait()
+		if self.error is not None:
+			raise self.error
+
+	def __repr__(self) -> str:
+		return f'Stream({self.ino}, {formatByteSize(self.watermark)}/{formatByteSize(self.size)})'
+
+
+class Streamer:
+	PIECE_SIZE: Final[int] = 1024 * 1024
+
+	def __init__(self, disk: Disk, limiter: Optional[trio.CapacityLimiter] = None) -> None:
+		""":param limiter: worker pool the copies share with other fetches (trio's default pool if None)"""
+		self.disk = disk
+		self.__limiter = limiter
+		self.__streams: dict[int, Stream] = dict()
+		self.__nursery: Optional[trio.Nursery] = None
+
+	async def run(self, task_status: 'trio.TaskStatus[None]' = trio.TASK_STATUS_IGNORED) -> None:
+		"""hosts the copy tasks, runs until cancelled"""
+		async with trio.open_nursery() as nursery:
+			self.__nursery = nursery
+			task_status.started()
+			await trio.sleep_forever()
+
+	@property
+	def streaming(self) -> set[int]:
+		"""inodes with an unfinished copy (their cache files must not be evicted)"""
+		return set(self.__streams)
+
+	def is_streaming(self, ino: int) -> bool:
+		return ino in self.__streams
+
+	def progress(self, ino: int) -> Optional[int]:
+		""":returns: bytes of `ino` copied so far, None if it isn't streamed"""
+		stream = self.__streams.get(ino)
+		return stream.watermark if stream is not None else None
+
+	def start(self, ino: int, src: Path, dst: Path,
+			  throttle: Optional[Callable[[int], Awaitable[None]]] = None) -> Stream:
+		"""
+		Copies `src` into `dst` in the background, `dst` has to be prepared by `Disk.prepare_stream`
+		:param throttle: low priority copies (warmup) wait for it before every piece, as long as nobody reads the file
+		"""
+		assert self.__nursery is not None, "Streamer isn't running"
+		assert ino not in self.__streams, f"{ino} is streamed already"
+		stream = self.__streams[ino] = Stream(ino, src, dst, os.path.getsize(dst), throttle)
+		self.__nursery.start_soon(self.__copy, stream)
+		return stream
+
+	async def wait_range(self, ino: int, offset: int, length: int) -> None:
+		"""
+		Waits until [offset, offset + length) of `ino` is in its cache file, returns at once if `ino` isn't streamed
+		:raises OSError: if the copy failed
+		"""
+		stream = self.__streams.get(ino)
+		if stream is not None:
+			await stream.wait_for(offset + length)
+
+	async def settle(self, ino: int) -> None:
+		"""Waits until the copy of `ino` is over (a failed copy leaves no cache file behind)"""
+		stream = self.__streams.get(ino)
+		if stream is not None:
+			await stream.done.wait()
+
+	async def abort(self, ino: int) -> None:
+		"""Stops copying `ino`, the unfinished cache file is deleted"""
+		stream = self.__streams.get(ino)
+		if stream is not None:
+			stream.cancel_scope.cancel()
+			await stream.done.wait()
+
+	async def __copy(self, stream: Stream) -> None:
+		error: Optional[OSError] = None
+		with stream.cancel_scope:
+			try:
+				fd_src, fd_dst = os.open(stream.src, os.O_RDONLY), os.open(stream.dst, os.O_WRONLY)
+				try:
+					while stream.watermark < stream.size:
+						piece = min(Streamer.PIECE_SIZE, stream.size - stream.watermark)
+						if stream.throttle is not None and not stream.wanted:
+							with trio.CancelScope() as stream._throttle_scope:
+								await stream.throttle(piece)
+							stream._throttle_scope = None
+						copied = await trio.to_thread.run_sync(
+							Streamer.copy_piece, fd_src, fd_dst, stream.watermark, piece, limiter=self.__limiter)
+						if not copied:
+							log.warning(f'{Col(stream.src)} shrank while copying it')
+							os.ftruncate(fd_dst, stream.watermark)
+							stream.size = stream.watermark
+							self.disk.track(stream.src.__str__())
+							break
+						stream.advance(copied)
+				finally:
+					os.close(fd_src)
+					os.close(fd_dst)
+				# a parent directory might have been renamed in the meantime
+				stream.dst = self.disk.ino_toTmp(stream.ino)
+				Disk.finish_stream(stream.src, stream.dst)
+				self.disk.recharge(stream.ino)
+				log.debug(f'Streamed {Col(stream.dst)} ({formatByteSize(stream.watermark)})')
+			except OSError as exc:
+				log.error(f'Could not copy {Col(stream.src)}: {exc}')
+				error = exc
+		if error is not None or stream.cancel_scope.cancelled_caught:
+			self.disk.drop_partial(self.disk.ino_toTmp(stream.ino))
+		del self.__streams[stream.ino]
+		stream.finish(error)
+
+	@staticmethod
+	def copy_piece(fd_src: int, fd_dst: int, offset: int, length: int) -> int:
+		"""runs in a worker thread, :returns: copied bytes (0 at EOF)"""
+		return copy_range(fd_src, fd_dst, offset, length)
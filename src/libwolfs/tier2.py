@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# job of this module:
+#  - second cache directory (e.g. a big HDD behind the SSD cache dir) evicted files are demoted to
+#    instead of being deleted, the next access copies them back instead of asking the (sleeping) source again
+#  - its own budget, accounting and eviction policy
+#  - demoted copies remember the source version they came from, stale ones are never promoted
+
+import errno
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Final, Optional
+
+from src.libwolfs.copyengine import copy_file
+from src.libwolfs.policy import DEFAULT_POLICY, EvictionPolicy, make_policy
+from src.libwolfs.util import Col, Path_str, formatByteSize
+
+log = logging.getLogger(__name__)
+
+
+class SecondTier:
+	"""
+	Demoted whole files below `tierDir/wolfs-tier2`, keyed by their path relative to the mount root.
+	The directory doesn't survive a restart: it is emptied on mount as nobody knows the versions of what is left in it
+	"""
+	DIR_NAME: Final[str] = 'wolfs-tier2'
+
+	def __init__(self, tierDir: Path_str, maxSizeMB: int = 0, policy: str = DEFAULT_POLICY) -> None:
+		""":param maxSizeMB: budget of the tier, 0 takes what is free on its filesystem"""
+		self.root: Path = Path(tierDir) / SecondTier.DIR_NAME
+		if self.root.exists():
+			shutil.rmtree(self.root)
+		self.root.mkdir(parents=True)
+		fs_stat = os.statvfs(self.root)
+		free: int = fs_stat.f_bavail * fs_stat.f_frsize
+		self.capacity: int = min(maxSizeMB * 1024 * 1024, free) if maxSizeMB else free
+		self.policy: EvictionPolicy = make_policy(policy, self.capacity)
+		# rpath -> (size, mtime) of the source version of the demoted copy
+		self.__origin: dict[str, tuple[int, int]] = dict()
+		self.demoted: int = 0
+		self.promoted: int = 0
+
+	@property
+	def used(self) -> int:
+		return self.policy.used
+
+	def path(self, rpath: str) -> str:
+		return os.path.join(self.root, rpath.lstrip('/'))
+
+	def admit(self, rpath: str, size: int, origin: tuple[int, int]) -> Optional[str]:
+		"""
+		Reserves room for a demoted copy of `rpath`, the least valuable demoted files go if necessary
+		:param origin: source version of the cache file
+		:returns: where the cache file has to be moved to, None if it doesn't fit into the tier at all
+		"""
+		if size > self.capacity:
+			return None
+		self.discard(rpath)
+		while self.used + size > self.capacity:
+			victim = self.policy.victim()
+			assert victim is not None
+			self.discard(victim)  # type: ignore
+		self.policy.on_insert(rpath, size)
+		self.__origin[rpath] = origin
+		self.demoted += 1
+		return self.path(rpath)
+
+	def lookup(self, rpath: str, origin: tuple[int, int]) -> Optional[str]:
+		""":returns: path of the demoted copy of `rpath` if it is of the source version `origin` (stale ones are dropped)"""
+		if rpath not in self.policy:
+			return None
+		path: str = self.path(rpath)
+		if self.__origin[rpath] != origin or not os.path.exists(path):
+			log.debug(f'Dropping stale demoted copy of {Col(rpath)}')
+			self.discard(rpath)
+			return None
+		return path
+
+	def take(self, rpath: str) -> None:
+		"""`rpath` is promoted, its copy is moved back into the cache and isn't charged here anymore"""
+		self.policy.on_remove(rpath)
+		self.__origin.pop(rpath, None)
+		self.promoted += 1
+
+	def discard(self, rpath: str) -> None:
+		"""Drops the demoted copy of `rpath` (e.g. it was deleted, renamed or is out of date)"""
+		if rpath not in self.policy:
+			return
+		self.policy.on_remove(rpath, evicted=True)
+		self.__origin.pop(rpath, None)
+		try:
+			os.remove(self.path(rpath))
+		except FileNotFoundError:
+			pass
+
+	def __contains__(self, rpath: str) -> bool:
+		return rpath in self.policy
+
+	def __repr__(self) -> str:
+		return (f'SecondTier({Col(self.root)}, {len(self.policy)} files, '
+				f'{formatByteSize(self.used)}/{formatByteSize(self.capacity)}, '
+				f'demoted={self.demoted}, promoted={self.promoted})')
+
+
+def move(src: Path_str, dst: Path_str) -> None:
+	"""Moves a file between the cache dir and the second tier (renamed if both are on the same filesystem)"""
+	os.makedirs(os.path.dirname(dst), exist_ok=True)
+	try:
+		os.replace(src, dst)
+		return
+	except OSError as exc:
+		if exc.errno != errno.EXDEV:
+			raise
+	copy_file(src, dst)
+	shutil.copystat(src, dst)
+	os.remove(src)
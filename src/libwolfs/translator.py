@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import dataclasses
-from typing import Final
+from typing import Final, Optional, cast
+from collections import OrderedDict
 from pathlib import Path
 import errno
 import os
@@ -8,6 +9,7 @@ import logging
 from sys import exit
 log = logging.getLogger(__name__)
 from src.libwolfs.util import Path_str
+from src.libwolfs.pathtree import PathTree
 
 @dataclasses.dataclass
 class MountFSDirectoryInfo:
@@ -60,27 +62,53 @@ class PathTranslator:
 		setattr_exit_on_failure('cacheDir', mount_info.cacheDir)
 		setattr_exit_on_failure('mountDir', mount_info.mountDir)
 
+		# known directory prefixes. Longest first so nested directories are stripped correctly
+		dirs = {self.sourceDir.__str__(), self.cacheDir.__str__(), self.mountDir.__str__()}
+		self._prefixes: tuple[str, ...] = tuple(sorted(dirs, key=len, reverse=True))
+		self._src_prefix: str = self.sourceDir.__str__()
+		self._tmp_prefix: str = self.cacheDir.__str__()
+		self._mnt_prefix: str = self.mountDir.__str__()
+
 	def toRoot(self, path: Path_str) -> str:
-		trimmed_src_cache_path = CachePath.toRootPath(self.sourceDir, self.cacheDir, path)
-#		if trimmed_src_cache_path == '/':
-#			return '/'
-		# use mountDir twice as it won't change it: replace() replaces all occourences
-		return CachePath.toRootPath(self.mountDir, self.mountDir, trimmed_src_cache_path)
+		"""Get the Path without the cache, src or mount prefix by slicing the known prefix off"""
+		_path: str = path if isinstance(path, str) else path.__str__()
+		for prefix in self._prefixes:
+			if _path.startswith(prefix):
+				end = len(prefix)
+				if end == len(_path):
+					return '/'
+				elif _path[end] == '/':
+					_path = _path[end:]
+					break
+
+		if not _path.startswith('/'):
+			_path = '/' + _path
+		if '//' in _path:
+			_path = _path.replace('//', '/')
+		return _path
+
+	@staticmethod
+	def _join(prefix: str, rpath: str) -> str:
+		return prefix if rpath == '/' else prefix + rpath
+
+	# str variants don't build a Path object (cheaper in hot paths like lookup / getattr)
+	def toMnt_str(self, path: Path_str) -> str:
+		return PathTranslator._join(self._mnt_prefix, self.toRoot(path))
+
+	def toSrc_str(self, path: Path_str) -> str:
+		return PathTranslator._join(self._src_prefix, self.toRoot(path))
+
+	def toTmp_str(self, path: Path_str) -> str:
+		return PathTranslator._join(self._tmp_prefix, self.toRoot(path))
 
 	def toMnt(self, path: Path_str) -> Path:
-		rpath = self.toRoot(path)
-		result = CachePath.toDestPath(self.mountDir, self.mountDir, rpath)
-		return result
+		return Path(self.toMnt_str(path))
 
 	def toSrc(self, path: Path_str) -> Path:
-		rpath = self.toRoot(path)
-		result = CachePath.toDestPath(self.sourceDir, self.sourceDir, rpath)
-		return result
+		return Path(self.toSrc_str(path))
 
 	def toTmp(self, path: Path_str) -> Path:
-		rpath = self.toRoot(path)
-		result = CachePath.toDestPath(self.cacheDir, self.cacheDir, rpath)
-		return result
+		return Path(self.toTmp_str(path))
 
 	def getParent(self, path: Path_str) -> str:
 		result: str = self.toRoot(path)
@@ -92,20 +120,23 @@ class PathTranslator:
 
 
 class InodeTranslator(PathTranslator, DiskBase):
+	TRANSLATION_CACHE_SIZE: Final[int] = 4096  # memoized ino -> cache path translations
+
 	def __init__(self, mount_info: MountFSDirectoryInfo):
 		super().__init__(mount_info)
 
 		self.__last_ino: int = DiskBase.ROOT_INODE  # as the first ino is always 1 (ino 1 is for bad blocks but fuse doesn't act that way)
 		self.__freed_inos: set[int] = set()
-		self.__path_ino_map: dict[str, int] = dict()
-		self.__ino_path_map: dict[int, str | {str}] = dict()
 
 		# init root path by defining root ino as last used ino
-		self.__path_ino_map["/"] = self.__last_ino
-		self.__ino_path_map[self.__last_ino] = "/"
+		# component wise index: rpath <-> ino (one node per name, see pathtree.py)
+		self.__index: PathTree = PathTree(self.__last_ino)
+
+		# bounded LRU of recent ino_toTmp() results. Entries are dropped on rename / unlink
+		self.__tmp_paths: OrderedDict[int, str] = OrderedDict()
 
 	def ino_exists(self, inode: int) -> bool:
-		return self.__ino_path_map.get(inode, None) is not None
+		return self.__index.has_ino(inode)
 
 	def __delitem__(self, inode__path: tuple[int, str]) -> None:
 		"""delete translation inode"""
@@ -113,23 +144,15 @@ class InodeTranslator(PathTranslator, DiskBase):
 		assert inode == self.path_to_ino(path), "Logic Error: double deletion"
 
 		rpath = self.toRoot(path)
-		if isinstance(self.__ino_path_map[inode], str):
-			assert rpath in self.ino_to_rpath(inode), "Consistency Error"
-
-		maybe_path: str | {str} = self.__ino_path_map[inode]
-		if isinstance(maybe_path, str):
-			# normal path: path, ino (1:1)
+		self.__tmp_paths.pop(inode, None)
+		# normal path: path, ino (1:1) frees the ino
+		# handling hardlinks: multiple paths -> ino (*:1) only drops one of them
+		if self.__index.remove(rpath) == 0:
 			self.__freed_inos.add(inode)
-			del self.__ino_path_map[inode]
-		elif isinstance(maybe_path, set):
-
-			# handling hardlinks: multiple paths -> ino (*:1)
-			self.__ino_path_map[inode].remove(rpath)
 
-			# return to original str type
-			if len(self.__ino_path_map[inode]) == 1:
-				self.__ino_path_map[inode] = self.__ino_path_map[inode].pop()
-		del self.__path_ino_map[rpath]
+	def lookup_ino(self, some_path: Path_str) -> Optional[int]:
+		"""Same as path_to_ino() but never creates a new ino. Returns None for unknown paths"""
+		return self.__index.get(self.toRoot(some_path))
 
 	def path_to_ino(self, some_path: Path_str, reuse_ino=0) -> int:
 		"""
@@ -140,27 +163,10 @@ class InodeTranslator(PathTranslator, DiskBase):
 		assert isinstance(some_path, Path_str), "Type Error"
 		assert reuse_ino >= 0, "reuse_ino can't be negative"
 
-		def __add_ino_path(ino: int, path: str) -> None:
-			"""
-			Add ino to internal mappings
-			:param ino: inode corresponding to path
-			:param path: path corresponding to inode
-			:return:
-			"""
-			self.__path_ino_map[path] = ino
-
-			if maybe_path := self.__ino_path_map.get(ino):
-				if isinstance(maybe_path, str) and maybe_path != path:
-					self.__ino_path_map[ino] = {maybe_path, path}
-				elif isinstance(maybe_path, set):
-					self.__ino_path_map[ino].add(path)
-			else:
-				self.__ino_path_map[ino] = path
-
 		path: str = self.toRoot(some_path)
 
-		if ino := self.__path_ino_map.get(path):
-			ino = ino
+		if ino := self.__index.get(path):
+			return ino
 		elif reuse_ino != 0:  # for rename operations
 			if reuse_ino > self.__last_ino:
 				# programming error
@@ -168,6 +174,8 @@ class InodeTranslator(PathTranslator, DiskBase):
 			elif reuse_ino in self.__freed_inos:
 				# normal operation
 				ino = reuse_ino
+				self.__freed_inos.remove(ino)
+				self.__tmp_paths.pop(ino, None)
 			else:
 				# invalid ino as it's already used
 				raise ValueError(f"Reused ino {reuse_ino} is not in freed ino set {self.__freed_inos}")
@@ -175,10 +183,36 @@ class InodeTranslator(PathTranslator, DiskBase):
 			ino = self.__last_ino + 1
 			self.__last_ino = ino
 
-		__add_ino_path(ino, path)
-
+		self.__index.insert(path, ino)
 		return ino
 
+	def rename_path(self, path_old: Path_str, path_new: Path_str) -> int:
+		"""
+		Moves the translation of `path_old` to `path_new` keeping its ino.
+		Descendants of a directory follow automatically as only the directory node is re-hung.
+		:returns: ino of the renamed path
+		"""
+		rpath_old, rpath_new = self.toRoot(path_old), self.toRoot(path_new)
+		node = self.__index.move(rpath_old, rpath_new)
+		if node.children:
+			# every memoized descendant is stale now, walking the subtree would cost more than refilling
+			self.__tmp_paths.clear()
+		else:
+			self.__tmp_paths.pop(node.ino, None)
+		return node.ino
+
+	def ino_parent(self, ino: int) -> int:
+		"""inode of the directory containing `ino`. The root inode is its own parent"""
+		node = self.__index.ino_node(ino)
+		assert node is not None, f"Logic Error: {ino} is unknown"
+		if node.parent is None:
+			assert node is self.__index.root, f"Logic Error: {ino} is detached"
+			return node.ino
+		if node.parent.ino == 0:
+			# in between directory which never got an ino on its own
+			return self.path_to_ino(node.parent.rpath())
+		return node.parent.ino
+
 	def ino_to_rpath(self, ino: int, need_set: bool = False) -> str | set[str]:
 		"""
 		Reverse lookup function of self.path_to_ino
@@ -193,16 +227,11 @@ class InodeTranslator(PathTranslator, DiskBase):
 			if ino has hardlinks and need_set == True:
 			     set of root paths mapping ino
 		"""
-		path: str | set[str] = self.__ino_path_map.get(ino)
-		if isinstance(path, set):
-			if need_set:
-				return path
-			tmp_p = path.pop()
-			path.add(tmp_p)
-			path = tmp_p
-
-		assert path is not None, "Logic Error"
-		return path
+		nodes = self.__index.nodes(ino)
+		assert len(nodes) > 0, "Logic Error"
+		if need_set and len(nodes) > 1:
+			return {node.rpath() for node in nodes}
+		return nodes[0].rpath()
 
 	def add_hardlink(self, ino: int, hardlink_target: Path_str) -> None:
 		"""
@@ -224,11 +253,11 @@ class InodeTranslator(PathTranslator, DiskBase):
 
 			assert ino > 0, "inos cant be negative"
 			assert ino not in self.__freed_inos, "ino can't reference a freed ino"
-			assert ino in self.__ino_path_map, "ino has to have a path before creating a link!"
+			assert self.__index.has_ino(ino), "ino has to have a path before creating a link!"
 		health_checks()
 
 		rpath = self.toRoot(hardlink_target)
-		assert rpath not in self.__path_ino_map, "To be added rpath mustn't be already saved!"
+		assert rpath not in self.__index, "To be added rpath mustn't be already saved!"
 
 		original_path = self.ino_to_rpath(ino)
 
@@ -238,12 +267,7 @@ class InodeTranslator(PathTranslator, DiskBase):
 				and not self.toSrc(original_path).is_dir() \
 				and not self.toMnt(original_path).is_dir(), "hardlinks to directories are illegal"
 
-		if isinstance(original_path, str):
-			original_path = {original_path, rpath}
-		else:
-			original_path.add(rpath)
-		self.__ino_path_map[ino] = original_path
-		self.__path_ino_map[rpath] = ino
+		self.__index.insert(rpath, ino)
 
 	def add_softlink(self, link_path: Path_str, target: Path_str) -> int:
 		"""
@@ -268,5 +292,17 @@ class InodeTranslator(PathTranslator, DiskBase):
 ################################################################################
 # convinience functions (basically just shortcuts to commonly used operations)
 
+	def ino_toTmp_str(self, ino: int) -> str:
+		tmp_paths = self.__tmp_paths
+		if (cpath := tmp_paths.get(ino)) is not None:
+			tmp_paths.move_to_end(ino)
+			return cpath
+
+		cpath = PathTranslator._join(self._tmp_prefix, cast(str, self.ino_to_rpath(ino)))
+		tmp_paths[ino] = cpath
+		if len(tmp_paths) > self.TRANSLATION_CACHE_SIZE:
+			tmp_paths.popitem(last=False)
+		return cpath
+
 	def ino_toTmp(self, ino: int) -> Path:
-		return self.toTmp(self.ino_to_rpath(ino))
+		return Path(self.ino_toTmp_str(ino))
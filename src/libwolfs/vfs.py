@@ -60,7 +60,7 @@ class VFS(PathTranslator, CallStackAware):
 		inode_p: int,
 		inode: int,
 		path: str,
-		entry: pyfuse3.EntryAttributes) -> None:
+		entry: Union[pyfuse3.EntryAttributes, FileInfo]) -> None:
 		"""Also adds file to parent inode `inode_p`"""
 		assert inode_p != inode, f"{self} inode_p({Col(inode_p)}) can't be inode({Col(inode)})"
 		assert inode == entry.st_ino, 'entry ino must be the same as lookup ino'
@@ -68,8 +68,7 @@ class VFS(PathTranslator, CallStackAware):
 
 		info_p = self.inode_path_map[inode_p]
 		assert isinstance(info_p, DirInfo), f"Logical error? {info_p} has to be DirInfo not {type(info_p)}"
-		if inode not in info_p.children:
-			info_p.children.append(inode)
+		info_p.children.add(os.path.basename(path), inode)
 
 	def _add_Directory(self,
 		inode_p: int,
@@ -82,29 +81,27 @@ class VFS(PathTranslator, CallStackAware):
 		self.inode_path_map[wolfs_inode] = directory
 		self._lookup_cnt[wolfs_inode] += 1
 
-		# update parent accordingly
-		if parent := cast(DirInfo, self.inode_path_map.get(inode_p)):
-			if wolfs_inode in parent.children:
-				pass # optimize to return early
-			else:
-				parent.children.append(wolfs_inode)
+		# update parent accordingly (root redirects to itself and isn't its own child)
+		parent = cast(DirInfo, self.inode_path_map.get(inode_p))
+		if parent and inode_p != wolfs_inode:
+			parent.children.add(os.path.basename(inode_path), wolfs_inode)
 
 		# post-condition:
 		assert directory == self.inode_path_map[wolfs_inode]
-		assert wolfs_inode in parent.children
+		assert wolfs_inode in parent.children or inode_p == wolfs_inode
 
 		return directory
 
 	def add_path(self,
 		inode: int,
 		path: str,
-		file_attrs: pyfuse3.EntryAttributes) -> None:
+		file_attrs: Union[pyfuse3.EntryAttributes, FileInfo]) -> None:
 		"""
 		Add associated (ino, path)-metadata and increase their lookup count
 
 		:param inode: inode to be added and increased
 		:param path: path associated with inode
-		:param file_attrs: metadata of inode
+		:param file_attrs: metadata of inode (a FileInfo record is stored as is)
 		"""
 		# TODO:
 		#  -> Rewrite so that we only serve file Attributes and no paths anymore as
@@ -115,7 +112,7 @@ class VFS(PathTranslator, CallStackAware):
 
 		# With hardlinks, one inode may map to multiple paths.
 		if inode not in self.inode_path_map:
-			self.inode_path_map[inode] = FileInfo(file_attrs)
+			self.inode_path_map[inode] = file_attrs if isinstance(file_attrs, FileInfo) else FileInfo(file_attrs)
 			return
 
 		# no hardlinks for directories
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# job of this module:
+#  - write the journal to disk so pending changes of the source survive a crash or power loss
+#  - one compact binary record per journal entry, each with a crc so a torn write at the end is detected
+#  - group commit: records of many FUSE ops are written and fdatasync'ed together
+
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Final, Iterator, NamedTuple
+
+import trio
+
+from src.libwolfs.util import Col, Path_str
+
+log = logging.getLogger(__name__)
+
+
+class WalRecord(NamedTuple):
+	"""One journal entry as it is stored, see `LogEntry`"""
+	op: int
+	inode: int
+	path: str
+	offset: int = -1
+	length: int = -1
+	flags: int = -1
+	mode: int = -1
+	path_new: str = ''
+
+
+class WriteAheadLog:
+	"""
+	Append-only file: a header followed by records of (body length, crc32 of the body, body).
+	Records are buffered by `append` and made durable together by `run` every `sync_interval` seconds
+	(0 writes and fdatasyncs every record right away), `commit` waits until everything appended so far is durable.
+	Markers (op `MARKER`) tell a recovery how many records before them were applied to the source already
+	"""
+	MAGIC: Final[bytes] = b'WOLFSWAL'
+	VERSION: Final[int] = 1
+	DEFAULT_SYNC_INTERVAL: Final[float] = 0.005  # seconds
+	MARKER: Final[int] = 0
+	HEADER: Final[struct.Struct] = struct.Struct('<8sH')
+	FRAME: Final[struct.Struct] = struct.Struct('<II')
+	# op, inode, offset, length, flags, mode, path length, path_new length
+	BODY: Final[struct.Struct] = struct.Struct('<BQqqiiHH')
+
+	def __init__(self, path: Path_str, sync_interval: float = DEFAULT_SYNC_INTERVAL) -> None:
+		self.path: Path = Path(path)
+		self.sync_interval: float = sync_interval
+		if not WriteAheadLog.is_log(self.path):
+			raise ValueError(f'{self.path} is not a write-ahead log, refusing to overwrite it')
+		self.__fd: int = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+		end: int = self.__valid_end()
+		if end == 0:
+			os.write(self.__fd, WriteAheadLog.HEADER.pack(WriteAheadLog.MAGIC, WriteAheadLog.VERSION))
+			os.fsync(self.__fd)
+			end = WriteAheadLog.HEADER.size
+		elif end < os.fstat(self.__fd).st_size:
+			log.warning(f'Cutting off a torn record at the end of {Col(self.path)}')
+			os.ftruncate(self.__fd, end)
+			os.fsync(self.__fd)
+		os.lseek(self.__fd, end, os.SEEK_SET)
+
+		self.__buffer: bytearray = bytearray()
+		# the writes of `run` happen in worker threads: chunks are written in the order they were taken,
+		# the ones taken before a checkpoint are dropped
+		self.__cond = threading.Condition()
+		self.__taken: int = 0
+		self.__written: int = 0
+		self.__epoch: int = 0
+		self.__appended: int = 0  # records appended in this run
+		self.__durable: int = 0
+		self.__pending: trio.Event = trio.Event()
+		self.__synced: trio.Event = trio.Event()
+		self.syncs: int = 0
+
+	# writing
+	# =======
+
+	def append(self, record: WalRecord) -> int:
+		""":returns: sequence number of `record` (see `commit`)"""
+		path, path_new = os.fsencode(record.path), os.fsencode(record.path_new)
+		body = WriteAheadLog.BODY.pack(record.op, record.inode, record.offset, record.length,
+									   record.flags, record.mode, len(path), len(path_new)) + path + path_new
+		self.__buffer += WriteAheadLog.FRAME.pack(len(body), zlib.crc32(body))
+		self.__buffer += body
+		self.__appended += 1
+		if self.sync_interval <= 0:
+			self.sync()
+		else:
+			self.__pending.set()
+		return self.__appended
+
+	def sync(self) -> None:
+		"""Makes everything appended so far durable right away (blocks)"""
+		target: int = self.__appended
+		self.__write(*self.__take())
+		self.__synced_up_to(target)
+
+	async def commit(self) -> None:
+		"""Waits until every record appended so far is durable, at most about `sync_interval` seconds"""
+		target: int = self.__appended
+		while self.__durable < target:
+			self.__pending.set()
+			await self.__synced.wait()
+
+	async def run(self, task_status: 'trio.TaskStatus[None]' = trio.TASK_STATUS_IGNORED) -> None:
+		"""group commit in the background"""
+		task_status.started()
+		while True:
+			await self.__pending.wait()
+			# let more FUSE ops join this fdatasync
+			await trio.sleep(self.sync_interval)
+			self.__pending = trio.Event()
+			target: int = self.__appended
+			await trio.to_thread.run_sync(self.__write, *self.__take())
+			self.__synced_up_to(target)
+
+	def mark_applied(self, applied: int, sync: bool = True) -> None:
+		"""
+		The first `applied` records (markers don't count) are on the source, a recovery skips them
+		:param sync: durable right away, otherwise with the next group commit
+		"""
+		self.append(WalRecord(WriteAheadLog.MARKER, 0, '', offset=applied))
+		if sync:
+			self.sync()
+
+	def checkpoint(self) -> None:
+		"""Everything logged was applied to the source: the log starts over"""
+		self.__buffer.clear()
+		with self.__cond:
+			self.__epoch += 1
+			os.ftruncate(self.__fd, WriteAheadLog.HEADER.size)
+			os.lseek(self.__fd, WriteAheadLog.HEADER.size, os.SEEK_SET)
+			os.fdatasync(self.__fd)
+		self.__synced_up_to(self.__appended)
+
+	def close(self) -> None:
+		self.sync()
+		os.close(self.__fd)
+
+	def __take(self) -> tuple[bytes, int, int]:
+		data, self.__buffer = bytes(self.__buffer), bytearray()
+		self.__taken += 1
+		return data, self.__taken, self.__epoch
+
+	def __write(self, data: bytes, ticket: int, epoch: int) -> None:
+		with self.__cond:
+			self.__cond.wait_for(lambda: self.__written == ticket - 1)
+			try:
+				if data and epoch == self.__epoch:
+					view = memoryview(data)
+					while view:
+						view = view[os.write(self.__fd, view):]
+					os.fdatasync(self.__fd)
+					self.syncs += 1
+			finally:
+				self.__written = ticket
+				self.__cond.notify_all()
+
+	def __synced_up_to(self, target: int) -> None:
+		if target > self.__durable:
+			self.__durable = target
+		self.__synced.set()
+		self.__synced = trio.Event()
+
+	@property
+	def unsynced(self) -> int:
+		""":returns: records which aren't durable yet"""
+		return self.__appended - self.__durable
+
+	# reading
+	# =======
+
+	def records(self) -> Iterator[WalRecord]:
+		"""what a previous run logged and didn't apply to the source, up to the first torn or corrupted record"""
+		with open(self.path, 'rb') as f:
+			yield from WriteAheadLog.__parse(f.read())
+
+	def unapplied(self) -> tuple[int, list[WalRecord]]:
+		""":returns: number of records applied to the source according to the last marker and the records after them"""
+		records: list[WalRecord] = []
+		applied: int = 0
+		for record in self.records():
+			if record.op == WriteAheadLog.MARKER:
+				applied = max(applied, record.offset)
+			else:
+				records.append(record)
+		return applied, records[applied:]
+
+	@staticmethod
+	def is_log(path: Path_str) -> bool:
+		""":returns: if `path` is a log, empty or not there yet (a crash while creating it leaves part of a header)"""
+		try:
+			with open(path, 'rb') as f:
+				start = f.read(WriteAheadLog.HEADER.size)
+		except FileNotFoundError:
+			return True
+		return WriteAheadLog.HEADER.pack(WriteAheadLog.MAGIC, WriteAheadLog.VERSION).startswith(start)
+
+	def __valid_end(self) -> int:
+		""":returns: offset after the last intact record, 0 if the file isn't a log (yet)"""
+		with open(self.path, 'rb') as f:
+			data = f.read()
+		end: int = 0
+		for end in WriteAheadLog.__ends(data):
+			pass
+		return end
+
+	@staticmethod
+	def __parse(data: bytes) -> Iterator[WalRecord]:
+		start: int = WriteAheadLog.HEADER.size
+		for end in WriteAheadLog.__ends(data):
+			if end == start:
+				continue  # the header
+			body = data[start + WriteAheadLog.FRAME.size:end]
+			op, inode, offset, length, flags, mode, path_len, new_len = WriteAheadLog.BODY.unpack_from(body)
+			names = body[WriteAheadLog.BODY.size:]
+			yield WalRecord(op, inode, os.fsdecode(names[:path_len]), offset, length, flags, mode,
+							os.fsdecode(names[path_len:path_len + new_len]))
+			start = end
+
+	@staticmethod
+	def __ends(data: bytes) -> Iterator[int]:
+		"""end offsets of the header and of every intact record"""
+		header, frame = WriteAheadLog.HEADER, WriteAheadLog.FRAME
+		if len(data) < header.size or header.unpack_from(data) != (WriteAheadLog.MAGIC, WriteAheadLog.VERSION):
+			return
+		pos: int = header.size
+		yield pos
+		while pos + frame.size <= len(data):
+			length, crc = frame.unpack_from(data, pos)
+			body = data[pos + frame.size:pos + frame.size + length]
+			if length < WriteAheadLog.BODY.size or len(body) < length or zlib.crc32(body) != crc:
+				return
+			pos += frame.size + length
+			yield pos
+
+	def __repr__(self) -> str:
+		return f'WriteAheadLog({Col(self.path)}, interval={self.sync_interval}s, syncs={self.syncs})'
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# job of this module:
+#  - cap the bandwidth the cache warmup takes from the source
+#  - keep track of how far the warmup got and when it will be done
+
+import logging
+import time
+from typing import Final, Optional
+
+import trio
+
+from src.libwolfs.util import Col, formatByteSize
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+	"""Allows `rate` bytes per second on average, bursts up to one second worth of bytes"""
+
+	def __init__(self, rate: float) -> None:
+		""":param rate: bytes per second, 0 means unlimited"""
+		self.rate: float = rate
+		self.__tokens: float = rate
+		self.__last: Optional[float] = None
+
+	async def consume(self, nbytes: int) -> None:
+		"""Waits until `nbytes` may be transferred"""
+		if self.rate <= 0:
+			return
+		now = trio.current_time()
+		if self.__last is not None:
+			self.__tokens = min(self.rate, self.__tokens + (now - self.__last) * self.rate)
+		self.__last = now
+		self.__tokens -= nbytes
+		if self.__tokens < 0:
+			await trio.sleep(-self.__tokens / self.rate)
+
+
+class WarmupProgress:
+	LOG_INTERVAL: Final[float] = 10.0  # seconds
+
+	def __init__(self, total_bytes: int) -> None:
+		""":param total_bytes: how much the warmup is going to copy at most"""
+		self.total_bytes: int = total_bytes
+		self.done_bytes: int = 0
+		self.files: int = 0
+		self.__start: float = time.monotonic()
+		self.__last_log: float = self.__start
+
+	def add(self, nbytes: int) -> None:
+		if not nbytes:
+			return
+		self.done_bytes += nbytes
+		self.files += 1
+		if time.monotonic() - self.__last_log >= WarmupProgress.LOG_INTERVAL:
+			self.__last_log = time.monotonic()
+			log.info(self)
+
+	@property
+	def rate(self) -> float:
+		""":returns: bytes per second so far"""
+		elapsed = time.monotonic() - self.__start
+		return self.done_bytes / elapsed if elapsed > 0 else 0.0
+
+	@property
+	def eta(self) -> Optional[float]:
+		""":returns: seconds left, None while nothing was copied yet"""
+		rate = self.rate
+		if rate <= 0:
+			return None
+		return max(0, self.total_bytes - self.done_bytes) / rate
+
+	def __str__(self) -> str:
+		# the last file usually overshoots the low watermark a bit
+		percent = min(100.0, 100 * self.done_bytes / self.total_bytes) if self.total_bytes else 100.0
+		eta = self.eta
+		eta_str = '?' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta))
+		return (f'{Col.BB}Warmup: {Col.BY}{percent:.1f}%{Col.BB} ({self.files} files, '
+				f'{formatByteSize(self.done_bytes)}/{formatByteSize(self.total_bytes)}) '
+				f'at {formatByteSize(self.rate)}/s, ETA {eta_str}{Col.END}')
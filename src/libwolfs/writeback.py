@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# job of this module:
+#  - write the journal back to the source in the background instead of inside FUSE requests (e.g. statfs)
+#  - decide when: age of the oldest unwritten change, amount of unwritten bytes, source reachable
+#  - copy in worker threads a slice at a time and step aside while foreground fetches are waiting
+
+import logging
+import time
+from typing import Callable, Final, Optional
+
+import pyfuse3
+import trio
+
+from src.libwolfs.journal import Flush, Journal
+from src.libwolfs.util import Col, formatByteSize
+
+log = logging.getLogger(__name__)
+
+
+class Writeback:
+	"""
+	Flushes the journal once its oldest entry is `max_age` seconds old, `max_dirty` bytes wait to be written
+	or someone asks for it (`request`/`flush`), as long as the source is available.
+	A failed writeback keeps its entries in the journal and is retried on the next poll
+	"""
+	MAX_AGE: Final[float] = 30.0  # seconds
+	MAX_DIRTY_MB: Final[int] = 64
+	POLL: Final[float] = 1.0  # seconds
+	SLICE: Final[int] = 64  # entries replayed per trip to a worker thread
+	BACKOFF: Final[float] = 0.1  # seconds
+
+	def __init__(self, journal: Journal, available: Callable[[], bool], foreground: Callable[[], int],
+				 limiter: Optional[trio.CapacityLimiter] = None, max_age: float = MAX_AGE,
+				 max_dirty_mb: int = MAX_DIRTY_MB) -> None:
+		"""
+		:param available: is the source reachable right now
+		:param foreground: number of foreground requests waiting for the source, the writeback waits for them
+		:param limiter: worker threads shared with the fetches of the foreground
+		"""
+		self.journal = journal
+		self.available = available
+		self.foreground = foreground
+		self.limiter = limiter
+		self.max_age: float = max_age
+		self.max_dirty: int = max_dirty_mb * 1024 * 1024
+		self.__lock = trio.Lock()
+		self.__wakeup: trio.Event = trio.Event()
+		self.__requested: bool = False
+		self.flushes: int = 0
+		self.failures: int = 0
+
+	def due(self, now: Optional[float] = None) -> bool:
+		since: Optional[float] = self.journal.dirty_since
+		if since is None:
+			return False
+		now = time.monotonic() if now is None else now
+		return self.__requested or self.journal.bytes_unwritten >= self.max_dirty or now - since >= self.max_age
+
+	def request(self) -> None:
+		"""write back soon, regardless of age and size"""
+		self.__requested = True
+		self.__wakeup.set()
+
+	async def run(self, task_status: 'trio.TaskStatus[None]' = trio.TASK_STATUS_IGNORED) -> None:
+		task_status.started()
+		while True:
+			with trio.move_on_after(Writeback.POLL):
+				await self.__wakeup.wait()
+			self.__wakeup = trio.Event()
+			if not self.due() or not self.available():
+				continue
+			try:
+				await self.flush()
+			except (OSError, pyfuse3.FUSEError) as exc:
+				self.failures += 1
+				log.warning(f'Writeback failed, retrying later: {exc}')
+			except Exception:
+				# e.g. the source changed behind our back: the entries stay in the journal, the mount stays up
+				self.failures += 1
+				log.exception('Writeback failed unexpectedly, retrying later')
+
+	async def flush(self) -> None:
+		"""Writes the journal back now (after a writeback which is running already)"""
+		async with self.__lock:
+			self.__requested = False
+			flush: Flush = self.journal.beginFlush()
+			try:
+				while not await trio.to_thread.run_sync(self.journal.replay, flush, Writeback.SLICE,
+														limiter=self.limiter):
+					while self.foreground():
+						await trio.sleep(Writeback.BACKOFF)
+			except BaseException:
+				self.journal.abortFlush(flush)
+				raise
+			self.journal.endFlush(flush)
+			self.flushes += 1
+
+	def __repr__(self) -> str:
+		since: Optional[float] = self.journal.dirty_since
+		age: str = '-' if since is None else f'{time.monotonic() - since:.1f}s'
+		return (f'Writeback(dirty={formatByteSize(self.journal.bytes_unwritten)}, oldest={Col(age)}, '
+				f'flushes={self.flushes}, failures={self.failures})')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# type: ignore
+# Throughput and cpu time of the copy engine against the old python level copies (not collected by pytest)
+#   usage: python -m test.bench_copy [size_mb] [source_dir] [cache_dir]
+#   source_dir/cache_dir default to temporary directories; put them on different filesystems to see
+#   copy_file_range/sendfile, on the same btrfs/xfs to see reflinks
+import os
+import shutil
+import sys
+import time
+from tempfile import TemporaryDirectory
+from src.libwolfs import copyengine
+from src.libwolfs.copyengine import copy_file, copy_range
+
+MEGABYTE = 1024 * 1024
+WRITE_SIZE = 128 * 1024  # size of a write op in the journal
+
+
+def legacy_writeback(fd_src: int, fd_dst: int, write_ops) -> None:
+	# what Journal.__fsyncFile_with_remote did before
+	for offset, buflen in write_ops:
+		os.lseek(fd_src, offset, os.SEEK_SET)
+		os.lseek(fd_dst, offset, os.SEEK_SET)
+		os.write(fd_dst, os.read(fd_src, buflen))
+
+
+def engine_writeback(fd_src: int, fd_dst: int, write_ops) -> None:
+	for offset, buflen in write_ops:
+		copy_range(fd_src, fd_dst, offset, buflen)
+
+
+def writeback(func, src: str, dst: str, size: int) -> None:
+	write_ops = [(offset, WRITE_SIZE) for offset in range(0, size, WRITE_SIZE)]
+	fd_src, fd_dst = os.open(src, os.O_RDONLY), os.open(dst, os.O_RDWR)
+	try:
+		func(fd_src, fd_dst, write_ops)
+	finally:
+		os.close(fd_src)
+		os.close(fd_dst)
+
+
+def bench(name: str, func, size: int) -> None:
+	os.sync()
+	wall, cpu = time.perf_counter(), os.times()
+	func()
+	os.sync()
+	elapsed, cpu_end = time.perf_counter() - wall, os.times()
+	user, system = cpu_end.user - cpu.user, cpu_end.system - cpu.system
+	print(f'  {name:<28} {size / MEGABYTE / elapsed:>9.0f} MB/s   user {user:>6.3f}s   sys {system:>6.3f}s')
+
+
+def main(argv: list[str]) -> None:
+	size = int(argv[0]) * MEGABYTE if argv else 512 * MEGABYTE
+	with TemporaryDirectory(dir=argv[1] if len(argv) > 1 else None) as src_dir, \
+			TemporaryDirectory(dir=argv[2] if len(argv) > 2 else None) as cache_dir:
+		src, dst = os.path.join(src_dir, 'file'), os.path.join(cache_dir, 'file')
+		with open(src, 'wb') as f:
+			for _ in range(size // MEGABYTE):
+				f.write(os.urandom(MEGABYTE))
+		sparse = os.path.join(src_dir, 'sparse')
+		with open(sparse, 'wb') as f:
+			f.truncate(size)
+			f.write(os.urandom(MEGABYTE))
+
+		print(f'fetch of a {size // MEGABYTE} MB file')
+		bench('shutil.copy2 (old)', lambda: shutil.copy2(src, dst), size)
+		copyengine.use_reflink = False
+		bench('copy engine, no reflink', lambda: copy_file(src, dst), size)
+		copyengine.use_reflink = True
+		bench('copy engine', lambda: copy_file(src, dst), size)
+		print(f'fetch of a sparse {size // MEGABYTE} MB file with 1 MB of data')
+		bench('shutil.copy2 (old)', lambda: shutil.copy2(sparse, dst), size)
+		bench('copy engine', lambda: copy_file(sparse, dst), size)
+
+		print(f'writeback of {size // WRITE_SIZE} write ops of {WRITE_SIZE // 1024} KB')
+		bench('lseek + read + write (old)', lambda: writeback(legacy_writeback, dst, src, size), size)
+		bench('copy engine', lambda: writeback(engine_writeback, dst, src, size), size)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# type: ignore
+# Memory benchmark of the inode table records (not collected by pytest)
+#   usage: python -m test.bench_fileinfo [entries]
+import sys
+import tracemalloc
+from src.libwolfs.fileInfo import FileInfo
+from src.libwolfs.util import formatByteSize
+
+NAS_FILES = 10_000_000
+
+
+class LegacyFileInfo:
+	"""what every inode used to cost: an object with a __dict__ wrapping a full EntryAttributes"""
+	def __init__(self, entry) -> None:
+		self.entry = entry
+
+
+def measure(name: str, make_info, entries: int) -> int:
+	tracemalloc.start()
+	before, _ = tracemalloc.get_traced_memory()
+	table = {ino: make_info(ino) for ino in range(2, entries + 2)}
+	after, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	per_entry = (after - before) // entries
+	print(f'{name:<28} {per_entry:>6} B/inode -> {formatByteSize(per_entry * NAS_FILES):>10} for {NAS_FILES:,} files')
+	del table
+	return per_entry
+
+
+def main(entries: int) -> None:
+	stat_source = FileInfo.from_path(__file__, 0)
+	# distinct timestamps/sizes per inode so small int caching doesn't flatter the numbers
+	def stat_like(ino: int) -> FileInfo:
+		info = FileInfo(stat_source.entry)
+		info.st_ino = ino
+		info.st_size = stat_source.st_size + ino
+		info.st_mtime_ns = stat_source.st_mtime_ns + ino
+		info.st_atime_ns = stat_source.st_atime_ns + ino
+		info.st_ctime_ns = stat_source.st_ctime_ns + ino
+		return info
+
+	print(f'{entries:,} inodes (dict entry included)')
+	legacy = measure('FileInfo(EntryAttributes)', lambda ino: LegacyFileInfo(stat_like(ino).entry), entries)
+	compact = measure('FileInfo (__slots__)', stat_like, entries)
+	print(f'  -> {legacy / compact:.1f}x less memory per inode')
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
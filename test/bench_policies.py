@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# type: ignore
+# Offline comparison of the eviction policies (not collected by pytest)
+#   usage: python -m test.bench_policies [trace_file] [cache_size_mb ...]
+#   trace_file: one access per line "<key> <size in bytes>" (e.g. from a fuse debug log),
+#               '-' or nothing generates a synthetic trace of documents mixed with large videos
+import random
+import sys
+import time
+from src.libwolfs.policy import ADMISSIONS, POLICIES, make_admission, make_policy, simulate
+
+MEGABYTE = 1024 * 1024
+DEFAULT_CACHE_SIZES_MB = [512, 2048, 8192]
+
+
+def zipf_choice(rng: random.Random, population: int, alpha: float = 1.0) -> int:
+	"""rank ~ 1/rank^alpha via inverse transform of the continuous approximation"""
+	u = rng.random()
+	if alpha == 1.0:
+		return min(int(population ** u) - 1, population - 1)
+	return min(int(((population ** (1 - alpha) - 1) * u + 1) ** (1 / (1 - alpha))) - 1, population - 1)
+
+
+def synthetic_trace(accesses: int = 200_000, seed: int = 42) -> list[tuple[str, int]]:
+	"""A NAS share: lots of small popular documents, few huge videos and the occasional backup scan"""
+	rng = random.Random(seed)
+	docs = [rng.randint(4 * 1024, 2 * MEGABYTE) for _ in range(20_000)]
+	videos = [rng.randint(200 * MEGABYTE, 4096 * MEGABYTE) for _ in range(300)]
+	trace: list[tuple[str, int]] = []
+	scan_pos = 0
+	for _ in range(accesses):
+		r = rng.random()
+		if r < 0.85:
+			i = zipf_choice(rng, len(docs))
+			trace.append((f'doc{i}', docs[i]))
+		elif r < 0.95:
+			i = zipf_choice(rng, len(videos), alpha=0.8)
+			trace.append((f'video{i}', videos[i]))
+		else:
+			# one-shot sequential scan over cold documents
+			scan_pos = (scan_pos + 1) % len(docs)
+			trace.append((f'doc{len(docs) - 1 - scan_pos}', docs[-1 - scan_pos]))
+	return trace
+
+
+def read_trace(path: str) -> list[tuple[str, int]]:
+	trace: list[tuple[str, int]] = []
+	with open(path) as f:
+		for line in f:
+			if line.strip():
+				key, size = line.split()
+				trace.append((key, int(size)))
+	return trace
+
+
+def main(argv: list[str]) -> None:
+	trace = read_trace(argv[0]) if argv and argv[0] != '-' else synthetic_trace()
+	cache_sizes = [int(x) for x in argv[1:]] or DEFAULT_CACHE_SIZES_MB
+	print(f'{len(trace):,} accesses, {len({k for k, _ in trace}):,} distinct files, '
+		  f'{sum(s for _, s in trace) / MEGABYTE:,.0f} MB requested')
+
+	for size_mb in cache_sizes:
+		print(f'\ncache size: {size_mb:,} MB')
+		print(f'  {"policy":<16} {"hit ratio":>10} {"byte hit ratio":>15} {"time":>8}')
+		for name in POLICIES:
+			for admission in ADMISSIONS:
+				start = time.perf_counter()
+				result = simulate(make_policy(name, size_mb * MEGABYTE), trace,
+								  make_admission(admission, size_mb * MEGABYTE))
+				elapsed = time.perf_counter() - start
+				print(f'  {result.policy:<16} {result.hit_ratio:>10.2%} {result.byte_hit_ratio:>15.2%} {elapsed:>7.2f}s')
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# type: ignore
+# Microbenchmark of the path translation engine (not collected by pytest)
+#   usage: python -m test.bench_translator [iterations]
+import sys
+import timeit
+from tempfile import TemporaryDirectory
+from src.libwolfs.translator import CachePath, InodeTranslator, MountFSDirectoryInfo
+
+DEPTH = 6
+FILES = 1000
+
+
+def legacy_toTmp(trans: InodeTranslator, path) -> str:
+	# what toTmp() did before: replace() over the whole path for every prefix, then build a Path
+	rpath = CachePath.toRootPath(trans.sourceDir, trans.cacheDir, path)
+	rpath = CachePath.toRootPath(trans.mountDir, trans.mountDir, rpath)
+	return CachePath.toDestPath(trans.cacheDir, trans.cacheDir, rpath)
+
+
+def legacy_ino_toTmp(trans: InodeTranslator, ino: int) -> str:
+	return legacy_toTmp(trans, trans.ino_to_rpath(ino))
+
+
+def bench(name: str, stmt, number: int) -> float:
+	per_op = min(timeit.repeat(stmt, number=number, repeat=5)) / number
+	print(f'{name:<38} {per_op * 1_000_000_000:>10.0f} ns/op')
+	return per_op
+
+
+def main(number: int) -> None:
+	with TemporaryDirectory() as src, TemporaryDirectory() as cache, TemporaryDirectory() as mnt:
+		trans = InodeTranslator(MountFSDirectoryInfo(src, cache, mnt))
+		subdir = '/'.join(f'level_{i}' for i in range(DEPTH))
+		src_paths = [f'{src}/{subdir}/file_{i}.jpg' for i in range(FILES)]
+		inos = [trans.path_to_ino(p) for p in src_paths]
+		path, ino = src_paths[FILES // 2], inos[FILES // 2]
+
+		print(f'{FILES} files at depth {DEPTH}, {number} iterations per run')
+		old = bench('legacy toTmp(src path)', lambda: legacy_toTmp(trans, path), number)
+		new = bench('toTmp(src path)', lambda: trans.toTmp(path), number)
+		new_str = bench('toTmp_str(src path)', lambda: trans.toTmp_str(path), number)
+		print(f'  -> speedup {old / new:.1f}x (Path) {old / new_str:.1f}x (str)')
+
+		old = bench('legacy ino_toTmp(ino)', lambda: legacy_ino_toTmp(trans, ino), number)
+		trans.TRANSLATION_CACHE_SIZE = 0  # every call misses the memo
+		cold = bench('ino_toTmp_str(ino) memo miss', lambda: trans.ino_toTmp_str(ino), number)
+		del trans.TRANSLATION_CACHE_SIZE
+		warm = bench('ino_toTmp_str(ino) memo hit', lambda: trans.ino_toTmp_str(ino), number)
+		print(f'  -> speedup {old / cold:.1f}x (miss) {old / warm:.1f}x (hit)')
+
+		# what lookup() did for every child of a directory
+		def scan_legacy():
+			for i in inos:
+				legacy_ino_toTmp(trans, i)
+
+		def scan_memo():
+			for i in inos:
+				trans.ino_toTmp_str(i)
+		old = bench(f'legacy ino_toTmp over {FILES} children', scan_legacy, max(1, number // FILES))
+		new = bench(f'ino_toTmp_str over {FILES} children', scan_memo, max(1, number // FILES))
+		print(f'  -> speedup {old / new:.1f}x')
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# type: ignore
+# Journaled write throughput at different sync intervals of the write-ahead log (not collected by pytest)
+#   usage: python -m test.bench_wal [ops] [log_dir] [sync_interval ...]
+#   log_dir defaults to a temporary directory; put it on the disk of the cache dir to see its fdatasync latency
+#   writers=1 waits for every commit like a single fsync-heavy program, writers=64 are concurrent FUSE writes
+import os
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import trio
+
+from src.libwolfs.wal import WalRecord, WriteAheadLog
+
+DEFAULT_OPS = 2000
+DEFAULT_INTERVALS = [0, 0.001, 0.005, 0.02]
+WRITE_SIZE = 128 * 1024  # size of a write op in the journal
+
+
+async def journaled_writes(wal: WriteAheadLog, ops: int, writers: int) -> None:
+	async def writer(nr: int) -> None:
+		for i in range(nr, ops, writers):
+			wal.append(WalRecord(2, nr, f'/cache/file_{nr}', offset=i * WRITE_SIZE, length=WRITE_SIZE))
+			await wal.commit()
+
+	async with trio.open_nursery() as nursery:
+		if wal.sync_interval > 0:
+			await nursery.start(wal.run)
+		async with trio.open_nursery() as writes:
+			for nr in range(writers):
+				writes.start_soon(writer, nr)
+		nursery.cancel_scope.cancel()
+
+
+def bench(log_dir: str, interval: float, ops: int, writers: int) -> tuple[float, int]:
+	path = os.path.join(log_dir, f'journal-{interval}-{writers}')
+	wal = WriteAheadLog(path, interval)
+	start = time.perf_counter()
+	trio.run(journaled_writes, wal, ops, writers)
+	elapsed = time.perf_counter() - start
+	wal.close()
+	os.remove(path)
+	return ops / elapsed, wal.syncs
+
+
+def main(argv: list[str]) -> None:
+	ops = int(argv[0]) if argv else DEFAULT_OPS
+	intervals = [float(x) for x in argv[2:]] or DEFAULT_INTERVALS
+	with TemporaryDirectory() as tmp:
+		log_dir = argv[1] if len(argv) > 1 else tmp
+		print(f'{ops:,} journaled writes into {log_dir}')
+		print(f'  {"interval":>9} {"writers":>8} {"ops/s":>10} {"fdatasyncs":>11}')
+		for interval in intervals:
+			for writers in (1, 64):
+				rate, syncs = bench(log_dir, interval, ops, writers)
+				print(f'  {interval * 1000:>7.1f}ms {writers:>8} {rate:>10,.0f} {syncs:>11,}')
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+
+from src.libwolfs.blockmap import BlockMap, punch_hole
+
+CHUNK = 4096
+
+
+class TestBlockMap:
+	def test_chunk_arithmetic(self) -> None:
+		block_map = BlockMap(CHUNK, 3 * CHUNK + 10)
+		assert list(block_map.chunks(0, CHUNK)) == [0]
+		assert list(block_map.chunks(CHUNK - 1, 2)) == [0, 1]
+		assert list(block_map.chunks(0, 0)) == []
+		assert block_map.span(3, 3 * CHUNK + 10) == (3 * CHUNK, 10)
+		assert block_map.span(4, 3 * CHUNK + 10) == (4 * CHUNK, 0)
+
+	def test_bits(self) -> None:
+		block_map = BlockMap(CHUNK, 100 * CHUNK)
+		for idx in (0, 7, 8, 63):
+			block_map.add(idx)
+		assert 7 in block_map and 8 in block_map and 9 not in block_map
+		assert list(block_map) == [0, 7, 8, 63]
+		assert len(block_map) == 4
+		block_map.discard(7)
+		block_map.discard(1000)
+		assert list(block_map) == [0, 8, 63]
+
+	def test_missing_stops_at_source_size(self) -> None:
+		block_map = BlockMap(CHUNK, 2 * CHUNK)
+		block_map.add(0)
+		assert block_map.missing(0, 10 * CHUNK) == [1]
+		assert block_map.missing(5 * CHUNK, CHUNK) == []
+
+	def test_truncate(self) -> None:
+		block_map = BlockMap(CHUNK, 20 * CHUNK)
+		for idx in range(20):
+			block_map.add(idx)
+		assert block_map.truncate(10 * CHUNK + 1) == list(range(11, 20))
+		assert list(block_map) == list(range(11))
+		assert block_map.source_size == 10 * CHUNK + 1
+		assert block_map.truncate(0) == list(range(11))
+		assert len(block_map) == 0
+
+	def test_persistence(self, tmpdir) -> None:
+		cpath = os.path.join(tmpdir, 'file')
+		block_map = BlockMap(CHUNK, 5 * CHUNK)
+		block_map.add(1)
+		block_map.add(4)
+		block_map.save(cpath)
+
+		loaded = BlockMap.load(cpath, CHUNK, 0)
+		assert list(loaded) == [1, 4] and loaded.source_size == 5 * CHUNK
+
+		# a different chunk size invalidates the map
+		assert len(BlockMap.load(cpath, 2 * CHUNK, 0)) == 0
+
+		BlockMap.move(cpath, cpath + '_new')
+		assert list(BlockMap.load(cpath + '_new', CHUNK, 0)) == [1, 4]
+		BlockMap.remove(cpath + '_new')
+		assert not os.path.exists(BlockMap.sidecar(cpath + '_new'))
+
+	def test_punch_hole(self, tmpdir) -> None:
+		path = os.path.join(tmpdir, 'file')
+		with open(path, 'wb') as f:
+			f.write(b'x' * 4 * CHUNK)
+		fd = os.open(path, os.O_RDWR)
+		try:
+			if not punch_hole(fd, CHUNK, CHUNK):
+				return  # filesystem of tmpdir can't punch holes
+			assert os.pread(fd, CHUNK, CHUNK) == bytes(CHUNK)
+			assert os.pread(fd, CHUNK, 0) == b'x' * CHUNK
+			assert os.fstat(fd).st_size == 4 * CHUNK
+		finally:
+			os.close(fd)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+import time
+from pathlib import Path
+
+from src.libwolfs.journal import File_Ops, Journal, LogEntry
+from src.libwolfs.wal import WalRecord
+from test.test_disk import get_src_cache_directory_pair
+from test.test_wal import crashed_log, prep_Journal
+
+CREATE, WRITE, UNLINK, RENAME, MKDIR = File_Ops.CREATE, File_Ops.WRITE, File_Ops.UNLINK, File_Ops.RENAME, File_Ops.MKDIR
+
+
+def history(*ops):
+	"""(op, path[, path_new or (offset, length)]) -> log entries numbered like their records in the log"""
+	entries = []
+	for lsn, (op, path, *arg) in enumerate(ops, start=1):
+		e = LogEntry(op, 0, path, lsn=lsn)
+		if op == WRITE:
+			e.ranges.add(*arg[0])
+		elif op == RENAME:
+			e.path_new = arg[0]
+		entries.append(e)
+	return entries
+
+
+def summary(entries):
+	return [(e.op, e.path, e.path_new or list(e.ranges)) if e.op in (RENAME, WRITE) else (e.op, e.path)
+			for e in entries]
+
+
+class TestCompaction:
+	def test_write_delete_recreate_write(self):
+		entries = history((WRITE, '/c/f', (0, 10)), (UNLINK, '/c/f'), (CREATE, '/c/f'), (WRITE, '/c/f', (0, 3)))
+		# the first generation is gone, the second one keeps its write
+		assert summary(Journal.compact(entries)) == [(UNLINK, '/c/f'), (CREATE, '/c/f'), (WRITE, '/c/f', [(0, 3)])]
+
+	def test_create_unlink_cancels(self):
+		entries = history((CREATE, '/c/tmp'), (WRITE, '/c/tmp', (0, 100)), (RENAME, '/c/tmp', '/c/tmp2'),
+						  (UNLINK, '/c/tmp2'), (CREATE, '/c/kept'))
+		assert summary(Journal.compact(entries)) == [(CREATE, '/c/kept')]
+
+	def test_rename_chain(self):
+		entries = history((RENAME, '/c/a', '/c/b'), (WRITE, '/c/b', (0, 5)), (RENAME, '/c/b', '/c/c'),
+						  (WRITE, '/c/c', (5, 5)))
+		assert summary(Journal.compact(entries)) == [(RENAME, '/c/a', '/c/c'), (WRITE, '/c/c', [(0, 10)])]
+		# and back again
+		entries = history((RENAME, '/c/a', '/c/b'), (RENAME, '/c/b', '/c/a'))
+		assert Journal.compact(entries) == []
+
+	def test_created_then_moved(self):
+		entries = history((CREATE, '/c/a'), (RENAME, '/c/a', '/c/b'), (WRITE, '/c/b', (0, 1)))
+		assert summary(Journal.compact(entries)) == [(CREATE, '/c/b'), (WRITE, '/c/b', [(0, 1)])]
+
+	def test_renamed_then_deleted(self):
+		entries = history((WRITE, '/c/a', (0, 1)), (RENAME, '/c/a', '/c/b'), (UNLINK, '/c/b'))
+		assert summary(Journal.compact(entries)) == [(UNLINK, '/c/a')]
+
+	def test_conflicting_ops_in_between(self):
+		# a new file takes the old name before the chain is complete
+		entries = history((RENAME, '/c/a', '/c/b'), (CREATE, '/c/a'), (RENAME, '/c/b', '/c/c'))
+		assert summary(Journal.compact(entries)) == [(RENAME, '/c/a', '/c/b'), (CREATE, '/c/a'),
+													 (RENAME, '/c/b', '/c/c')]
+
+	def test_directory(self):
+		entries = history((MKDIR, '/c/d'), (CREATE, '/c/d/f'), (WRITE, '/c/d/f', (0, 1)), (RENAME, '/c/d', '/c/e'),
+						  (WRITE, '/c/e/f', (1, 1)))
+		# the directory can't be created at its new name while something is created inside it
+		assert summary(Journal.compact(entries)) == [(MKDIR, '/c/d'), (CREATE, '/c/d/f'), (RENAME, '/c/d', '/c/e'),
+													 (WRITE, '/c/e/f', [(0, 2)])]
+		# a temporary directory and everything in it
+		entries = history((MKDIR, '/c/t'), (CREATE, '/c/t/f'), (WRITE, '/c/t/f', (0, 1)), (UNLINK, '/c/t/f'),
+						  (UNLINK, '/c/t'))
+		assert Journal.compact(entries) == []
+
+	def test_large_history(self):
+		"""an untar which writes its files under temporary names and moves them into place at the end"""
+		files = [f'/c/x/d{d}/f{f}' for d in range(100) for f in range(33)]
+		entries = history(*[(MKDIR, f'/c/x/d{d}') for d in range(100)],
+						  *[(CREATE, path + '.tmp') for path in files],
+						  *[(WRITE, path + '.tmp', (0, 10)) for path in files],
+						  *[(RENAME, path + '.tmp', path) for path in files])
+		assert len(entries) == 10000
+		start = time.monotonic()
+		compacted = Journal.compact(entries)
+		# checking every op in between each pair took half a minute here
+		assert time.monotonic() - start < 5
+		assert len(compacted) == 100 + 2 * len(files)
+		assert summary(compacted[100:101]) == [(CREATE, '/c/x/d0/f0')]
+		assert summary(compacted[-1:]) == [(WRITE, '/c/x/d99/f32', [(0, 10)])]
+
+	def test_leaves_history_alone(self):
+		entries = history((CREATE, '/c/a'), (RENAME, '/c/a', '/c/b'))
+		Journal.compact(entries)
+		assert summary(entries) == [(CREATE, '/c/a'), (RENAME, '/c/a', '/c/b')]
+
+
+class TestCompactedReplay:
+	def test_write_delete_recreate_write(self, tmpdir_factory):
+		source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+		(source / 'f').write_bytes(b'old contents')
+		(cache / 'f').write_bytes(b'new')
+		path = str(cache / 'f')
+		records = [WalRecord(WRITE.value, 0, path, offset=0, length=12), WalRecord(UNLINK.value, 0, path),
+				   WalRecord(CREATE.value, 0, path, flags=os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+				   WalRecord(WRITE.value, 0, path, offset=0, length=3)]
+		journal = prep_Journal(source, cache, crashed_log(tmpdir_factory, records))
+		assert journal.recover() == len(records)
+		assert (source / 'f').read_bytes() == b'new'
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+
+import pytest
+from src.libwolfs import copyengine
+from src.libwolfs.copyengine import copy_file, copy_range, data_segments
+
+MEGABYTE = 1024 * 1024
+
+
+def write_sparse(path, pieces):
+	""":param pieces: (offset, data) written into an otherwise empty file of 4 MB"""
+	with open(path, 'wb') as f:
+		f.truncate(4 * MEGABYTE)
+		for offset, data in pieces:
+			f.seek(offset)
+			f.write(data)
+
+
+@pytest.fixture(params=['copy_file_range', 'sendfile', 'pread'])
+def engine(request, monkeypatch):
+	"""runs a test once per fallback level"""
+	monkeypatch.setattr(copyengine, 'use_reflink', False)
+	monkeypatch.setattr(copyengine, 'use_copy_file_range', request.param == 'copy_file_range')
+	monkeypatch.setattr(copyengine, 'use_sendfile', request.param in ('copy_file_range', 'sendfile'))
+	return request.param
+
+
+class TestCopyEngine:
+	def test_copy_range(self, tmpdir, engine):
+		src, dst = os.path.join(tmpdir, 'src'), os.path.join(tmpdir, 'dst')
+		data = os.urandom(3 * MEGABYTE + 17)
+		with open(src, 'wb') as f:
+			f.write(data)
+		with open(dst, 'wb') as f:
+			f.write(bytes(len(data)))
+
+		fd_src, fd_dst = os.open(src, os.O_RDONLY), os.open(dst, os.O_WRONLY)
+		try:
+			assert copy_range(fd_src, fd_dst, MEGABYTE - 3, MEGABYTE) == MEGABYTE
+			# stops at the end of the source
+			assert copy_range(fd_src, fd_dst, 3 * MEGABYTE, MEGABYTE) == 17
+		finally:
+			os.close(fd_src)
+			os.close(fd_dst)
+
+		with open(dst, 'rb') as f:
+			copied = f.read()
+		assert copied[:MEGABYTE - 3] == bytes(MEGABYTE - 3)
+		assert copied[MEGABYTE - 3:2 * MEGABYTE - 3] == data[MEGABYTE - 3:2 * MEGABYTE - 3]
+		assert copied[3 * MEGABYTE:] == data[3 * MEGABYTE:]
+
+	def test_copy_file_keeps_holes(self, tmpdir, engine):
+		src, dst = os.path.join(tmpdir, 'src'), os.path.join(tmpdir, 'dst')
+		write_sparse(src, [(0, b'head'), (3 * MEGABYTE, os.urandom(4096))])
+		with open(dst, 'wb') as f:
+			f.write(b'old content which is longer than nothing' * MEGABYTE)
+
+		copy_file(src, dst)
+		with open(src, 'rb') as f_src, open(dst, 'rb') as f_dst:
+			assert f_src.read() == f_dst.read()
+
+		fd = os.open(src, os.O_RDONLY)
+		try:
+			segments = list(data_segments(fd, 4 * MEGABYTE))
+		finally:
+			os.close(fd)
+		if len(segments) > 1:
+			# filesystem of tmpdir knows about holes -> so does the copy
+			assert os.stat(dst).st_blocks <= os.stat(src).st_blocks
+
+	def test_data_segments_without_data(self, tmpdir):
+		path = os.path.join(tmpdir, 'empty')
+		write_sparse(path, [])
+		fd = os.open(path, os.O_RDONLY)
+		try:
+			assert sum(length for _, length in data_segments(fd, 4 * MEGABYTE)) in (0, 4 * MEGABYTE)
+		finally:
+			os.close(fd)
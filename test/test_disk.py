@@ -12,7 +12,7 @@ from IPython import embed
 embed = embed
 import random
 from src.libwolfs.disk import Disk
-from test.util import name_generator, nano_sleep, pseudo_file
+from test.util import data_file, name_generator, nano_sleep, pseudo_file
 from src.libwolfs.translator import MountFSDirectoryInfo
 
 with open(__file__, 'rb') as fh:
@@ -28,10 +28,10 @@ USE_NOATIME = True
 CACHE_THRESHOLD = 0.7
 
 def prep_Disk(sourceDir, cacheDir, maxCacheSize=CACHE_SIZE, noatime=USE_NOATIME,
-			  cacheThreshold=CACHE_THRESHOLD):
+			  cacheThreshold=CACHE_THRESHOLD, chunkSize=0):
 	mount_info = MountFSDirectoryInfo(sourceDir, cacheDir, cacheDir) # ignore mountpoint
 	return Disk(mount_info, maxCacheSize=maxCacheSize, noatime=noatime,
-				cacheThreshold=cacheThreshold)
+				cacheThreshold=cacheThreshold, chunkSize=chunkSize)
 
 
 def clean_Disk():
@@ -242,20 +242,20 @@ class TestDisk:
 
 		# 1. case: path is unkown -> new ino
 		ino = disk.path_to_ino(path)
-		assert disk._InodeTranslator__path_ino_map.get(rpath) == ino, f"path didnt save ino in internal dict"
+		assert disk.lookup_ino(rpath) == ino, f"path didnt save ino in internal index"
 
 		# 2. case: path is known -> same ino (normal ops)
 		assert disk.path_to_ino(path) == ino, f"If known the same ino should be returned"
 
 		# 3. case: reusing an ino (in rename ops)
 		del disk[(ino, path.__str__())]
-		ino_rpath = disk._InodeTranslator__path_ino_map.get(rpath)
-		assert ino_rpath is None, f"{disk._InodeTranslator__path_ino_map} should contain {path} as it was inserted"
+		ino_rpath = disk.lookup_ino(rpath)
+		assert ino_rpath is None, f"{path} should be removed from the index as it was deleted"
 		__freed_inos = disk._InodeTranslator__freed_inos
 		assert ino in __freed_inos, f"{__freed_inos} should contain {ino} as it was deleted"
 
 		disk.path_to_ino(path, reuse_ino=ino)
-		assert disk._InodeTranslator__path_ino_map.get(rpath) == ino, f"Should have reused the same ino"
+		assert disk.lookup_ino(rpath) == ino, f"Should have reused the same ino"
 
 		# 4. case: inodes grow only larger
 		path2: Path = Path(os.path.join(tmpdir_source, name_generator()))
@@ -272,17 +272,262 @@ class TestDisk:
 	def test__cp_path(self):
 		pass
 
-	def test_track(self):
-		pass
+	def test_track(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		files = [Path(os.path.join(tmpdir_source, f'file_{i}')) for i in range(3)]
+		inos = []
+		for f in files:
+			pseudo_file(f, 10)
+			inos.append(disk.track(f.__str__()))
+
+		assert disk.victim() == inos[0], "Tracking order should be the access order"
+		assert disk._current_CacheSize == 3 * disk.allocated(10 * 1024)
+
+		# re-tracking doesn't reserve the size twice but counts as an access
+		assert disk.track(files[0].__str__()) == inos[0]
+		assert disk._current_CacheSize == 3 * disk.allocated(10 * 1024)
+		assert disk.victim() == inos[1]
+
+		disk.touch(inos[1])
+		assert disk.victim() == inos[2]
+		assert disk.victim(skip={inos[2]}) == inos[0]
+		assert disk.victim(skip=set(inos)) is None
+
+	def test_untrack(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		f = Path(os.path.join(tmpdir_source, name_generator()))
+		pseudo_file(f, 10)
+		ino = disk.track(f.__str__())
+		assert ino in disk
 
-	def test_untrack(self):
-		pass
+		disk.untrack(f.__str__())
+		assert ino not in disk
+		assert disk._current_CacheSize == 0
 
-	def test_makeRoomForPath(self):
-		pass
+		# untracking unknown paths is a no-op
+		disk.untrack(os.path.join(tmpdir_source, 'unknown'))
+		assert disk._current_CacheSize == 0
+
+	def test_makeRoomForPath(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		files = [Path(os.path.join(tmpdir_source, f'file_{i}')) for i in range(4)]
+		for f in files:
+			data_file(f, 300)
+		for f in files[:3]:
+			disk.cp2Cache(f, force=True)
+		inos = [disk.lookup_ino(disk.toRoot(f)) for f in files[:3]]
+
+		# file_0 was fetched first but read recently -> file_1 is the LRU victim
+		disk.touch(inos[0])
+		disk.cp2Cache(files[3], force=True)
+		assert not disk.toTmp(files[1]).exists()
+		assert inos[1] not in disk
+		assert disk.toTmp(files[0]).exists() and disk.toTmp(files[2]).exists()
+
+		# busy inodes are skipped
+		disk.cp2Cache(files[1], force=True, busy_inos={inos[2]})
+		assert disk.toTmp(files[2]).exists()
+		assert not disk.toTmp(files[0]).exists()
 
 	def test_cp2Cache(self):
 		pass
 
 	def test_rebuildCacheDir(self):
 		pass
+
+
+CHUNK = 64 * 1024
+
+
+def prep_chunked_file(tmpdir_factory, size_kb=512, maxCacheSize=1):
+	tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+	disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=maxCacheSize, chunkSize=CHUNK)
+	src = Path(os.path.join(tmpdir_source, name_generator()))
+	with open(src, 'wb') as f:
+		f.write(os.urandom(size_kb * 1024))
+	ino = disk.path_to_ino(src)
+	cpath = disk.prepare_sparse(ino, os.path.getsize(src))
+	return disk, src, ino, cpath
+
+
+class TestChunkedDisk:
+	def test_fetch_only_touched_chunks(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		assert os.path.getsize(cpath) == os.path.getsize(src)
+		assert disk._current_CacheSize == 0
+
+		assert disk.fetch_chunks(ino, CHUNK + 10, CHUNK) == 2 * CHUNK
+		assert list(disk.block_map(ino)) == [1, 2]
+		assert (ino, 1) in disk and (ino, 0) not in disk
+		assert disk._current_CacheSize == 2 * CHUNK
+		with open(src, 'rb') as f_src, open(cpath, 'rb') as f_cache:
+			assert f_src.read()[CHUNK:3 * CHUNK] == f_cache.read()[CHUNK:3 * CHUNK]
+
+		# already cached -> nothing to do
+		assert disk.fetch_chunks(ino, CHUNK, 2 * CHUNK) == 0
+		assert disk.has_range(ino, CHUNK, 2 * CHUNK)
+		assert not disk.has_range(ino, 0, CHUNK)
+
+	def test_block_map_survives_remount(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		disk.fetch_chunks(ino, 0, CHUNK)
+		disk.flush_block_map(ino)
+
+		remounted = prep_Disk(disk.sourceDir, disk.cacheDir, maxCacheSize=1, chunkSize=CHUNK)
+		ino2 = remounted.path_to_ino(src)
+		assert list(remounted.block_map(ino2)) == [0]
+		assert remounted._current_CacheSize == CHUNK
+
+	def test_file_larger_than_cache(self, tmpdir_factory):
+		# 2 MB file in a 1 MB cache: reading it front to back evicts its own old chunks
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory, size_kb=2048)
+		for offset in range(0, 2048 * 1024, CHUNK):
+			disk.fetch_chunks(ino, offset, CHUNK)
+			assert disk._current_CacheSize <= disk.maxCacheSize
+		assert 0 not in disk.block_map(ino)
+		assert (2048 * 1024 // CHUNK) - 1 in disk.block_map(ino)
+
+	def test_dirty_chunks_are_kept(self, tmpdir_factory):
+		from src.libwolfs.cache import BusyKeys
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory, size_kb=2048)
+		disk.fetch_chunks(ino, 0, CHUNK)
+		with pytest.raises(Exception):
+			# only dirty chunks are left
+			disk.fetch_chunks(ino, CHUNK, 2048 * 1024, BusyKeys([ino], [ino]))
+		assert 0 in disk.block_map(ino)
+
+	def test_prepare_write(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		# partially covered edges are fetched, the chunk in between is only claimed
+		disk.prepare_write(ino, CHUNK - 1, CHUNK + 2)
+		assert list(disk.block_map(ino)) == [0, 1, 2]
+		with open(src, 'rb') as f_src, open(cpath, 'rb') as f_cache:
+			data_src, data_cache = f_src.read(), f_cache.read()
+		assert data_src[:CHUNK] == data_cache[:CHUNK]
+		assert data_cache[CHUNK:2 * CHUNK] == bytes(CHUNK)
+		assert data_src[2 * CHUNK:3 * CHUNK] == data_cache[2 * CHUNK:3 * CHUNK]
+
+	def test_truncate_chunks(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		disk.fetch_chunks(ino, 0, 512 * 1024)
+		disk.truncate_chunks(ino, CHUNK + 1)
+		os.truncate(cpath, CHUNK + 1)
+		assert list(disk.block_map(ino)) == [0, 1]
+		assert disk._current_CacheSize == 2 * CHUNK
+
+		# growing the file again doesn't fetch stale source data
+		os.truncate(cpath, 512 * 1024)
+		assert disk.fetch_chunks(ino, 0, 512 * 1024) == 0
+
+	def test_evict_chunk_punches_hole(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		disk.fetch_chunks(ino, 0, 2 * CHUNK)
+		plan = disk.detach((ino, 0))
+		Disk.release(*plan)
+		assert list(disk.block_map(ino)) == [1]
+		assert disk._current_CacheSize == CHUNK
+		# the persisted map already forgot about the chunk
+		from src.libwolfs.blockmap import BlockMap
+		assert list(BlockMap.load(cpath, CHUNK, 0)) == [1]
+
+	def test_untrack_drops_chunks(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		disk.fetch_chunks(ino, 0, 2 * CHUNK)
+		disk.flush_block_map(ino)
+		os.remove(cpath)
+		disk.untrack(cpath)
+		assert disk._current_CacheSize == 0
+		assert not os.path.exists(cpath + '.wolfs-blocks')
+
+
+class TestAccounting:
+	def test_sparse_files_are_charged_by_blocks(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		src = Path(os.path.join(tmpdir_source, name_generator()))
+		pseudo_file(src, 512)
+		# reserved as if it had no holes ...
+		assert disk.estimate(src) == 512 * 1024
+		cpath = disk.cp2Cache(src)
+		# ... but only charged what the copy allocates
+		ino = disk.lookup_ino(src)
+		assert disk.in_cache[ino] == Disk.allocation(cpath) < 512 * 1024
+
+	def test_recharge_after_write(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		src = Path(os.path.join(tmpdir_source, name_generator()))
+		data_file(src, 8)
+		cpath = disk.cp2Cache(src)
+		ino = disk.lookup_ino(src)
+		before = disk._current_CacheSize
+
+		disk.reserve_write(ino, 64 * 1024)
+		fd = os.open(cpath, os.O_WRONLY)
+		os.pwrite(fd, os.urandom(56 * 1024), 8 * 1024)
+		assert disk.recharge(ino, fd) == Disk.allocation(cpath) - disk.allocated(8 * 1024)
+		os.ftruncate(fd, 0)
+		disk.recharge(ino, fd)
+		os.close(fd)
+		assert disk._current_CacheSize == before - disk.allocated(8 * 1024)
+
+	def test_directories_grow(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		subdir = Path(os.path.join(tmpdir_source, 'dir'))
+		os.mkdir(subdir)
+		for i in range(200):
+			f = Path(os.path.join(subdir, f'{name_generator()}_{i}'))
+			f.touch()
+			disk.cp2Cache(f)
+		dir_ino = disk.lookup_ino(subdir)
+		assert disk.in_cache[dir_ino] == Disk.allocation(disk.toTmp(subdir))
+
+	def test_reconcile(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		src = Path(os.path.join(tmpdir_source, name_generator()))
+		data_file(src, 8)
+		cpath = disk.cp2Cache(src)
+		ino = disk.lookup_ino(src)
+		# written behind our back
+		with open(cpath, 'ab') as f:
+			f.write(os.urandom(32 * 1024))
+
+		snapshot = disk.accounting_snapshot()
+		measured, fs_free = Disk.measure([cpath for _, cpath, _ in snapshot], disk.cacheDir)
+		assert disk.reconcile(snapshot, measured, fs_free) == Disk.allocation(cpath) - disk.allocated(8 * 1024)
+		assert disk.in_cache[ino] == Disk.allocation(cpath)
+		assert disk.reconcile(snapshot, measured, fs_free) == 0
+
+		# a nearly full cache filesystem leaves less room than maxCacheSize
+		disk.reconcile([], [], 4096)
+		assert disk.capacity == disk._current_CacheSize + 4096
+		assert not disk.canStore(8192)
+
+	def test_evict_on_demand(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		src = Path(os.path.join(tmpdir_source, name_generator()))
+		data_file(src, 8)
+		cpath = disk.cp2Cache(src)
+		ino = disk.lookup_ino(src)
+		assert disk.resident(ino) == 8 * 1024
+
+		assert disk.evict(ino) == disk.allocated(8 * 1024)
+		assert not cpath.exists() and ino not in disk
+		assert disk.resident(ino) == 0
+		# nothing left to drop
+		assert disk.evict(ino) == 0
+
+	def test_resident_chunks(self, tmpdir_factory):
+		disk, src, ino, cpath = prep_chunked_file(tmpdir_factory)
+		assert disk.resident(ino) == 0
+		disk.fetch_chunks(ino, CHUNK + 10, CHUNK)
+		assert disk.resident(ino) == 2 * CHUNK
+		disk.evict(ino)
+		assert not os.path.exists(cpath) and not os.path.exists(cpath + '.wolfs-blocks')
+		assert disk._current_CacheSize == 0
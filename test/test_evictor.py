@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+import threading
+from pathlib import Path
+
+import trio
+from src.libwolfs.evictor import Evictor
+from test.test_disk import get_src_cache_directory_pair, prep_Disk
+from test.util import data_file
+
+FILE_SIZE_KB = 100
+
+
+def prep_Evictor(tmpdir_factory, files: int = 9, busy=(), dirs=()):
+	tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+	disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1, cacheThreshold=0.8)
+	paths = [Path(os.path.join(tmpdir_source, f'file_{i}')) for i in range(files)]
+	for path in paths:
+		data_file(path, FILE_SIZE_KB)
+		disk.cp2Cache(path)
+	inos = [disk.lookup_ino(disk.toRoot(path)) for path in paths]
+	evictor = Evictor(disk, lambda: {inos[i] for i in busy}, lambda ino: ino in {inos[i] for i in dirs})
+	return disk, evictor, paths, inos
+
+
+class TestEvictor:
+	def test_evict_to_low_watermark(self, tmpdir_factory):
+		disk, evictor, paths, inos = prep_Evictor(tmpdir_factory)
+		assert disk.isFull(use_threshold=True)
+
+		freed = trio.run(evictor.evict_to, disk.lowWatermark)
+		assert disk.usage() <= disk.lowWatermark
+		assert freed == evictor.evicted_bytes == evictor.evicted_files * FILE_SIZE_KB * 1024
+
+		# least recently used files went first
+		for path, ino in zip(paths[:evictor.evicted_files], inos):
+			assert not disk.toTmp(path).exists() and ino not in disk
+		for path, ino in zip(paths[evictor.evicted_files:], inos[evictor.evicted_files:]):
+			assert disk.toTmp(path).exists() and ino in disk
+
+	def test_skips_busy_and_dirs(self, tmpdir_factory):
+		disk, evictor, paths, inos = prep_Evictor(tmpdir_factory, busy=(0,), dirs=(1,))
+		trio.run(evictor.evict_to, 0.0)
+		assert disk.toTmp(paths[0]).exists() and inos[0] in disk
+		assert disk.toTmp(paths[1]).exists() and inos[1] in disk
+		for path in paths[2:]:
+			assert not disk.toTmp(path).exists()
+
+	def test_settle_waits_for_batch(self, tmpdir_factory, monkeypatch):
+		disk, evictor, paths, inos = prep_Evictor(tmpdir_factory)
+		# hold the first batch in the worker thread until the test has looked at it
+		in_thread, proceed = threading.Event(), threading.Event()
+		release_all = Evictor.release_all
+
+		def held_release_all(plans):
+			in_thread.set()
+			proceed.wait()
+			release_all(plans)
+		monkeypatch.setattr(Evictor, 'release_all', staticmethod(held_release_all))
+
+		async def open_while_evicting():
+			async with trio.open_nursery() as nursery:
+				nursery.start_soon(evictor.evict_to, 0.0)
+				await trio.to_thread.run_sync(in_thread.wait)
+				assert evictor.is_evicting(inos[0])
+				proceed.set()
+				await evictor.settle(inos[0])
+				assert not evictor.is_evicting(inos[0])
+				assert not disk.toTmp(paths[0]).exists()
+
+		trio.run(open_while_evicting)
+
+	def test_run_wakes_up_above_high_watermark(self, tmpdir_factory):
+		disk, evictor, _, _ = prep_Evictor(tmpdir_factory)
+
+		async def daemon():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(evictor.run)
+				evictor.wakeup()
+				while disk.isFull(use_threshold=True):
+					await trio.sleep(0.01)
+				nursery.cancel_scope.cancel()
+
+		trio.run(daemon)
+		assert disk.usage() <= disk.lowWatermark
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# type: ignore
+import threading
+
+import pytest
+import trio
+import trio.testing
+from src.libwolfs.fetcher import FetchEngine
+
+
+class TestFetchEngine:
+	def test_single_flight(self):
+		engine = FetchEngine(workers=2)
+		release = threading.Event()
+		copies = []
+
+		async def fetch(key):
+			copies.append(key)
+			await engine.run_sync(release.wait)
+
+		async def open_concurrently():
+			async with trio.open_nursery() as nursery:
+				for _ in range(5):
+					nursery.start_soon(engine.once, 42, fetch, 42)
+				await trio.testing.wait_all_tasks_blocked()
+				assert 42 in engine and engine.in_flight == 1
+				release.set()
+			assert 42 not in engine
+
+		trio.run(open_concurrently)
+		assert copies == [42]
+		assert engine.fetches == 1 and engine.shared == 4
+
+	def test_pool_is_bounded(self):
+		engine = FetchEngine(workers=2)
+		release = threading.Event()
+
+		async def fetch_many():
+			async with trio.open_nursery() as nursery:
+				for key in range(5):
+					nursery.start_soon(engine.once, key, engine.run_sync, release.wait)
+				await trio.testing.wait_all_tasks_blocked()
+				# independent fetches run in parallel, up to the pool size
+				assert engine.in_flight == 2 and engine.queue_depth == 3
+				assert engine.keys == set(range(5))
+				release.set()
+			assert engine.in_flight == 0 and engine.queue_depth == 0
+
+		trio.run(fetch_many)
+		assert engine.fetches == 5
+
+	def test_error_reaches_every_waiter(self):
+		engine = FetchEngine()
+		release = threading.Event()
+		errors = []
+
+		def broken_copy():
+			release.wait()
+			raise OSError(5, 'Input/output error')
+
+		async def open_broken():
+			try:
+				await engine.once('ino', engine.run_sync, broken_copy)
+			except OSError as exc:
+				errors.append(exc.errno)
+
+		async def main():
+			async with trio.open_nursery() as nursery:
+				nursery.start_soon(open_broken)
+				nursery.start_soon(open_broken)
+				await trio.testing.wait_all_tasks_blocked()
+				release.set()
+
+		trio.run(main)
+		assert errors == [5, 5]
+		assert 'ino' not in engine
+
+	def test_begin_end_wait(self):
+		engine = FetchEngine()
+
+		async def main():
+			flight = engine.begin([(1, 0), (1, 1)])
+			with pytest.raises(AssertionError):
+				engine.begin([(1, 1)])
+			async with trio.open_nursery() as nursery:
+				nursery.start_soon(engine.wait, [(1, 1), (1, 7)])
+				await trio.testing.wait_all_tasks_blocked()
+				engine.end(flight)
+			assert not engine.keys
+
+			cancelled = engine.begin([(2, 0)])
+			engine.end(cancelled, KeyboardInterrupt())
+			with pytest.raises(OSError):
+				await cancelled.wait()
+
+		trio.run(main)
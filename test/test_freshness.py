@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# type: ignore
+import math
+import os
+
+import trio
+
+from src.libwolfs.freshness import Freshness, StatBatcher
+from test.test_pins import prep_tree
+
+
+class TestFreshness:
+	def test_ttl_per_subtree(self, tmpdir_factory):
+		disk, _, inos = prep_tree(tmpdir_factory)
+		freshness = Freshness(disk, ttl=60)
+		assert freshness.ttl(inos['a/b/f']) == 60
+		freshness.set_ttl(inos['a'], 10)
+		freshness.set_ttl(inos['a/b'], math.inf)
+		# the closest directory above wins
+		assert freshness.ttl(inos['a/g']) == 10
+		assert freshness.ttl(inos['a/b/f']) == math.inf
+		assert freshness.ttl(inos['h']) == 60
+		assert freshness.clear_ttl(inos['a/b']) and not freshness.clear_ttl(inos['a/b'])
+		assert freshness.ttl(inos['a/b/f']) == 10
+
+	def test_due(self, tmpdir_factory):
+		disk, _, inos = prep_tree(tmpdir_factory)
+		freshness = Freshness(disk, ttl=10)
+		ino = inos['h']
+		# never checked (e.g. adopted from an earlier run)
+		assert freshness.due(ino, now=0)
+		freshness.checked(ino, now=100)
+		assert not freshness.due(ino, now=109) and freshness.due(ino, now=110)
+		freshness.forget(ino)
+		assert freshness.due(ino, now=100)
+
+	def test_never(self, tmpdir_factory):
+		disk, _, inos = prep_tree(tmpdir_factory)
+		assert not Freshness(disk).due(inos['h'], now=0)
+
+
+class TestStatBatcher:
+	def test_batched(self, tmp_path):
+		paths = [tmp_path / name for name in 'abc']
+		for path in paths[:2]:
+			path.write_bytes(b'x' * 3)
+		batcher = StatBatcher(window=0.01)
+		results = {}
+
+		async def stat(path):
+			results[path] = await batcher.stat(str(path))
+
+		async def main():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(batcher.run)
+				async with trio.open_nursery() as requests:
+					for path in paths + paths[:1]:
+						requests.start_soon(stat, path)
+				assert [r.st_size if r else None for r in await batcher.stat_many([str(p) for p in paths])] \
+					== [3, 3, None]
+				nursery.cancel_scope.cancel()
+
+		trio.run(main)
+		assert results[paths[0]].st_ino == os.stat(paths[0]).st_ino and results[paths[2]] is None
+		# concurrent requests share one worker thread run, the same path is only stat'ed once
+		assert batcher.batches == 2 and batcher.stats == 6
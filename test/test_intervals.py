@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# type: ignore
+from src.libwolfs.intervals import IntervalSet
+
+WRITE = 128 * 1024
+
+
+class TestIntervalSet:
+	def test_sequential_writes_merge(self):
+		ranges = IntervalSet()
+		for offset in range(0, 1000 * WRITE, WRITE):
+			assert ranges.add(offset, WRITE) == WRITE
+		assert list(ranges) == [(0, 1000 * WRITE)]
+		assert ranges.size == 1000 * WRITE
+
+	def test_overlaps(self):
+		ranges = IntervalSet()
+		ranges.add(100, 10)
+		ranges.add(0, 10)
+		ranges.add(50, 10)
+		assert list(ranges) == [(0, 10), (50, 10), (100, 10)]
+		# rewriting dirty bytes adds nothing
+		assert ranges.add(52, 5) == 0 and len(ranges) == 3
+		# bridges the two ranges around it
+		assert ranges.add(5, 50) == 40
+		assert list(ranges) == [(0, 60), (100, 10)]
+		# adjacent to both
+		assert ranges.add(60, 40) == 40
+		assert list(ranges) == [(0, 110)] and ranges.size == 110
+
+	def test_empty(self):
+		ranges = IntervalSet()
+		assert ranges.add(10, 0) == 0 and not ranges and ranges.size == 0
+
+	def test_update(self):
+		ranges, other = IntervalSet(), IntervalSet()
+		ranges.add(0, 10)
+		other.add(5, 10)
+		other.add(30, 10)
+		ranges.update(other)
+		assert list(ranges) == [(0, 15), (30, 10)] and ranges.size == 25
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+from pathlib import Path
+
+from src.libwolfs.disk import Disk
+from src.libwolfs.manifest import Manifest, ManifestEntry
+from test.test_disk import CHUNK, get_src_cache_directory_pair, prep_Disk
+from test.util import name_generator
+
+
+def make_source(tmpdir_source, count=3, size=1024):
+	paths = []
+	for _ in range(count):
+		src = Path(os.path.join(tmpdir_source, name_generator()))
+		with open(src, 'wb') as f:
+			f.write(os.urandom(size))
+		paths.append(src)
+	return paths
+
+
+def source_attrs(disk):
+	# what the indexed source tree (VFS) tells VFSOps.adoptCache
+	def attrs(ino):
+		src = disk.toSrc(disk.ino_to_rpath(ino))
+		if not src.exists():
+			return None
+		stat = os.stat(src)
+		return stat.st_size, stat.st_mtime_ns
+	return attrs
+
+
+def remount(disk, chunkSize=0):
+	restarted = prep_Disk(disk.sourceDir, disk.cacheDir, maxCacheSize=1, chunkSize=chunkSize)
+	for src in Path(disk.sourceDir).iterdir():
+		restarted.path_to_ino(src)  # populate_inode_maps
+	return restarted
+
+
+class TestManifest:
+	def test_roundtrip(self, tmp_path):
+		manifest = Manifest(tmp_path)
+		entries = [ManifestEntry('/a', 1, 1, 42, True), ManifestEntry('/b/c', 0, 9, 43, False)]
+		assert manifest.save(entries, 0) == 2
+		assert manifest.load(0) == entries
+		# another chunk size means other cache files
+		assert manifest.load(CHUNK) == []
+
+	def test_corrupted(self, tmp_path):
+		assert Manifest(tmp_path).load(0) == []
+		(tmp_path / Manifest.FILE_NAME).write_text('{"version": 1, "chunk_size": 0}\n[1, 2\n')
+		assert Manifest(tmp_path).load(0) == []
+
+
+class TestAdopt:
+	def test_warm_restart(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		paths = make_source(tmpdir_source)
+		for src in paths:
+			disk.cp2Cache(src)
+		# least recently used first
+		disk.policy.on_access(disk.lookup_ino(paths[0]))
+		disk.save_manifest()
+
+		restarted = remount(disk)
+		assert restarted.adopt_manifest(source_attrs(restarted)) == (3, 0)
+		assert restarted._current_CacheSize == disk._current_CacheSize
+		inos = [restarted.lookup_ino(src) for src in paths]
+		assert restarted.policy.recency() == inos[1:] + inos[:1]
+
+	def test_stale_files_are_dropped(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		changed, deleted, partial = make_source(tmpdir_source)
+		for src in (changed, deleted):
+			disk.cp2Cache(src)
+		disk.prepare_stream(partial)
+		disk.save_manifest()
+
+		with open(changed, 'ab') as f:
+			f.write(b'changed in the source')
+		os.remove(deleted)
+		restarted = remount(disk)
+		assert restarted.adopt_manifest(source_attrs(restarted)) == (0, 3)
+		assert restarted._current_CacheSize == 0
+		for src in (changed, deleted, partial):
+			cpath = restarted.toTmp_str(src)
+			assert not os.path.exists(cpath) and not Disk.is_partial(cpath)
+
+	def test_orphans(self, tmpdir_factory):
+		# a crash leaves no manifest behind
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		kept, changed = make_source(tmpdir_source, count=2)
+		disk.cp2Cache(kept)
+		disk.cp2Cache(changed)
+		os.utime(changed, ns=(0, 0))
+
+		restarted = remount(disk)
+		assert restarted.adopt_manifest(source_attrs(restarted)) == (1, 1)
+		assert restarted.lookup_ino(kept) in restarted
+		assert not os.path.exists(restarted.toTmp_str(changed))
+
+	def test_chunks(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1, chunkSize=CHUNK)
+		src, = make_source(tmpdir_source, count=1, size=4 * CHUNK)
+		ino = disk.path_to_ino(src)
+		disk.prepare_sparse(ino, os.path.getsize(src))
+		disk.fetch_chunks(ino, CHUNK, 2 * CHUNK)
+		disk.save_manifest()
+		entry, = Manifest(disk.cacheDir).load(CHUNK)
+		assert entry.size == 2 * CHUNK and not entry.complete
+
+		restarted = remount(disk, chunkSize=CHUNK)
+		assert restarted.adopt_manifest(source_attrs(restarted)) == (1, 0)
+		assert list(restarted.block_map(restarted.lookup_ino(src))) == [1, 2]
+		assert restarted._current_CacheSize == 2 * CHUNK
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+
+from src.libwolfs.memtier import MemoryTier
+
+BLOCK = MemoryTier.BLOCK_SIZE
+
+
+def reader_of(data, calls=None):
+	def reader(length, offset):
+		if calls is not None:
+			calls.append((offset, length))
+		return data[offset:offset + length]
+	return reader
+
+
+def read_often(tier, ino, offset, length, times):
+	for _ in range(times):
+		assert tier.read(ino, offset, length) is None
+
+
+class TestMemoryTier:
+	def test_small_file(self):
+		tier = MemoryTier(capacity=4 * BLOCK)
+		data = os.urandom(1000)
+		# cold files stay on disk
+		assert tier.read(1, 0, 100) is None
+		assert not tier.hot(1) and tier.load(1, len(data), 0, 100, reader_of(data)) == 0
+
+		read_often(tier, 1, 0, 100, MemoryTier.PROMOTE_AFTER - 1)
+		assert tier.hot(1) and tier.load(1, len(data), 0, 100, reader_of(data)) == len(data)
+		hit = tier.read(1, 10, 2000)
+		assert isinstance(hit, memoryview) and hit == data[10:]
+		assert tier.hits == 1
+
+	def test_blocks(self):
+		tier = MemoryTier(capacity=4 * BLOCK, max_file_size=1024)
+		data = os.urandom(3 * BLOCK)
+		calls = []
+		read_often(tier, 1, BLOCK + 10, 100, MemoryTier.PROMOTE_AFTER)
+		assert tier.span(len(data), BLOCK + 10, 100) == (BLOCK, BLOCK)
+		# only the block which was read is hot
+		assert tier.load(1, len(data), BLOCK + 10, 100, reader_of(data, calls)) == BLOCK
+		assert calls == [(BLOCK, BLOCK)]
+		assert tier.read(1, BLOCK + 10, 100) == data[BLOCK + 10:BLOCK + 110]
+		assert tier.read(1, BLOCK - 10, 100) is None
+
+	def test_invalidate(self):
+		tier = MemoryTier(capacity=4 * BLOCK, max_file_size=1024)
+		small, big = os.urandom(100), os.urandom(2 * BLOCK)
+		read_often(tier, 1, 0, 10, MemoryTier.PROMOTE_AFTER)
+		read_often(tier, 2, 0, 10, MemoryTier.PROMOTE_AFTER)
+		tier.load(1, len(small), 0, 10, reader_of(small))
+		tier.load(2, len(big), 0, 10, reader_of(big))
+		assert 1 in tier and (2, 0) in tier
+		tier.invalidate(1)
+		tier.invalidate(2)
+		assert len(tier) == 0 and tier.policy.used == 0
+		assert tier.read(1, 0, 10) is None and tier.read(2, 0, 10) is None
+
+	def test_demotion_follows_frequency(self):
+		tier = MemoryTier(capacity=2 * 1024, max_file_size=1024)
+		data = os.urandom(1024)
+		for ino in (1, 2):
+			read_often(tier, ino, 0, 10, 5)
+			assert tier.load(ino, len(data), 0, 10, reader_of(data)) == len(data)
+		assert tier.read(1, 0, 10) is not None
+		# less popular than everything in RAM: stays on disk
+		read_often(tier, 3, 0, 10, MemoryTier.PROMOTE_AFTER)
+		assert tier.load(3, len(data), 0, 10, reader_of(data)) == 0
+		# more popular than the least frequently read one: demotes it
+		read_often(tier, 3, 0, 10, 6)
+		assert tier.load(3, len(data), 0, 10, reader_of(data)) == len(data)
+		assert 3 in tier and 1 in tier and 2 not in tier
+
+	def test_disabled(self):
+		tier = MemoryTier(capacity=0)
+		read_often(tier, 1, 0, 10, 5)
+		assert not tier.hot(1) and tier.misses == 0
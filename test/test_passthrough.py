@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+
+import trio
+
+from src.libwolfs.passthrough import SourceFds, pread, pwrite
+
+
+def make_file(tmp_path, name='f', data=b'0123456789'):
+	path = tmp_path / name
+	path.write_bytes(data)
+	return path
+
+
+def is_open(fd):
+	try:
+		os.fstat(fd)
+		return True
+	except OSError:
+		return False
+
+
+class TestSourceFds:
+	def test_shared_and_reused(self, tmp_path):
+		path = make_file(tmp_path)
+		pool = SourceFds()
+		fd = pool.open(path)
+		assert pool.open(path) == fd
+		# another access mode needs another fd
+		fd_rw = pool.open(path, writable=True)
+		assert fd_rw != fd
+		pool.close(fd)
+		pool.close(fd)
+		assert is_open(fd) and fd in pool
+		# closed files are reopened without another open(2)
+		assert pool.open(path) == fd
+		assert (pool.opened, pool.reused) == (2, 2)
+		pool.close(fd)
+		pool.close(fd_rw)
+		pool.close_all()
+		assert not is_open(fd) and not is_open(fd_rw)
+
+	def test_idle_max(self, tmp_path):
+		pool = SourceFds(idle_max=2)
+		fds = [pool.open(make_file(tmp_path, str(i))) for i in range(3)]
+		for fd in fds:
+			pool.close(fd)
+		# the least recently closed one went first
+		assert not is_open(fds[0])
+		assert all(is_open(fd) and fd in pool for fd in fds[1:])
+		pool.close_all()
+
+	def test_invalidate(self, tmp_path):
+		path = make_file(tmp_path)
+		pool = SourceFds()
+		idle, busy = pool.open(path), pool.open(path, writable=True)
+		pool.close(idle)
+		pool.invalidate(path)
+		assert not is_open(idle)
+		# an open file keeps working, but isn't handed out anymore
+		assert is_open(busy) and busy not in pool
+		os.replace(make_file(tmp_path, 'g', b'new'), path)
+		fd = pool.open(path)
+		assert os.pread(fd, 10, 0) == b'new'
+		pool.close(busy)
+		assert not is_open(busy)
+		pool.close(fd)
+		pool.close_all()
+
+	def test_detach(self, tmp_path):
+		path = make_file(tmp_path)
+		pool = SourceFds()
+		fd = pool.open(path)
+		pool.detach(fd)
+		assert fd not in pool and pool.open(path) != fd
+		os.close(fd)
+
+	def test_truncate(self, tmp_path):
+		path = make_file(tmp_path)
+		pool = SourceFds()
+		fd = pool.open(path, writable=True, truncate=True)
+		assert os.path.getsize(path) == 0
+		pool.close(fd)
+		pool.close_all()
+
+	def test_pread_pwrite(self, tmp_path):
+		path = make_file(tmp_path)
+		pool = SourceFds()
+		fd = pool.open(path, writable=True)
+
+		async def main():
+			assert await pwrite(fd, b'abc', 8) == 3
+			assert await pread(fd, 4, 7) == b'7abc'
+
+		trio.run(main)
+		assert path.read_bytes() == b'01234567abc'
+		pool.close(fd)
+		pool.close_all()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# type: ignore
+import pytest
+from src.libwolfs.pathtree import PathTree
+
+ROOT_INO = 1
+
+
+class TestPathTree:
+	tree: PathTree
+
+	def setup_method(self) -> None:
+		self.tree = PathTree(ROOT_INO)
+
+	def test_root(self) -> None:
+		assert self.tree.get('/') == ROOT_INO
+		assert self.tree.parent_ino(ROOT_INO) == ROOT_INO
+		assert self.tree.root.rpath() == '/'
+
+	def test_insert_creates_in_between_nodes(self) -> None:
+		self.tree.insert('/a/b/c', 4)
+		assert self.tree.get('/a/b/c') == 4
+		# in between nodes exist but don't have an ino
+		assert self.tree.node('/a/b') is not None
+		assert self.tree.get('/a/b') is None
+		assert '/a/b' not in self.tree
+
+		self.tree.insert('/a/b', 3)
+		assert self.tree.parent_ino(4) == 3
+
+	def test_siblings_share_parent(self) -> None:
+		a = self.tree.insert('/dir/a', 3)
+		b = self.tree.insert('/dir/b', 4)
+		assert a.parent is b.parent
+		assert a.rpath() == '/dir/a' and b.rpath() == '/dir/b'
+
+	def test_remove_prunes_unmapped(self) -> None:
+		self.tree.insert('/a/b/c', 4)
+		assert self.tree.remove('/a/b/c') == 0
+		assert self.tree.node('/a') is None
+		assert not self.tree.has_ino(4)
+
+	def test_remove_keeps_mapped_parents(self) -> None:
+		self.tree.insert('/a', 2)
+		self.tree.insert('/a/b', 3)
+		self.tree.remove('/a/b')
+		assert self.tree.get('/a') == 2
+
+	def test_hardlinks(self) -> None:
+		self.tree.insert('/a', 2)
+		self.tree.insert('/b', 2)
+		assert {n.rpath() for n in self.tree.nodes(2)} == {'/a', '/b'}
+		assert self.tree.remove('/a') == 1
+		assert [n.rpath() for n in self.tree.nodes(2)] == ['/b']
+		assert self.tree.remove('/b') == 0
+		assert self.tree.nodes(2) == []
+
+	def test_move_subtree(self) -> None:
+		self.tree.insert('/src', 2)
+		self.tree.insert('/src/x/y', 3)
+		self.tree.insert('/dst', 4)
+		node = self.tree.move('/src', '/dst/new')
+		assert node.ino == 2
+		assert self.tree.get('/dst/new/x/y') == 3
+		assert self.tree.get('/src/x/y') is None
+		assert self.tree.ino_node(3).rpath() == '/dst/new/x/y'
+
+	def test_move_into_itself(self) -> None:
+		self.tree.insert('/a', 2)
+		with pytest.raises(AssertionError):
+			self.tree.move('/a', '/a/b')
+
+	def test_move_onto_mapped_path(self) -> None:
+		self.tree.insert('/a', 2)
+		self.tree.insert('/b', 3)
+		with pytest.raises(AssertionError):
+			self.tree.move('/a', '/b')
+
+	def test_walk(self) -> None:
+		self.tree.insert('/a/b', 3)
+		self.tree.insert('/c', 4)
+		assert {n.rpath() for n in self.tree.walk()} == {'/', '/a', '/a/b', '/c'}
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+from pathlib import Path
+
+from src.libwolfs.cache import BusyKeys
+from src.libwolfs.pins import Pins
+from test.test_disk import get_src_cache_directory_pair, prep_Disk
+
+
+def prep_tree(tmpdir_factory):
+	tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+	disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+	os.makedirs(os.path.join(tmpdir_source, 'a', 'b'))
+	paths = {name: Path(os.path.join(tmpdir_source, name)) for name in ('a', 'a/b', 'a/b/f', 'a/g', 'h')}
+	inos = {name: disk.path_to_ino(path) for name, path in paths.items()}
+	return disk, Pins(disk), inos
+
+
+class TestPins:
+	def test_subtree(self, tmpdir_factory):
+		disk, pins, inos = prep_tree(tmpdir_factory)
+		assert inos['a/b/f'] not in pins
+		pins.pin(inos['a/b'])
+		assert inos['a/b'] in pins and inos['a/b/f'] in pins
+		assert inos['a'] not in pins and inos['a/g'] not in pins and inos['h'] not in pins
+
+		# files created below a pinned directory later on are pinned too
+		ino = disk.path_to_ino(os.path.join(disk.sourceDir, 'a', 'b', 'new'))
+		assert ino in pins
+
+		pins.pin(inos['a'])
+		assert list(pins.pinned_by(inos['a/b/f'])) == [inos['a/b'], inos['a']]
+		assert not pins.unpin(inos['a/b/f'])
+		assert pins.unpin(inos['a/b'])
+		assert inos['a/b/f'] in pins and len(pins) == 1
+
+	def test_busy_keys(self, tmpdir_factory):
+		disk, pins, inos = prep_tree(tmpdir_factory)
+		pins.pin(inos['a'])
+		busy = BusyKeys(pinned=pins)
+		assert inos['a/g'] in busy and (inos['a/b/f'], 3) in busy
+		assert inos['h'] not in busy and (inos['h'], 0) not in busy
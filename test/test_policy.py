@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# type: ignore
+import random
+
+import pytest
+from src.libwolfs.policy import (ARC, GDSF, LFU, LRU, POLICIES, S3FIFO, Admission, TinyLFU, make_admission,
+								 make_policy, simulate)
+
+CAPACITY = 1000
+
+
+def fill(policy, keys, size=100):
+	for key in keys:
+		policy.on_insert(key, size)
+
+
+def evict(policy, skip=None):
+	victim = policy.victim(skip)
+	policy.on_remove(victim, evicted=True)
+	return victim
+
+
+@pytest.mark.parametrize('name', list(POLICIES))
+class TestEvictionPolicy:
+	def test_accounting(self, name) -> None:
+		policy = make_policy(name, CAPACITY)
+		fill(policy, range(1, 6))
+		assert len(policy) == 5 and policy.used == 500
+		assert 3 in policy
+
+		# re-inserting updates the size instead of adding it twice
+		policy.on_insert(3, 300)
+		assert policy.used == 700
+
+		policy.on_remove(3)
+		assert 3 not in policy and policy.used == 400
+		# unknown keys are ignored
+		policy.on_remove(42)
+		policy.on_access(42)
+		assert policy.used == 400
+
+	def test_victim_respects_skip(self, name) -> None:
+		policy = make_policy(name, CAPACITY)
+		fill(policy, range(1, 6))
+		for key in range(1, 6):
+			policy.on_access(key)
+		victim = policy.victim(skip={1, 2})
+		assert victim in {3, 4, 5}
+		assert policy.victim(skip=set(range(1, 6))) is None
+
+	def test_evict_everything(self, name) -> None:
+		policy = make_policy(name, CAPACITY)
+		keys = set(range(1, 11))
+		fill(policy, keys)
+		for key in random.sample(sorted(keys), 5):
+			policy.on_access(key)
+		evicted = {evict(policy) for _ in keys}
+		assert evicted == keys
+		assert len(policy) == 0 and policy.used == 0
+		assert policy.victim() is None
+
+	def test_admit(self, name) -> None:
+		policy = make_policy(name, CAPACITY)
+		assert policy.admit(1, CAPACITY)
+		assert not policy.admit(1, CAPACITY + 1)
+
+	def test_resize(self, name) -> None:
+		policy = make_policy(name, CAPACITY)
+		fill(policy, range(1, 4))
+		policy.on_resize(1, 300)
+		policy.on_resize(42, 300)
+		assert policy.used == 500 and policy.sizes[1] == 300
+		# no access
+		assert policy.recency()[0] == 1
+
+	def test_recency(self, name) -> None:
+		policy = make_policy(name, CAPACITY)
+		fill(policy, range(1, 5))
+		policy.on_access(2)
+		policy.on_remove(3)
+		assert policy.recency() == [1, 4, 2]
+
+
+class TestPolicies:
+	def test_unknown_policy(self) -> None:
+		with pytest.raises(ValueError):
+			make_policy('fifo?', CAPACITY)
+
+	def test_lru(self) -> None:
+		policy = LRU(CAPACITY)
+		fill(policy, [1, 2, 3])
+		policy.on_access(1)
+		assert [evict(policy) for _ in range(3)] == [2, 3, 1]
+
+	def test_lfu(self) -> None:
+		policy = LFU(CAPACITY)
+		fill(policy, [1, 2, 3])
+		for _ in range(3):
+			policy.on_access(1)
+		policy.on_access(3)
+		assert [evict(policy) for _ in range(3)] == [2, 3, 1]
+
+	def test_gdsf_prefers_evicting_large_files(self) -> None:
+		policy = GDSF(CAPACITY)
+		policy.on_insert('video', 800)
+		policy.on_insert('doc', 10)
+		policy.on_access('video')
+		assert policy.victim() == 'video'
+
+	def test_arc_ghost_hit_goes_to_frequency_list(self) -> None:
+		policy = ARC(CAPACITY)
+		fill(policy, [1, 2, 3])
+		assert evict(policy) == 1
+		# 1 comes back -> remembered in B1, enlarges the recency target and lands in T2
+		policy.on_insert(1, 100)
+		assert policy.p > 0
+		assert policy.victim() == 2
+
+	def test_s3fifo_filters_one_hit_wonders(self) -> None:
+		policy = S3FIFO(CAPACITY)
+		fill(policy, [1, 2, 3])
+		policy.on_access(1)
+		# 1 was accessed while probationary -> promoted to main, 2 is the first one hit wonder
+		assert evict(policy) == 2
+		assert evict(policy) == 3
+		assert evict(policy) == 1
+
+
+def test_simulate() -> None:
+	# a few hot small files and a stream of large ones which are used once
+	trace = []
+	for i in range(200):
+		trace.append((i % 5, 10))
+		trace.append((1000 + i, 400))
+
+	results = {name: simulate(make_policy(name, CAPACITY), trace) for name in POLICIES}
+	for name, result in results.items():
+		assert result.requests == len(trace)
+		assert 0.0 <= result.hit_ratio <= 1.0
+		assert 0.0 <= result.byte_hit_ratio <= 1.0
+
+	# recency alone thrashes, a size aware policy keeps the small hot set
+	assert results['lru'].hit_ratio == 0.0
+	assert results['gdsf'].hit_ratio > 0.45
+
+
+class TestAdmission:
+	def test_unknown_admission(self) -> None:
+		with pytest.raises(ValueError):
+			make_admission('nope', CAPACITY)
+
+	def test_always(self) -> None:
+		admission = Admission(CAPACITY)
+		assert admission.admit(1, 100, False, 2)
+		assert admission.admit(1, 100, False, None)
+		assert not admission.admit(1, CAPACITY + 1, True, None)
+		assert admission.admitted == 2 and admission.rejected == 1
+
+	def test_tinylfu_counts(self) -> None:
+		admission = TinyLFU(CAPACITY, width=1024)
+		# the doorkeeper takes the first request
+		admission.record('a')
+		assert admission.estimate('a') == 1
+		for _ in range(5):
+			admission.record('a')
+		assert admission.estimate('a') == 6
+		assert admission.estimate('b') == 0
+		for _ in range(100):
+			admission.record('a')
+		assert admission.estimate('a') == 1 + TinyLFU.MAX_COUNT
+
+	def test_tinylfu_ages(self) -> None:
+		admission = TinyLFU(CAPACITY, width=1024)
+		admission.sample_size = 20
+		for _ in range(9):
+			admission.record('hot')
+		for key in range(admission.sample_size - 9):
+			admission.record(('cold', key))
+		# halved and the doorkeeper forgot it
+		assert admission.estimate('hot') == 4
+
+	def test_tinylfu_admit(self) -> None:
+		admission = TinyLFU(CAPACITY, width=1024)
+		for _ in range(3):
+			admission.record('hot')
+		admission.record('scan')
+		assert admission.admit('scan', 100, True, None)
+		assert not admission.admit('scan', 100, False, 'hot')
+		assert admission.admit('hot', 100, False, 'scan')
+		assert not admission.admit('hot', 100, False, None)
+		assert admission.admitted == 2 and admission.rejected == 2
+
+
+def test_simulate_scan_resistance() -> None:
+	# a hot working set which fills the cache, interrupted by a scan over files used once
+	trace = []
+	for i in range(500):
+		trace.append((i % 10, 100))
+		trace.append((1000 + i, 100))
+	lru = simulate(make_policy('lru', CAPACITY), trace)
+	filtered = simulate(make_policy('lru', CAPACITY), trace, make_admission('tinylfu', CAPACITY))
+	assert filtered.policy == 'lru+tinylfu'
+	assert filtered.hit_ratio > lru.hit_ratio
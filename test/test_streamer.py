@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+import threading
+from pathlib import Path
+
+import trio
+import trio.testing
+from src.libwolfs.disk import Disk
+from src.libwolfs.streamer import Streamer
+from test.test_disk import get_src_cache_directory_pair, prep_Disk
+
+FILE_SIZE = 5 * Streamer.PIECE_SIZE + 123
+
+
+def prep_Streamer(tmpdir_factory):
+	tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+	disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=64)
+	src = Path(os.path.join(tmpdir_source, 'video.mkv'))
+	with open(src, 'wb') as f:
+		f.write(os.urandom(FILE_SIZE))
+	ino = disk.path_to_ino(src)
+	return disk, Streamer(disk), src, ino
+
+
+def hold_pieces(monkeypatch, pieces: int) -> threading.Event:
+	"""lets only the first `pieces` pieces through until the returned event is set"""
+	proceed = threading.Event()
+	copy_piece = Streamer.copy_piece
+	count = iter(range(1 << 30))
+
+	def held_copy_piece(*args):
+		if next(count) >= pieces:
+			proceed.wait()
+		return copy_piece(*args)
+	monkeypatch.setattr(Streamer, 'copy_piece', staticmethod(held_copy_piece))
+	return proceed
+
+
+class TestStreamer:
+	def test_prepare_stream(self, tmpdir_factory):
+		disk, _, src, ino = prep_Streamer(tmpdir_factory)
+		dst = disk.prepare_stream(src)
+		assert os.path.getsize(dst) == FILE_SIZE
+		assert Disk.is_partial(dst)
+		assert disk.in_cache[ino] == disk.allocated(FILE_SIZE)
+
+	def test_read_waits_only_for_its_range(self, tmpdir_factory, monkeypatch):
+		disk, streamer, src, ino = prep_Streamer(tmpdir_factory)
+		proceed = hold_pieces(monkeypatch, 1)
+
+		async def open_and_read():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(streamer.run)
+				dst = disk.prepare_stream(src)
+				stream = streamer.start(ino, src, dst)
+
+				# the head is there although the rest is still held back
+				await streamer.wait_range(ino, 0, 4096)
+				assert stream.watermark == Streamer.PIECE_SIZE
+				with open(src, 'rb') as f_src, open(dst, 'rb') as f_dst:
+					assert f_src.read(4096) == f_dst.read(4096)
+				assert streamer.is_streaming(ino) and Disk.is_partial(dst)
+
+				proceed.set()
+				await streamer.wait_range(ino, FILE_SIZE - 10, 10)
+				await streamer.settle(ino)
+				assert not streamer.is_streaming(ino) and not Disk.is_partial(dst)
+				with open(src, 'rb') as f_src, open(dst, 'rb') as f_dst:
+					assert f_src.read() == f_dst.read()
+				assert os.stat(src).st_mtime_ns == os.stat(dst).st_mtime_ns
+				nursery.cancel_scope.cancel()
+
+		trio.run(open_and_read)
+
+	def test_abort_drops_partial_file(self, tmpdir_factory, monkeypatch):
+		disk, streamer, src, ino = prep_Streamer(tmpdir_factory)
+		proceed = hold_pieces(monkeypatch, 2)
+
+		async def unlink_while_streaming():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(streamer.run)
+				dst = disk.prepare_stream(src)
+				streamer.start(ino, src, dst)
+				await streamer.wait_range(ino, 0, 2 * Streamer.PIECE_SIZE)
+
+				# the piece in flight finishes, nothing after it is copied
+				proceed.set()
+				await streamer.abort(ino)
+				assert not streamer.is_streaming(ino)
+				assert not dst.exists() and not Disk.is_partial(dst)
+				assert ino not in disk and disk._current_CacheSize == 0
+				nursery.cancel_scope.cancel()
+
+		trio.run(unlink_while_streaming)
+
+	def test_failed_copy_raises_in_reader(self, tmpdir_factory, monkeypatch):
+		disk, streamer, src, ino = prep_Streamer(tmpdir_factory)
+
+		def broken_copy_piece(*args):
+			raise OSError(5, 'Input/output error')
+		monkeypatch.setattr(Streamer, 'copy_piece', staticmethod(broken_copy_piece))
+
+		async def read_broken():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(streamer.run)
+				dst = disk.prepare_stream(src)
+				streamer.start(ino, src, dst)
+				try:
+					await streamer.wait_range(ino, 0, 1)
+					assert False, "should have raised"
+				except OSError as exc:
+					assert exc.errno == 5
+				assert not dst.exists() and ino not in disk
+				nursery.cancel_scope.cancel()
+
+		trio.run(read_broken)
+
+	def test_throttle_lifted_for_readers(self, tmpdir_factory):
+		disk, streamer, src, ino = prep_Streamer(tmpdir_factory)
+		throttled = []
+
+		async def slow_throttle(nbytes):
+			throttled.append(nbytes)
+			await trio.sleep_forever()
+
+		async def warmup_then_read():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(streamer.run)
+				dst = disk.prepare_stream(src, force=False)
+				stream = streamer.start(ino, src, dst, throttle=slow_throttle)
+				await trio.testing.wait_all_tasks_blocked()
+				assert stream.watermark == 0 and throttled == [Streamer.PIECE_SIZE]
+
+				# a reader shows up: the copy stops waiting for its throttle and runs at full speed
+				await streamer.wait_range(ino, 0, 1)
+				assert stream.wanted
+				await streamer.settle(ino)
+				assert throttled == [Streamer.PIECE_SIZE]
+				with open(src, 'rb') as f_src, open(dst, 'rb') as f_dst:
+					assert f_src.read() == f_dst.read()
+				nursery.cancel_scope.cancel()
+
+		trio.run(warmup_then_read)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+from pathlib import Path
+
+from src.libwolfs.disk import Disk
+from src.libwolfs.tier2 import SecondTier
+from test.test_disk import get_src_cache_directory_pair, prep_Disk
+from test.util import data_file
+
+
+def demoted_file(tier, rpath, data=b'x' * 100, origin=(100, 1)):
+	path = tier.admit(rpath, len(data), origin)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	Path(path).write_bytes(data)
+	return path
+
+
+class TestSecondTier:
+	def test_lookup(self, tmp_path):
+		tier = SecondTier(tmp_path, maxSizeMB=1)
+		path = demoted_file(tier, '/a/b')
+		assert path.startswith(str(tmp_path / SecondTier.DIR_NAME))
+		assert tier.lookup('/a/b', (100, 1)) == path
+		assert tier.lookup('/c', (100, 1)) is None
+		# the source changed since it was demoted
+		assert tier.lookup('/a/b', (100, 2)) is None
+		assert '/a/b' not in tier and not os.path.exists(path) and tier.used == 0
+
+	def test_budget(self, tmp_path):
+		tier = SecondTier(tmp_path, maxSizeMB=1)
+		data = b'x' * (400 * 1024)
+		first, second = demoted_file(tier, '/1', data), demoted_file(tier, '/2', data)
+		assert tier.admit('/big', 2 * 1024 * 1024, (0, 0)) is None
+		# the least recently demoted one makes room
+		demoted_file(tier, '/3', data)
+		assert not os.path.exists(first) and os.path.exists(second)
+		assert tier.used == 2 * len(data)
+
+	def test_take(self, tmp_path):
+		tier = SecondTier(tmp_path, maxSizeMB=1)
+		path = demoted_file(tier, '/a')
+		tier.take('/a')
+		assert tier.used == 0 and tier.promoted == 1
+		# moving it out is up to the caller
+		assert os.path.exists(path)
+
+	def test_emptied_on_mount(self, tmp_path):
+		path = demoted_file(SecondTier(tmp_path, maxSizeMB=1), '/a')
+		SecondTier(tmp_path, maxSizeMB=1)
+		assert not os.path.exists(path)
+
+
+class TestDemotion:
+	def test_demote_and_promote(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		disk.tier2 = SecondTier(tmpdir_factory.mktemp('tier2'), maxSizeMB=1)
+		files = [Path(os.path.join(tmpdir_source, f'file_{i}')) for i in range(4)]
+		for f in files:
+			data_file(f, 300)
+		for f in files:
+			disk.cp2Cache(f, force=True)
+
+		# file_0 was evicted from the cache, but not deleted
+		assert not disk.toTmp(files[0]).exists()
+		rpath = disk.toRoot(files[0])
+		stat = os.stat(files[0])
+		origin = (stat.st_size, stat.st_mtime_ns)
+		demoted = disk.tier2.lookup(rpath, origin)
+		assert demoted is not None and Path(demoted).read_bytes() == files[0].read_bytes()
+
+		ino = disk.lookup_ino(files[0])
+		disk.tier2.take(rpath)
+		dest = disk.prepare_promotion(ino, origin)
+		assert Disk.is_partial(dest) and ino in disk
+		Disk.promote(demoted, dest)
+		assert not Disk.is_partial(dest) and not os.path.exists(demoted)
+		assert dest.read_bytes() == files[0].read_bytes()
+		assert os.stat(dest).st_mtime_ns == stat.st_mtime_ns
+		# made room for it by demoting the next one
+		assert disk.tier2.lookup(disk.toRoot(files[1]), (stat.st_size, os.stat(files[1]).st_mtime_ns)) is not None
+
+	def test_evict_on_demand_drops_demoted_copy(self, tmpdir_factory):
+		tmpdir_source, tmpdir_cache = get_src_cache_directory_pair(tmpdir_factory)
+		disk = prep_Disk(tmpdir_source, tmpdir_cache, maxCacheSize=1)
+		disk.tier2 = SecondTier(tmpdir_factory.mktemp('tier2'), maxSizeMB=1)
+		src = Path(os.path.join(tmpdir_source, 'f'))
+		data_file(src, 10)
+		disk.cp2Cache(src)
+		ino = disk.lookup_ino(src)
+		Disk.release(*disk.detach(ino))
+		assert disk.toRoot(src) in disk.tier2
+		disk.evict(ino)
+		assert disk.toRoot(src) not in disk.tier2
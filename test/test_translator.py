@@ -78,6 +78,14 @@ class TestPathTranslator:
 		assert self.translator.toSrc(f_mnt) == self.translator.toSrc(f_tmp) == f_src
 		assert self.translator.toTmp(f_mnt) == self.translator.toTmp(f_src) == f_tmp
 
+	def test_toRoot_prefix_boundaries(self) -> None:
+		# a sibling directory sharing the name prefix isn't stripped
+		sibling = self.src.name + '_sibling/file'
+		assert self.translator.toRoot(sibling) == sibling
+		assert self.translator.toRoot(self.src.name + '/') == '/'
+		assert self.translator.toRoot('dir//file') == '/dir/file'
+		assert self.translator.toTmp_str(self.src.name) == self.translator.toTmp(self.src.name).__str__()
+
 
 class TestInodeTranslator:
 	src: TemporaryDirectory
@@ -102,19 +110,17 @@ class TestInodeTranslator:
 ################################################################################
 	def test_insertion_deletion_single_path(self) -> int:
 		ino = self.translator.path_to_ino(self.temp_f.name)
-		path_ino_map = self.translator._InodeTranslator__path_ino_map
-		ino_path_map = self.translator._InodeTranslator__ino_path_map
+		index = self.translator._InodeTranslator__index
 		rpath: str = self.translator.toRoot(self.temp_f.name)
-		assert ino_path_map[ino] == rpath
-		assert path_ino_map[rpath] == ino
+		assert [node.rpath() for node in index.nodes(ino)] == [rpath]
+		assert index.get(rpath) == ino
 
 		del self.translator[(ino, self.temp_f.name)]
 
-		# shouldn't hurt getting the dicts again explicitly
-		path_ino_map = self.translator._InodeTranslator__path_ino_map
-		ino_path_map = self.translator._InodeTranslator__ino_path_map
-		assert ino_path_map.get(ino) is None
-		assert path_ino_map.get(rpath) is None
+		assert not index.has_ino(ino)
+		assert index.get(rpath) is None
+		# in between nodes without an ino got pruned too
+		assert index.node(rpath) is None
 		return ino
 
 	def test_insertion_lookup_deletion_single_path(self) -> None:
@@ -143,9 +149,10 @@ class TestInodeTranslator:
 	def test_hardlink_insertion_two_paths(self) -> None:
 		# boilerplate setup: insert 1st path
 		trans = self.translator
+		index = trans._InodeTranslator__index
 		ino = trans.path_to_ino(self.temp_f.name)
-		assert isinstance(trans._InodeTranslator__ino_path_map[ino], str)
-		assert trans.ino_to_rpath(ino) == trans._InodeTranslator__ino_path_map[ino]
+		assert len(index.nodes(ino)) == 1
+		assert trans.ino_to_rpath(ino) == index.nodes(ino)[0].rpath()
 
 		# insert 2nd path via hardlink
 		tmp_f2 = NamedTemporaryFile(dir=self.src.name)
@@ -153,15 +160,16 @@ class TestInodeTranslator:
 		ino2 = trans.path_to_ino(tmp_f2.name)
 		assert trans.path_to_ino(self.temp_f.name) == ino
 		assert ino == ino2
-		assert isinstance(trans._InodeTranslator__ino_path_map[ino], set)
+		assert len(index.nodes(ino)) == 2
 
 		# check for consitency
 		rpath = trans.ino_to_rpath(ino)
-		assert ino == trans._InodeTranslator__path_ino_map[rpath]
+		assert ino == index.get(rpath)
 
 	def test_hardlink_deletion_two_paths(self) -> None:
 		# shortcuts
 		trans = self.translator
+		index = trans._InodeTranslator__index
 
 		# fill up data structure
 		self.test_hardlink_insertion_two_paths()
@@ -172,15 +180,15 @@ class TestInodeTranslator:
 		rpath_1, rpath_2 = tuple(rpath_set)
 		assert isinstance(rpath_set, set)
 		assert isinstance(rpath_1, str) and isinstance(rpath_2, str)
-		assert {rpath_1, rpath_2} == trans._InodeTranslator__ino_path_map[ino]
+		assert {rpath_1, rpath_2} == {node.rpath() for node in index.nodes(ino)}
 
 		# delete 1st path
 		del trans[(ino, rpath_1)]
 
 		# check rpath_1 is not anymore in internal mappings but rpath_2 is as is ino
-		assert rpath_2 in trans._InodeTranslator__path_ino_map
-		assert rpath_1 not in trans._InodeTranslator__path_ino_map
-		assert ino in trans._InodeTranslator__ino_path_map
+		assert rpath_2 in index
+		assert rpath_1 not in index
+		assert index.has_ino(ino)
 
 		# consistency check
 		rpath_set_without_rpath_1 = trans.ino_to_rpath(ino, need_set=True)
@@ -190,10 +198,27 @@ class TestInodeTranslator:
 
 		del trans[(ino, rpath_2)]
 		# check ino and rpath_2 are not anymore in internal mappings
-		assert rpath_2 not in trans._InodeTranslator__path_ino_map
-		assert ino not in trans._InodeTranslator__ino_path_map
+		assert rpath_2 not in index
+		assert not index.has_ino(ino)
 		assert ino in trans._InodeTranslator__freed_inos
 
+	def test_rename_subtree(self) -> None:
+		trans = self.translator
+		directory = trans.path_to_ino('/dir')
+		child = trans.path_to_ino('/dir/sub/file')
+		sub = trans.path_to_ino('/dir/sub')
+
+		assert trans.rename_path('/dir', '/moved') == directory
+
+		# descendants follow without being touched
+		assert trans.ino_to_rpath(child) == '/moved/sub/file'
+		assert trans.path_to_ino('/moved/sub') == sub
+		assert trans.lookup_ino('/dir/sub/file') is None
+		assert trans.ino_parent(child) == sub
+		assert trans.ino_parent(sub) == directory
+		assert trans.ino_parent(directory) == trans.ROOT_INODE
+		assert trans.ino_parent(trans.ROOT_INODE) == trans.ROOT_INODE
+
 	@pytest.mark.skip
 	def test_softlink_insertion(self):
 		pass
@@ -251,6 +276,22 @@ class TestInodeTranslator:
 		trans.add_hardlink(ino, tmp_f2.name)
 		assert trans.ino_toTmp(ino) in map(lambda x: trans.toTmp(x), trans.ino_to_rpath(ino, need_set=True))
 
+	def test_ino_toTmp_memo_invalidation(self):
+		trans = self.translator
+		ino = trans.path_to_ino('/dir/file')
+		ino_dir = trans.path_to_ino('/dir')
+		assert trans.ino_toTmp_str(ino) == trans.toTmp_str('/dir/file')
+
+		# renaming the parent directory invalidates memoized descendants
+		trans.rename_path('/dir', '/other')
+		assert trans.ino_toTmp_str(ino) == trans.toTmp_str('/other/file')
+		assert trans.ino_toTmp(ino_dir) == trans.toTmp('/other')
+
+		# deleted inos don't keep a stale translation when they are reused
+		del trans[(ino, '/other/file')]
+		assert trans.path_to_ino('/new', reuse_ino=ino) == ino
+		assert trans.ino_toTmp_str(ino) == trans.toTmp_str('/new')
+
 	@pytest.mark.skip
 	def test_ino_toTmp_softlinks(self):
 		pass
@@ -2,11 +2,14 @@
 # type: ignore
 
 from src.libwolfs.vfs import VFS, MountFSDirectoryInfo
+from src.libwolfs.fileInfo import DirEntries, FileInfo
+from src.libwolfs.translator import DiskBase
 from test.common import create_mount_info
 from random import randint
 from pyfuse3 import EntryAttributes
 from test.util import name_generator
 import pytest
+import os
 
 ###################################################
 class TestVFS:
@@ -41,7 +44,11 @@ class TestVFS:
 		entry.st_ino = self.rand_ino()
 		inode: int = entry.st_ino
 		self.vfs.add_path(inode, name_generator(), entry)
-		assert self.vfs.inode_path_map[inode].entry == entry
+		info = self.vfs.inode_path_map[inode]
+		assert info.st_ino == entry.st_ino
+		for attr in FileInfo.STAT_ATTRS:
+			assert getattr(info, attr) == getattr(entry, attr)
+		assert info.entry.st_ino == inode
 		assert self.vfs._lookup_cnt[inode] == 1
 
 	def test_add_path_confirm_lookup_increase(self):
@@ -52,6 +59,15 @@ class TestVFS:
 		self.vfs.add_path(inode, name_generator(), entry)
 		assert lkup + 1 == self.vfs._lookup_cnt[inode]
 
+	def test_add_Child_indexes_name(self):
+		entry = EntryAttributes()
+		entry.st_ino = self.rand_ino()
+		name = name_generator()
+		self.vfs.add_Child(DiskBase.ROOT_INODE, entry.st_ino, f'/{name}', entry)
+		root = self.vfs.inode_path_map[DiskBase.ROOT_INODE]
+		assert root.children.get(name) == entry.st_ino
+		assert entry.st_ino in root.children
+
 	@pytest.mark.skip
 	def test_addDirectory(self):
 		pass
@@ -59,3 +75,55 @@ class TestVFS:
 	@pytest.mark.skip
 	def test_addFilePath(self):
 		pass
+
+
+class TestDirEntries:
+	def test_add_get_pop(self):
+		entries = DirEntries([('a', 2), ('b', 3)])
+		assert entries.get('a') == 2 and entries.get('c') is None
+		assert 3 in entries and 4 not in entries
+		assert entries.name(3) == 'b'
+		assert entries.pop('a') == 2
+		assert 2 not in entries and len(entries) == 1
+
+	def test_add_is_idempotent(self):
+		entries = DirEntries()
+		entries.add('a', 2)
+		entries.add('a', 2)
+		assert len(entries) == 1
+		with pytest.raises(AssertionError):
+			entries.add('a', 3)
+
+	def test_insertion_order(self):
+		names = [name_generator() + str(i) for i in range(100)]
+		entries = DirEntries((name, i + 2) for i, name in enumerate(names))
+		assert [name for name, _ in entries.items()] == names
+		assert list(entries) == [i + 2 for i in range(100)]
+
+	def test_hardlinks_in_same_directory(self):
+		entries = DirEntries([('a', 2), ('b', 2)])
+		entries.pop('a')
+		assert 2 in entries and entries.name(2) == 'b'
+		entries.remove(2)
+		assert 2 not in entries and len(entries) == 0
+
+
+class TestFileInfo:
+	def test_from_path(self):
+		info = FileInfo.from_path(__file__, 5)
+		stat = os.lstat(__file__)
+		assert info.st_ino == 5
+		for attr in FileInfo.STAT_ATTRS:
+			assert getattr(info, attr) == getattr(stat, attr)
+
+	def test_entry_roundtrip(self):
+		info = FileInfo.from_path(__file__, 5)
+		entry = info.entry
+		assert entry.st_ino == 5 and entry.st_size == info.st_size
+		assert FileInfo(entry).st_mtime_ns == info.st_mtime_ns
+
+	def test_no_instance_dict(self):
+		info = FileInfo.from_path(__file__, 5)
+		assert not hasattr(info, '__dict__')
+		with pytest.raises(AttributeError):
+			info.cache = __file__
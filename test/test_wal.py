@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+from pathlib import Path
+
+import pytest
+import trio
+
+from src.libwolfs.fileInfo import FileInfo
+from src.libwolfs.journal import File_Ops, Journal
+from src.libwolfs.translator import MountFSDirectoryInfo
+from src.libwolfs.vfs import VFS
+from src.libwolfs.wal import WalRecord, WriteAheadLog
+from test.test_disk import get_src_cache_directory_pair, prep_Disk
+
+RECORDS = [
+	WalRecord(1, 5, '/cache/a', flags=os.O_CREAT),
+	WalRecord(2, 5, '/cache/a', offset=4096, length=128 * 1024),
+	WalRecord(8, 5, '/cache/a', path_new='/cache/ä'),
+]
+
+
+class TestWriteAheadLog:
+	def test_roundtrip(self, tmp_path):
+		wal = WriteAheadLog(tmp_path / 'journal', sync_interval=0)
+		for record in RECORDS:
+			wal.append(record)
+		assert wal.syncs == len(RECORDS) and wal.unsynced == 0
+		wal.close()
+		# a restart keeps what wasn't checkpointed and appends after it
+		wal = WriteAheadLog(tmp_path / 'journal', sync_interval=0)
+		wal.append(RECORDS[0])
+		assert list(wal.records()) == RECORDS + RECORDS[:1]
+
+	def test_torn_tail(self, tmp_path):
+		path = tmp_path / 'journal'
+		wal = WriteAheadLog(path, sync_interval=0)
+		for record in RECORDS:
+			wal.append(record)
+		wal.close()
+		intact = os.path.getsize(path)
+		with open(path, 'ab') as f:
+			f.write(b'\x40\x00\x00\x00garbage')
+		assert list(WriteAheadLog(path).records()) == RECORDS
+		assert os.path.getsize(path) == intact
+
+	def test_corrupted_record(self, tmp_path):
+		path = tmp_path / 'journal'
+		wal = WriteAheadLog(path, sync_interval=0)
+		for record in RECORDS:
+			wal.append(record)
+		wal.close()
+		data = bytearray(path.read_bytes())
+		data[-1] ^= 0xff
+		path.write_bytes(data)
+		# the crc of the last record doesn't match anymore
+		assert list(WriteAheadLog(path).records()) == RECORDS[:2]
+
+	def test_checkpoint(self, tmp_path):
+		wal = WriteAheadLog(tmp_path / 'journal', sync_interval=0)
+		wal.append(RECORDS[0])
+		wal.checkpoint()
+		wal.append(RECORDS[1])
+		assert list(wal.records()) == RECORDS[1:2]
+
+	def test_group_commit(self, tmp_path):
+		wal = WriteAheadLog(tmp_path / 'journal', sync_interval=0.01)
+
+		async def op(record):
+			wal.append(record)
+			await wal.commit()
+
+		async def main():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(wal.run)
+				async with trio.open_nursery() as ops:
+					for record in RECORDS * 10:
+						ops.start_soon(op, record)
+				assert wal.unsynced == 0
+				nursery.cancel_scope.cancel()
+
+		trio.run(main)
+		# the concurrent ops shared one fdatasync
+		assert wal.syncs == 1
+		assert sorted(wal.records()) == sorted(RECORDS * 10)
+
+	def test_other_file(self, tmp_path, caplog):
+		path = tmp_path / 'notes.log'
+		path.write_text('not a journal, but a lot longer than the header of one\n')
+		with pytest.raises(ValueError):
+			WriteAheadLog(path)
+		assert not Journal.isLogFile(path) and 'some other file' in caplog.text
+		assert path.read_text() == 'not a journal, but a lot longer than the header of one\n'
+		# a crash while the header was written
+		path.write_bytes(WriteAheadLog.MAGIC[:3])
+		wal = WriteAheadLog(path, sync_interval=0)
+		wal.append(RECORDS[0])
+		assert list(wal.records()) == RECORDS[:1]
+
+	def test_no_log_file(self, tmp_path, caplog):
+		assert not Journal.isLogFile(None) and not Journal.isLogFile('')
+		assert Journal.isLogFile(tmp_path / 'journal')
+		assert not caplog.records
+		# e.g. a directory given by mistake
+		assert not Journal.isLogFile(tmp_path)
+		assert 'not a regular file' in caplog.text
+
+
+def prep_Journal(source, cache, log_file):
+	return Journal(prep_Disk(source, cache), VFS(MountFSDirectoryInfo(source, cache, cache)), log_file)
+
+
+def crashed_log(tmpdir_factory, records, applied=0):
+	""":returns: journal log the way an unclean shutdown leaves it behind"""
+	log_file = tmpdir_factory.mktemp('log') / 'journal'
+	wal = WriteAheadLog(log_file, sync_interval=0)
+	for record in records:
+		wal.append(record)
+	if applied:
+		wal.mark_applied(applied)
+	wal.close()
+	return log_file
+
+
+class TestRecovery:
+	def test_replay(self, tmpdir_factory):
+		source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+		(source / 'old').write_bytes(b'old')
+		(cache / 'new').write_bytes(b'written to the cache')
+		records = [
+			WalRecord(File_Ops.MKDIR.value, 0, str(cache / 'dir'), mode=0o755),
+			WalRecord(File_Ops.CREATE.value, 0, str(cache / 'new'), flags=os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+			WalRecord(File_Ops.WRITE.value, 0, str(cache / 'new'), offset=0, length=20),
+			WalRecord(File_Ops.RENAME.value, 0, str(cache / 'old'), path_new=str(cache / 'dir/old')),
+		]
+		log_file = crashed_log(tmpdir_factory, records)
+
+		assert prep_Journal(source, cache, log_file).recover() == len(records)
+		assert (source / 'new').read_bytes() == b'written to the cache'
+		assert (source / 'dir/old').read_bytes() == b'old' and not (source / 'old').exists()
+		assert list(WriteAheadLog(log_file).records()) == []
+		assert prep_Journal(source, cache, log_file).recover() == 0
+
+	def test_replay_twice(self, tmpdir_factory):
+		"""a recovery interrupted by another crash runs again"""
+		source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+		(source / 'dir').mkdir()
+		(source / 'dir/new').write_bytes(b'')
+		(source / 'dir/moved').write_bytes(b'')
+		records = [
+			WalRecord(File_Ops.MKDIR.value, 0, str(cache / 'dir'), mode=0o755),
+			WalRecord(File_Ops.CREATE.value, 0, str(cache / 'dir/new'), flags=os.O_WRONLY | os.O_CREAT | os.O_EXCL),
+			WalRecord(File_Ops.RENAME.value, 0, str(cache / 'dir/old'), path_new=str(cache / 'dir/moved')),
+			WalRecord(File_Ops.UNLINK.value, 0, str(cache / 'dir/gone')),
+		]
+		log_file = crashed_log(tmpdir_factory, records)
+		assert prep_Journal(source, cache, log_file).recover() == len(records)
+		assert sorted(os.listdir(source / 'dir')) == ['moved', 'new']
+
+	def test_skips_applied(self, tmpdir_factory):
+		source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+		records = [
+			WalRecord(File_Ops.MKDIR.value, 0, str(cache / 'applied'), mode=0o755),
+			WalRecord(File_Ops.MKDIR.value, 0, str(cache / 'pending'), mode=0o755),
+		]
+		log_file = crashed_log(tmpdir_factory, records, applied=1)
+		assert WriteAheadLog(log_file).unapplied() == (1, records[1:])
+		assert prep_Journal(source, cache, log_file).recover() == 1
+		assert os.listdir(source) == ['pending']
+
+
+class TestMergedWrites:
+	def test_sequential_writes_are_one_range(self, tmpdir_factory):
+		source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+		write, writes = 4096, 1000
+		(source / 'f').write_bytes(b'')
+		(cache / 'f').write_bytes(os.urandom(write * writes))
+		log_file = tmpdir_factory.mktemp('log') / 'journal'
+		journal = prep_Journal(source, cache, log_file)
+		ino = journal.disk.path_to_ino(str(cache / 'f'))
+		journal.vfs.inode_path_map[ino] = FileInfo.getattr(path=source / 'f')
+		for offset in range(0, write * writes, write):
+			journal.log_write(ino, offset, write)
+		# rewrites of dirty bytes aren't logged again
+		journal.log_write(ino, 0, write)
+		journal.wal.sync()
+		assert journal.getDirtyPaths() == ([cache / 'f'], write * writes)
+		assert len(list(journal.wal.records())) == writes
+
+		journal.flushCompleteJournal()
+		assert (source / 'f').read_bytes() == (cache / 'f').read_bytes()
+		assert journal.isCompletelyClean() and list(journal.wal.records()) == []
+
+	def test_recovered_writes(self, tmpdir_factory):
+		source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+		(source / 'f').write_bytes(b'')
+		(cache / 'f').write_bytes(b'0123456789')
+		records = [WalRecord(File_Ops.WRITE.value, 0, str(cache / 'f'), offset=offset, length=2)
+				   for offset in (4, 0, 2, 8)]
+		log_file = crashed_log(tmpdir_factory, records)
+		assert prep_Journal(source, cache, log_file).recover() == len(records)
+		# only the written ranges are copied
+		assert (source / 'f').read_bytes() == b'012345\0\089'
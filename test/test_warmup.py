@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# type: ignore
+import trio
+import trio.testing
+from src.libwolfs.warmup import TokenBucket, WarmupProgress
+
+MEGABYTE = 1024 * 1024
+
+
+class TestWarmup:
+	def test_token_bucket_caps_rate(self):
+		clock = trio.testing.MockClock(autojump_threshold=0)
+		bucket = TokenBucket(rate=10 * MEGABYTE)
+
+		async def copy_100mb():
+			start = trio.current_time()
+			for _ in range(100):
+				await bucket.consume(MEGABYTE)
+			return trio.current_time() - start
+
+		# the first second worth of bytes is a burst, the rest is paced
+		elapsed = trio.run(copy_100mb, clock=clock)
+		assert 8.9 <= elapsed <= 9.1
+
+	def test_unlimited_bucket_never_waits(self):
+		clock = trio.testing.MockClock(autojump_threshold=0)
+		bucket = TokenBucket(rate=0)
+
+		async def copy():
+			for _ in range(100):
+				await bucket.consume(1024 * MEGABYTE)
+			return trio.current_time()
+
+		assert trio.run(copy, clock=clock) == 0
+
+	def test_progress(self):
+		progress = WarmupProgress(100 * MEGABYTE)
+		assert progress.eta is None
+		progress.add(25 * MEGABYTE)
+		progress.add(25 * MEGABYTE)
+		assert progress.files == 2 and progress.done_bytes == 50 * MEGABYTE
+		assert progress.eta is not None and progress.eta >= 0
+		assert '50.0%' in str(progress)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# type: ignore
+import os
+from pathlib import Path
+
+import pytest
+import trio
+from pyfuse3 import FUSEError
+
+from src.libwolfs.fileInfo import FileInfo
+from src.libwolfs.writeback import Writeback
+from test.test_disk import get_src_cache_directory_pair
+from test.test_wal import prep_Journal
+
+
+def dirty_journal(tmpdir_factory, data=b'new contents'):
+	""":returns: source dir, cache dir and a journal with a write to `f` the source doesn't have yet"""
+	source, cache = map(Path, get_src_cache_directory_pair(tmpdir_factory))
+	(source / 'f').write_bytes(b'')
+	(cache / 'f').write_bytes(data)
+	journal = prep_Journal(source, cache, tmpdir_factory.mktemp('log') / 'journal')
+	ino = journal.disk.path_to_ino(str(cache / 'f'))
+	journal.vfs.inode_path_map[ino] = FileInfo.getattr(path=source / 'f')
+	journal.log_write(ino, 0, len(data))
+	return source, cache, journal, ino
+
+
+def prep_Writeback(journal, available=True, foreground=0, **kwargs):
+	return Writeback(journal, lambda: available, lambda: foreground, **kwargs)
+
+
+class TestWriteback:
+	def test_due(self, tmpdir_factory):
+		_, _, journal, _ = dirty_journal(tmpdir_factory)
+		since = journal.dirty_since
+		writeback = prep_Writeback(journal, max_age=10, max_dirty_mb=1)
+		assert not writeback.due(now=since + 9) and writeback.due(now=since + 10)
+		writeback.request()
+		assert writeback.due(now=since)
+		assert journal.bytes_unwritten == len(b'new contents')
+		assert not prep_Writeback(prep_Journal(*map(Path, get_src_cache_directory_pair(tmpdir_factory)),
+											   tmpdir_factory.mktemp('log') / 'journal')).due()
+
+	def test_background(self, tmpdir_factory):
+		source, _, journal, ino = dirty_journal(tmpdir_factory)
+		writeback = prep_Writeback(journal, max_age=0)
+
+		async def main():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(writeback.run)
+				assert journal.isDirty(ino)
+				with trio.fail_after(5):
+					while writeback.flushes == 0:
+						await trio.sleep(0.01)
+				nursery.cancel_scope.cancel()
+
+		trio.run(main)
+		assert (source / 'f').read_bytes() == b'new contents'
+		assert journal.isCompletelyClean() and journal.dirty_since is None and journal.bytes_unwritten == 0
+		assert list(journal.wal.records()) == []
+
+	def test_source_unavailable(self, tmpdir_factory):
+		source, _, journal, _ = dirty_journal(tmpdir_factory)
+		writeback = prep_Writeback(journal, available=False, max_age=0)
+
+		async def main():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(writeback.run)
+				await trio.sleep(Writeback.POLL * 1.5)
+				nursery.cancel_scope.cancel()
+
+		trio.run(main)
+		assert writeback.flushes == 0 and not journal.isCompletelyClean()
+		assert (source / 'f').read_bytes() == b''
+
+	def test_unexpected_error_keeps_the_mount(self, tmpdir_factory):
+		source, _, journal, ino = dirty_journal(tmpdir_factory)
+		# deleted outside of wolfs
+		os.remove(source / 'f')
+		writeback = prep_Writeback(journal, max_age=0)
+
+		async def main():
+			async with trio.open_nursery() as nursery:
+				await nursery.start(writeback.run)
+				with trio.fail_after(5):
+					while writeback.failures == 0:
+						await trio.sleep(0.01)
+				nursery.cancel_scope.cancel()
+
+		trio.run(main)
+		assert writeback.flushes == 0 and journal.isDirty(ino) and journal.bytes_unwritten == len(b'new contents')
+
+	def test_failed_writeback_is_kept(self, tmpdir_factory):
+		source, cache, journal, ino = dirty_journal(tmpdir_factory)
+		# its parent is gone from the source
+		journal.log_mkdir(journal.disk.ROOT_INODE, ino, str(cache / 'missing/d'), 0o755)
+		writeback = prep_Writeback(journal)
+
+		with pytest.raises(FUSEError):
+			trio.run(writeback.flush)
+		assert journal.isDirty(ino) and journal.dirty_since is not None
+		os.mkdir(source / 'missing')
+		trio.run(writeback.flush)
+		assert (source / 'missing/d').is_dir() and (source / 'f').read_bytes() == b'new contents'
+		assert journal.isCompletelyClean()
+
+	def test_moved_while_written_back(self, tmpdir_factory):
+		source, cache, journal, ino = dirty_journal(tmpdir_factory)
+		flush = journal.beginFlush()
+		# renamed before the worker thread got to it
+		os.rename(cache / 'f', cache / 'g')
+		assert journal.replay(flush)
+		journal.endFlush(flush)
+		assert journal.isDirty(ino) and journal.bytes_unwritten == len(b'new contents')
+		journal.log_rename(ino, str(cache / 'f'), str(cache / 'g'))
+		journal.flushCompleteJournal()
+		assert (source / 'g').read_bytes() == b'new contents' and not (source / 'f').exists()
+
+	def test_compacted_in_replay(self, tmpdir_factory):
+		source, cache, journal, ino = dirty_journal(tmpdir_factory)
+		journal.log_rename(ino, str(cache / 'f'), str(cache / 'g'))
+		journal.log_rename(ino, str(cache / 'g'), str(cache / 'f'))
+		flush = journal.beginFlush()
+		# on the trio loop: nothing but taking the history out of the journal
+		assert not flush.compacted and len(flush.history) == 3
+		assert journal.replay(flush)
+		assert flush.compacted and len(flush.history) == 1
+		journal.endFlush(flush)
+		assert (source / 'f').read_bytes() == b'new contents'
+
+	def test_origins_noted_on_the_loop(self, tmpdir_factory):
+		source, _, journal, ino = dirty_journal(tmpdir_factory)
+		flush = journal.beginFlush()
+		assert journal.replay(flush)
+		# the worker thread leaves `Disk` alone
+		assert ino not in journal.disk._origin and len(flush.origins) == 1
+		journal.endFlush(flush)
+		stat = os.stat(source / 'f')
+		assert journal.disk._origin[ino] == (stat.st_size, stat.st_mtime_ns)
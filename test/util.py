@@ -36,6 +36,11 @@ def pseudo_file(test_file: str | Path, wanted_filesize: int = None) -> None:
 		f.write(b"\0")
 	assert os.stat(test_file).st_size == 1024 * wanted_filesize
 
+def data_file(test_file: str | Path, wanted_filesize: int) -> None:
+	# like pseudo_file but without holes, so it actually takes up `wanted_filesize` KB on disk
+	with open(test_file, "wb") as f:
+		f.write(os.urandom(wanted_filesize * 1024))
+
 def rmtree(f: Path | str) -> None:
 	if isinstance(f, str):
 		f = Path(f)
@@ -12,6 +12,10 @@ from src.remote import RemoteNode
 from src.fsops.vfsops import VFSOps
 from src.libwolfs.util import Col
 from src.libwolfs.translator import MountFSDirectoryInfo
+from src.libwolfs.policy import ADMISSIONS, DEFAULT_ADMISSION, DEFAULT_POLICY, POLICIES
+from src.libwolfs.fetcher import FetchEngine
+from src.libwolfs.wal import WriteAheadLog
+from src.libwolfs.writeback import Writeback
 
 DEBUG = False
 DEBUG_FUSE = False
@@ -88,12 +92,47 @@ def parse_args(args):
                         help='sqlite3-directory storage')
     parser.add_argument('--log', type=str, default='fileJournal.log',
                         help='Journal-file to write logs to')
+    parser.add_argument('--journal-sync-interval', type=float, default=WriteAheadLog.DEFAULT_SYNC_INTERVAL,
+                        help='Seconds journal entries of concurrent writes are collected for one fdatasync of the '
+                             'journal file (0: sync every entry on its own)')
+    parser.add_argument('--writeback-age', type=float, default=Writeback.MAX_AGE,
+                        help='Seconds changes may wait in the cache before they are written back to the source')
+    parser.add_argument('--writeback-dirty', type=int, default=Writeback.MAX_DIRTY_MB,
+                        help='Megabytes of unwritten changes which start a writeback regardless of their age')
     parser.add_argument('--debug', action='store_true', default=DEBUG,
                         help='Enable debugging output')
     parser.add_argument('--debug-fuse', action='store_true', default=DEBUG_FUSE,
                         help='Enable FUSE debugging output')
     parser.add_argument('--size', type=int, default=VFSOps._DEFAULT_CACHE_SIZE,
                         help='Size of the Cache in Megabytes')
+    parser.add_argument('--policy', type=str, default=DEFAULT_POLICY, choices=list(POLICIES),
+                        help='Eviction policy of the Cache')
+    parser.add_argument('--admission', type=str, default=DEFAULT_ADMISSION, choices=list(ADMISSIONS),
+                        help='Which files read into a full cache may displace cached ones '
+                             '(the others are read from the source directly)')
+    parser.add_argument('--max-file-size', type=int, default=0,
+                        help='Files bigger than this many Megabytes are read and written on the source directly '
+                             '(0: only the ones which do not fit into the cache)')
+    parser.add_argument('--memory-size', type=int, default=VFSOps._DEFAULT_MEMORY_SIZE,
+                        help='Megabytes of RAM for hot small files and blocks above the cache (0: disabled)')
+    parser.add_argument('--tier2', type=str, default='',
+                        help='Second cache directory (e.g. on a big HDD) evicted files are moved to instead of '
+                             'being deleted')
+    parser.add_argument('--tier2-size', type=int, default=0,
+                        help='Size of the second cache directory in Megabytes (0: the free space of its filesystem)')
+    parser.add_argument('--ttl', type=float, default=float('inf'),
+                        help='Seconds a cached file is trusted before opening it compares it with the source again '
+                             '(default: inf, never; per directory: setfattr -n user.wolfs.ttl -v SECONDS DIR)')
+    parser.add_argument('--high-watermark', type=float, default=VFSOps._DEFAULT_HIGH_WATERMARK,
+                        help='Cache usage [0-1] at which background eviction starts')
+    parser.add_argument('--low-watermark', type=float, default=VFSOps._DEFAULT_LOW_WATERMARK,
+                        help='Cache usage [0-1] at which background eviction stops')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='Cache files in chunks of this many Kilobytes as they are read (0: whole files on open)')
+    parser.add_argument('--fetch-workers', type=int, default=FetchEngine.DEFAULT_WORKERS,
+                        help='Number of files/chunks fetched from the source at the same time')
+    parser.add_argument('--warmup-rate', type=float, default=0,
+                        help='Bandwidth cap of the cache warmup after mounting in MB/s (0: unlimited)')
     return parser.parse_args(args)
 
 def mountfs(operations, options):
@@ -107,7 +146,7 @@ def mountfs(operations, options):
     unmounted = False
     try:
         # log.debug('Entering main loop..')
-        trio.run(pyfuse3.main)
+        trio.run(operations.main)
     except KeyboardInterrupt:
         # log.debug('Unmounting due to Ctrl+C')
         operations.save_internal_state()
@@ -119,6 +158,7 @@ def mountfs(operations, options):
     if unmounted:
         return
 
+    operations.saveCacheManifest()
     pyfuse3.close()
 
 def main():
@@ -128,7 +168,14 @@ def main():
     remote = RemoteNode(src, mount, 'ext4', None, None, None)
     mount_info = MountFSDirectoryInfo(src, cache, mount)
     operations = Operations(remote, mount_info, metadb=options.metadb, logFile=options.log,
-                            maxCacheSizeMB=options.size)
+                            maxCacheSizeMB=options.size, policy=options.policy,
+                            highWatermark=options.high_watermark, lowWatermark=options.low_watermark,
+                            chunkSizeKB=options.chunk_size, fetchWorkers=options.fetch_workers,
+                            warmupRateMB=options.warmup_rate, admission=options.admission,
+                            maxFileSizeMB=options.max_file_size, memorySizeMB=options.memory_size,
+                            tier2Dir=options.tier2, tier2SizeMB=options.tier2_size, ttl=options.ttl,
+                            journalSyncInterval=options.journal_sync_interval,
+                            writebackAge=options.writeback_age, writebackDirtyMB=options.writeback_dirty)
     mountfs(operations, options)
 
 